@@ -0,0 +1,43 @@
+""" Microbenchmarks for the attribute name / predicate URI translation done by
+`surf.util.attr2rdf` and `surf.util.rdf2attr`.
+
+Run with ``python benchmark_names.py [repeat]``, the cold column disables the
+name caches and the warm column uses them.
+"""
+import sys
+from timeit import Timer
+
+import surf
+from surf import util
+
+NUMBER = 100000
+REPEAT = len(sys.argv) > 1 and int(sys.argv[1]) or 3
+
+SETUP = """
+from __main__ import surf, util
+name = surf.ns.FOAF['name']
+knows = surf.ns.FOAF['knows']
+"""
+
+BENCHMARKS = [
+    ("attr2rdf direct", "util.attr2rdf('foaf_name')"),
+    ("attr2rdf inverse", "util.attr2rdf('is_foaf_knows_of')"),
+    ("rdf2attr direct", "util.rdf2attr(name, True)"),
+    ("rdf2attr inverse", "util.rdf2attr(knows, False)"),
+]
+
+def bench(statement, size):
+    """ Return the best time of `statement` in microseconds, with name caches
+    holding at most `size` entries. """
+
+    util.attr2rdf_cache = util.NameCache(size)
+    util.rdf2attr_cache = util.NameCache(size)
+    timer = Timer(statement, SETUP)
+    return min(timer.repeat(REPEAT, NUMBER)) / NUMBER * 1e6
+
+if __name__ == "__main__":
+    print '%-20s %12s %12s' % ('', 'cold (us)', 'warm (us)')
+    for name, statement in BENCHMARKS:
+        cold = bench(statement, 0)
+        warm = bench(statement, util.DEFAULT_NAME_CACHE_SIZE)
+        print '%-20s %12.3f %12.3f' % (name, cold, warm)
@@ -35,16 +35,65 @@
 # -*- coding: utf-8 -*-
 __author__ = 'Cosmin Basca'
 
+import re
+
 from surf.plugin.query_reader import RDFQueryReader
-from allegro_franz.util import toRdfLib
-from surf.rdf import URIRef
+from allegro_franz.util import toJson, toRdfLib
 
 from franz.openrdf.sail.allegrographserver import AllegroGraphServer
 from franz.openrdf.repository.repository import Repository
 from franz.openrdf.query.query import QueryLanguage
 from franz.openrdf.query.queryresult import TupleQueryResult
-from franz.openrdf.model import value as sv
-from franz.openrdf.model import literal as sl
+
+_SELECT = re.compile(r"\bSELECT\b", re.IGNORECASE)
+_ORDER_BY = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+_LIMIT_OFFSET = re.compile(r"\b(LIMIT|OFFSET)\b", re.IGNORECASE)
+
+def _pageable(q_string):
+    """ True if `q_string` is an ordered SELECT query without LIMIT or
+    OFFSET.
+
+    Without ORDER BY the store may return the rows in a different order
+    for each page, rows could be skipped or repeated.
+
+    """
+
+    return bool(_SELECT.search(q_string)) and \
+        bool(_ORDER_BY.search(q_string)) and \
+        not _LIMIT_OFFSET.search(q_string)
+
+class PagedResult(object):
+    """ Binding sets of a SELECT query fetched `page_size` rows at a time
+    with LIMIT and OFFSET, only one page is held in memory.
+
+    `evaluate` runs a query string and returns a `TupleQueryResult`.
+
+    """
+
+    def __init__(self, evaluate, q_string, page_size):
+        self.__evaluate = evaluate
+        self.__q_string = q_string
+        self.__page_size = page_size
+        self.__first_page = self.__page(0)
+
+    def __page(self, offset):
+        return self.__evaluate("%s LIMIT %d OFFSET %d" %
+                               (self.__q_string, self.__page_size, offset))
+
+    def getBindingNames(self):
+        return self.__first_page.getBindingNames()
+
+    def __iter__(self):
+        page, offset = self.__first_page, 0
+        while True:
+            count = 0
+            for binding_set in page:
+                count += 1
+                yield binding_set
+            if count < self.__page_size:
+                break
+            offset += self.__page_size
+            page = self.__page(offset)
 
 class ReaderPlugin(RDFQueryReader):
     def __init__(self, *args, **kwargs):
@@ -64,6 +113,7 @@ class ReaderPlugin(RDFQueryReader):
         self.__allegro_repository.initialize()
 
         self.__con = self.allegro_repository.getConnection()
+        self.__page_size = int(kwargs.get("page_size") or 0)
 
     results_format = property(lambda self: 'json')
     server = property(lambda self: self.__server)
@@ -74,18 +124,24 @@ class ReaderPlugin(RDFQueryReader):
     allegro_server = property(lambda self: self.__allegro_server)
     allegro_catalog = property(lambda self: self.__allegro_catalog)
     allegro_repository = property(lambda self: self.__allegro_repository)
+    page_size = property(lambda self: self.__page_size)
 
     def _to_table(self, result):
-        table = []
+        # Rows are converted as they are read, callers iterate them once.
         bindings = result.getBindingNames()
         for bindingSet in result:
             row = {}
             for key in bindings:
-                try:    v = toRdfLib(bindingSet[key])
-                except: v = None
-                row[key] = v
-            table.append(row)
-        return table
+                row[key] = toRdfLib(bindingSet.getValue(key))
+            yield row
+
+    def _to_columns(self, result):
+        bindings = result.getBindingNames()
+        columns = [[] for key in bindings]
+        for bindingSet in result:
+            for key, column in zip(bindings, columns):
+                column.append(toRdfLib(bindingSet.getValue(key)))
+        return bindings, columns
 
     def _ask(self, result):
         '''
@@ -104,58 +160,74 @@ class ReaderPlugin(RDFQueryReader):
         boolQuery = self.__con.prepareBooleanQuery(QueryLanguage.SPARQL, q_string)
         return boolQuery.evaluate()
 
-    def __execute_select(self, q_string):
+    def __evaluate_select(self, q_string):
         self.log.debug(q_string)
         tupleQuery = self.__con.prepareTupleQuery(QueryLanguage.SPARQL, q_string)
         tupleQuery.setIncludeInferred(self.inference)
         return tupleQuery.evaluate()
 
+    def __execute_select(self, q_string):
+        if self.__page_size and _pageable(q_string):
+            return PagedResult(self.__evaluate_select, q_string,
+                               self.__page_size)
+        return self.__evaluate_select(q_string)
+
     def execute_sparql(self, q_string, format = 'JSON'):
-        self.log.debug(q_string)
-        tupleQuery = self.__con.prepareQuery(QueryLanguage.SPARQL, q_string)
-        tupleQuery.setIncludeInferred(self.inference)
-        # Do some magic as Franz's API doesn't provide a unified API for
-        # ask & select
-        result = tupleQuery.evaluate_generic_query()
-        if format == 'JSON':
-            if type(result) is dict:
-                response = TupleQueryResult(result['names'], result['values'])
-                return self._results_to_json(response)
-            else:
+        """ Execute `q_string`, return a SPARQL-JSON shaped dictionary if
+        `format` is ``JSON``, an iterator of dictionaries mapping variable
+        names to rdflib terms (a boolean for ASK) if it is ``rows`` and the
+        Franz API result otherwise.
+
+        With the `page_size` parameter SELECT queries with ORDER BY but
+        without LIMIT or OFFSET are fetched in pages.
+
+        """
+
+        if format in ('JSON', 'rows') and self.__page_size and \
+                _pageable(q_string):
+            response = self.__execute_select(q_string)
+        else:
+            self.log.debug(q_string)
+            tupleQuery = self.__con.prepareQuery(QueryLanguage.SPARQL, q_string)
+            tupleQuery.setIncludeInferred(self.inference)
+            # Do some magic as Franz's API doesn't provide a unified API for
+            # ask & select
+            result = tupleQuery.evaluate_generic_query()
+            if format not in ('JSON', 'rows'):
+                return result
+            elif type(result) is not dict:
+                if format == 'rows':
+                    return result
                 # Build our own JSON response
                 return {'head': {}, 'boolean': result}
-        else:
-            return result
+            response = TupleQueryResult(result['names'], result['values'])
+
+        if format == 'rows':
+            return self.__rows(response)
+        return self._results_to_json(response)
+
+    def __rows(self, results):
+        bindings = results.getBindingNames()
+        for bindingSet in results:
+            row = {}
+            for key in bindings:
+                value = bindingSet.getValue(key)
+                if value is not None:
+                    row[key] = toRdfLib(value)
+            yield row
 
     def close(self):
         self.__con.close()
 
     def _results_to_json(self, results):
         bindings = results.getBindingNames()
-        r_dict = {}
-        r_dict['head'] = {'vars': bindings}
-        r_dict['results'] = {'bindings':[]}
+        json_bindings = []
         for bindingSet in results:
             json_binding = {}
             for b in bindings:
-                value = bindingSet.getValue(b)
-                if type(value) is sv.URI:
-                    json_binding[b] = {'type':'uri', 'value': value.getURI()}
-                elif type(value) is sv.BNode:
-                    json_binding[b] = {'type':'bnode', 'value': value.getID()}
-                elif type(value) is sl.Literal:
-                    dtype = value.getDatatype() if value.getDatatype() else None
-                    lang = value.getLanguage() if value.getLanguage() else None
-                    lit_type = 'typed-literal' if dtype else 'literal'
-                    json_binding[b] = {'type':lit_type, 'value': value.getLabel()}
-                    if dtype:
-                        if type(dtype) is sv.URI:
-                            json_binding[b]['datatype'] = dtype.getURI()
-                        elif type(dtype) in [str, unicode] and dtype.startswith('<') and dtype.endswith('>'):
-                            json_binding[b]['datatype'] = URIRef(dtype.strip('<>'))
-                        else:
-                            json_binding[b]['datatype'] = URIRef(dtype)
-                    if lang:
-                        json_binding[b]['xml:lang'] = lang
-            r_dict['results']['bindings'].append(json_binding)
-        return r_dict
+                value = toJson(bindingSet.getValue(b))
+                if value is not None:
+                    json_binding[b] = value
+            json_bindings.append(json_binding)
+        return {'head': {'vars': bindings},
+                'results': {'bindings': json_bindings}}
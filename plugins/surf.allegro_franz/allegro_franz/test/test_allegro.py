@@ -1,5 +1,8 @@
 """ Module for allegro_franz plugin tests. """
 
+import re
+import sys
+import types
 from unittest import TestCase
 
 from rdflib import URIRef
@@ -35,3 +38,167 @@ class AllegroFranzTestMixin(object):
 
 class StandardPluginTest(TestCase, AllegroFranzTestMixin, PluginTestMixin):
     pass
+
+# Names the plugin imports from the franz client library.
+_FRANZ_NAMES = {
+    "franz.openrdf.sail.allegrographserver": ["AllegroGraphServer"],
+    "franz.openrdf.repository.repository": ["Repository"],
+    "franz.openrdf.query.query": ["QueryLanguage"],
+    "franz.openrdf.query.queryresult": ["TupleQueryResult"],
+    "franz.openrdf.rio.rdfformat": ["RDFFormat"],
+    "franz.openrdf.model.value": ["URI", "BNode"],
+    "franz.openrdf.model.literal": ["Literal"],
+}
+
+class _Page(object):
+    """ Stands for a TupleQueryResult holding `rows`. """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def getBindingNames(self):
+        return ["s"]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+class _MockedFranzTestCase(TestCase):
+    """ Installs stand-ins for the franz modules if it's not installed. """
+
+    def setUp(self):
+        self.modules = dict(sys.modules)
+        try:
+            import franz
+        except ImportError:
+            for name, attributes in _FRANZ_NAMES.items():
+                parts = name.split(".")
+                for i in range(1, len(parts) + 1):
+                    sys.modules.setdefault(".".join(parts[:i]),
+                                           types.ModuleType(".".join(parts[:i])))
+                for attribute in attributes:
+                    setattr(sys.modules[name], attribute, object)
+
+    def tearDown(self):
+        sys.modules.clear()
+        sys.modules.update(self.modules)
+
+class TestPagedResult(_MockedFranzTestCase):
+    """ Tests for PagedResult. """
+
+    def test_pageable(self):
+        """ Test that only ordered SELECT queries without LIMIT are paged. """
+
+        from allegro_franz.reader import _pageable
+
+        self.assertFalse(_pageable("SELECT ?s WHERE { ?s ?p ?o }"))
+        self.assertTrue(_pageable("SELECT ?s WHERE { ?s ?p ?o } ORDER BY ?s"))
+        self.assertTrue(_pageable("select ?s where { ?s ?p ?o } order  by ?s"))
+        self.assertFalse(_pageable("SELECT ?s WHERE { ?s ?p ?o } "
+                                   "ORDER BY ?s LIMIT 10"))
+        self.assertFalse(_pageable("ASK { ?s ?p ?o }"))
+
+    def test_paged_result(self):
+        """ Test that PagedResult reads all rows page by page. """
+
+        from allegro_franz.reader import PagedResult
+
+        rows = range(5)
+        queries = []
+        def evaluate(q_string):
+            queries.append(q_string)
+            limit, offset = map(int, re.findall(r"\d+", q_string))
+            return _Page(rows[offset:offset + limit])
+
+        result = PagedResult(evaluate, "SELECT ?s ORDER BY ?s", 2)
+        self.assertEquals(result.getBindingNames(), ["s"])
+        self.assertEquals(list(result), rows)
+        self.assertEquals(queries, ["SELECT ?s ORDER BY ?s LIMIT 2 OFFSET 0",
+                                    "SELECT ?s ORDER BY ?s LIMIT 2 OFFSET 2",
+                                    "SELECT ?s ORDER BY ?s LIMIT 2 OFFSET 4"])
+
+        rows = range(4)
+        del queries[:]
+        self.assertEquals(list(PagedResult(evaluate, "SELECT ?s ORDER BY ?s",
+                                           2)), rows)
+        self.assertEquals(len(queries), 3)
+
+class _Connection(object):
+    """ Stands for a franz RepositoryConnection whose session can expire. """
+
+    def __init__(self):
+        self.calls = []
+        self.expired = False
+        self.broken = False
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, kwargs))
+            if name == "openSession":
+                self.expired = False
+            elif name in ("removeTriples", "closeSession") and self.expired:
+                raise Exception("No session")
+            elif name == "removeTriples" and self.broken:
+                raise Exception("Broken")
+        return call
+
+class _Server(object):
+    """ Stands for AllegroGraphServer, hands out one _Connection. """
+
+    connection = None
+    ACCESS = None
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def openCatalog(self, *args):
+        return self
+
+    def getRepository(self, *args):
+        return self
+
+    def getConnection(self):
+        return self.connection
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+class TestWriterSession(_MockedFranzTestCase):
+    """ Tests for the writer's session handling. """
+
+    def test_expired_session(self):
+        """ Test that writes are retried once in a new session. """
+
+        from allegro_franz import writer
+        from surf.plugin.reader import RDFReader
+
+        connection = _Server.connection = _Connection()
+        franz = writer.AllegroGraphServer, writer.Repository
+        writer.AllegroGraphServer = writer.Repository = _Server
+        try:
+            plugin = writer.WriterPlugin(RDFReader(), catalog = "c",
+                                         repository = "r",
+                                         session_lifetime = 60)
+        finally:
+            writer.AllegroGraphServer, writer.Repository = franz
+
+        plugin.remove_triple()
+        self.assertEquals([name for name, _ in connection.calls],
+                          ["openSession", "removeTriples", "commit"])
+        self.assertEquals(connection.calls[0][1],
+                          {"autocommit" : False, "lifetime" : 60})
+
+        del connection.calls[:]
+        connection.expired = True
+        plugin.remove_triple()
+        self.assertEquals([name for name, _ in connection.calls],
+                          ["removeTriples", "rollback", "closeSession",
+                           "openSession", "removeTriples", "commit"])
+
+        # A failure in a new session is not retried.
+        plugin.close()
+        del connection.calls[:]
+        connection.broken = True
+        self.assertRaises(Exception, plugin.remove_triple)
+        self.assertEquals([name for name, _ in connection.calls],
+                          ["openSession", "removeTriples", "rollback"])
+
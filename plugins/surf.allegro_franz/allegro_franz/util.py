@@ -40,37 +40,79 @@ from franz.openrdf.model.value import BNode as fBNode
 from franz.openrdf.model.literal import Literal as fLiteral
 
 from surf.rdf import BNode, Literal, URIRef, Namespace
+from surf.util import term_cache
 
 '''
 helper functions that convert between rdflib concepts and sesame2 api concepts
 '''
 
 # TERMS
+def _uri_to_rdflib(term):
+    return term_cache.uri(term.getURI())
+
+def _bnode_to_rdflib(term):
+    return term_cache.bnode(term.getID())
+
+def _literal_to_rdflib(term):
+    datatype = term.getDatatype()
+    if datatype is None:
+        return term_cache.literal(term.getLabel(), lang=term.getLanguage())
+
+    dtype = datatype.getURI()
+    if dtype.startswith('<') and dtype.endswith('>'):
+        dtype = dtype.strip('<>')
+
+    return term_cache.literal(term.getLabel(), lang=term.getLanguage(),
+                              datatype=dtype)
+
+def _list_to_rdflib(term):
+    return map(toRdfLib, term)
+
+# Converters by type, looked up once per term instead of trying types in
+# turn.
+_TO_RDFLIB = {fURIRef : _uri_to_rdflib,
+              fBNode : _bnode_to_rdflib,
+              fLiteral : _literal_to_rdflib,
+              list : _list_to_rdflib,
+              tuple : _list_to_rdflib}
+
 def toRdfLib(term):
-    if type(term) is fURIRef:
-        return URIRef(term.getURI())
-    elif type(term) is fLiteral:
-        try:
-            if term.getDatatype() is None:
-                return Literal(term.getLabel(), lang=term.getLanguage())
-            else:
-                dtype = term.getDatatype().getURI()
-                if dtype.startswith('<') and dtype.endswith('>'):
-                    dtype = dtype.strip('<>')
-                    dtype = URIRef(dtype)
-                else:
-                    dtype = URIRef(dtype)
-
-                return Literal(term.getLabel(), lang=term.getLanguage(),
-                                datatype=dtype)
-
-        except Exception, e:
-            print e
-    elif type(term) is fBNode:
-        return BNode(term.getID())
-    elif type(term) in [list,tuple]:
-        return map(toRdfLib, term)
-    return term
+    convert = _TO_RDFLIB.get(type(term))
+    if convert is None:
+        return term
+    return convert(term)
+
+def _uri_to_json(term):
+    return {'type': 'uri', 'value': term.getURI()}
+
+def _bnode_to_json(term):
+    return {'type': 'bnode', 'value': term.getID()}
+
+def _literal_to_json(term):
+    json_term = {'type': 'literal', 'value': term.getLabel()}
+    datatype = term.getDatatype()
+    if datatype:
+        json_term['type'] = 'typed-literal'
+        if type(datatype) is fURIRef:
+            datatype = datatype.getURI()
+        json_term['datatype'] = URIRef(datatype.strip('<>'))
+    language = term.getLanguage()
+    if language:
+        json_term['xml:lang'] = language
+    return json_term
+
+_TO_JSON = {fURIRef : _uri_to_json,
+            fBNode : _bnode_to_json,
+            fLiteral : _literal_to_json}
+
+def toJson(term):
+    """ Return the SPARQL-JSON form of a sesame2 api `term`, None for
+    unbound values. """
+
+    convert = _TO_JSON.get(type(term))
+    if convert is None:
+        return None
+    return convert(term)
 
 def toSesame(term,factory):
     if type(term) in (URIRef, Namespace):
@@ -35,6 +35,8 @@
 # -*- coding: utf-8 -*-
 __author__ = 'Cosmin Basca'
 
+import logging
+import sys
 
 from surf.plugin.writer import RDFWriter
 
@@ -45,6 +47,11 @@ from franz.openrdf.sail.allegrographserver import AllegroGraphServer
 from franz.openrdf.repository.repository import Repository
 from franz.openrdf.rio.rdfformat import RDFFormat
 
+# Number of statements sent by one addTriples call.
+DEFAULT_BATCH_SIZE = 10000
+# Seconds the server keeps an idle session open.
+DEFAULT_SESSION_LIFETIME = 3600
+
 class WriterPlugin(RDFWriter):
     def __init__(self, reader, *args, **kwargs):
         RDFWriter.__init__(self, reader, *args, **kwargs)
@@ -75,6 +82,15 @@ class WriterPlugin(RDFWriter):
         self.__con = self.__allegro_repository.getConnection()
         self.__f = self.__allegro_repository.getValueFactory()
 
+        self.__batch_size = int(kwargs.get("batch_size", DEFAULT_BATCH_SIZE))
+        use_transactions = kwargs.get("use_transactions", True)
+        if isinstance(use_transactions, basestring):
+            use_transactions = use_transactions.lower().strip() == "true"
+        self.__use_transactions = use_transactions
+        self.__session_lifetime = int(kwargs.get("session_lifetime",
+                                                 DEFAULT_SESSION_LIFETIME))
+        self.__session_open = False
+
     results_format = property(lambda self: 'json')
     server = property(lambda self: self.__server)
     port = property(lambda self: self.__port)
@@ -84,51 +100,147 @@ class WriterPlugin(RDFWriter):
     allegro_server = property(lambda self: self.__allegro_server)
     allegro_catalog = property(lambda self: self.__allegro_catalog)
     allegro_repository = property(lambda self: self.__allegro_repository)
+    batch_size = property(lambda self: self.__batch_size)
+    use_transactions = property(lambda self: self.__use_transactions)
+    session_lifetime = property(lambda self: self.__session_lifetime)
 
     def _save(self, *resources):
-        for resource in resources:
-            s = resource.subject
-            self.__remove(s, context=resource.context)
-            for p, objs in resource.rdf_direct.items():
-                for o in objs:
-                    self.__add(s, p, o, resource.context)
+        def write():
+            for resource in resources:
+                self.__remove(resource.subject, context = resource.context)
+            self.__add_quads(self.__quads(resources))
+
+        self.__transaction(write)
 
     def _update(self, *resources):
-        for resource in resources:
-            s = resource.subject
-            for p in resource.rdf_direct:
-                self.__remove(s, p, context=resource.context)
-            for p, objs in resource.rdf_direct.items():
-                for o in objs:
-                    self.__add(s, p, o, resource.context)
+        def write():
+            for resource in resources:
+                s = resource.subject
+                for p in resource.rdf_direct:
+                    self.__remove(s, p, context = resource.context)
+            self.__add_quads(self.__quads(resources))
+
+        self.__transaction(write)
 
     def _remove(self, *resources, **kwargs):
         inverse = kwargs.get("inverse")
-        for resource in resources:
-            self.__remove(s = resource.subject, context=resource.context)
-            if inverse:
-                self.__remove(o = resource.subject, context=resource.context)
+        def write():
+            for resource in resources:
+                self.__remove(s = resource.subject, context = resource.context)
+                if inverse:
+                    self.__remove(o = resource.subject, context = resource.context)
+
+        self.__transaction(write)
 
     def _size(self):
         return self.__con.size()
 
     def _add_triple(self, s = None, p = None, o = None, context = None):
-        self.__add(s, p, o, context)
+        self.__transaction(lambda: self.__add_quads([(s, p, o, context)]))
 
     def _set_triple(self, s = None, p = None, o = None, context = None):
-        self.__remove(s, p, context = context)
-        self.__add(s, p, o, context)
+        def write():
+            self.__remove(s, p, context = context)
+            self.__add_quads([(s, p, o, context)])
+
+        self.__transaction(write)
 
     def _remove_triple(self, s = None, p = None, o = None, context = None):
-        self.__remove(s, p, o, context)
+        self.__transaction(lambda: self.__remove(s, p, o, context))
+
+    def __transaction(self, write):
+        """ Run `write` in the connection's session and commit once, roll
+        back if it fails.
+
+        The session expires once idle for longer than `session_lifetime`,
+        so when `write` fails in a session opened earlier it is run once
+        more in a new session.
+
+        """
+
+        if not self.__use_transactions:
+            write()
+            return
+
+        reused = self.__session_open
+        try:
+            self.__commit(write)
+        except Exception:
+            if not reused:
+                raise
+            self.log.warning("Write failed, retrying in a new session",
+                             exc_info = True)
+            self.__session_open = False
+            try:
+                self.__con.closeSession()
+            except Exception:
+                pass
+            self.__commit(write)
+
+    def __commit(self, write):
+        if not self.__session_open:
+            self.__con.openSession(autocommit = False,
+                                   lifetime = self.__session_lifetime)
+            self.__session_open = True
+
+        try:
+            write()
+            self.__con.commit()
+        except Exception:
+            exc_info = sys.exc_info()
+            try:
+                self.__con.rollback()
+            except Exception:
+                self.log.exception("Rollback failed")
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    @staticmethod
+    def __quads(resources):
+        """ Return the direct triples of `resources` with their contexts. """
+
+        quads = []
+        for resource in resources:
+            s = resource.subject
+            for p, objs in resource.rdf_direct.items():
+                for o in objs:
+                    quads.append((s, p, o, resource.context))
+
+        return quads
 
     # used by the sesame api
-    def __add(self, s = None, p = None, o = None, context = None):
-        self.log.info('ADD TRIPLE: %s, %s, %s, %s' % (s, p, o, context))
-        self.__con.addTriple(toSesame(s, self.__f), toSesame(p, self.__f), toSesame(o, self.__f), contexts = toSesame(context, self.__f))
+    def __add_quads(self, quads):
+        """ Convert `quads` and send them with addTriples, in batches of
+        statements sharing a context. """
+
+        if self.log.isEnabledFor(logging.DEBUG):
+            for quad in quads:
+                self.log.debug('ADD TRIPLE: %s, %s, %s, %s' % quad)
+
+        # Subjects, predicates and contexts repeat, convert each term once.
+        # Equal literals may differ in datatype or language.
+        converted = {}
+        def convert(term):
+            key = (term, getattr(term, "datatype", None),
+                   getattr(term, "language", None))
+            if key not in converted:
+                converted[key] = toSesame(term, self.__f)
+            return converted[key]
+
+        by_context = {}
+        for s, p, o, context in quads:
+            by_context.setdefault(context, []).append([convert(s), convert(p),
+                                                       convert(o)])
+
+        for context, triples in by_context.items():
+            for start in xrange(0, len(triples), self.__batch_size):
+                batch = triples[start:start + self.__batch_size]
+                if context is None:
+                    self.__con.addTriples(batch)
+                else:
+                    self.__con.addTriples(batch, context = convert(context))
 
     def __remove(self, s = None, p = None, o = None, context = None):
-        self.log.info('REM TRIPLE: %s, %s, %s, %s' % (s, p, o, context))
+        self.log.debug('REM TRIPLE: %s, %s, %s, %s' % (s, p, o, context))
         self.__con.removeTriples(toSesame(s, self.__f), toSesame(p, self.__f), toSesame(o, self.__f), contexts = toSesame(context, self.__f))
 
     def index_triples(self, **kwargs):
@@ -186,4 +298,7 @@ class WriterPlugin(RDFWriter):
         self.__con.clearNamespaces()
 
     def close(self):
+        if self.__session_open:
+            self.__con.closeSession()
+            self.__session_open = False
         self.__con.close()
@@ -0,0 +1,251 @@
+# Copyright (c) 2009, Digital Enterprise Research Institute (DERI),
+# NUI Galway
+# All rights reserved.
+
+# author: Cosmin Basca
+# email: cosmin.basca@gmail.com
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer
+#      in the documentation and/or other materials provided with
+#      the distribution.
+#    * Neither the name of DERI nor the
+#      names of its contributors may be used to endorse or promote
+#      products derived from this software without specific prior
+#      written permission.
+
+# THIS SOFTWARE IS PROVIDED BY DERI ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL DERI BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+__author__ = 'Cosmin Basca'
+
+"""
+Builder of quad files read by :class:`quadfile.store.QuadFileStore`.
+
+Converts N-Triples and N-Quads into a quad file, from Python::
+
+    build("reference.quads", ["reference.nt", "extra.nq"])
+
+or from the command line::
+
+    surf-quadfile reference.quads reference.nt extra.nq
+
+Terms and quads are collected in memory and sorted before writing, the
+conversion is meant to be done once, when the dataset is published.
+
+"""
+
+from optparse import OptionParser
+import os
+import struct
+import sys
+
+from rdflib.plugins.parsers.ntriples import NTriplesParser, ParseError
+from rdflib.plugins.parsers.ntriples import r_tail, r_wspace, r_wspaces
+
+from surf.rdf import BNode, URIRef
+from quadfile.store import HEADER, INDEXES, MAGIC, VERSION, align, encode_term
+
+# Number of array items packed at once when writing.
+CHUNK_SIZE = 65536
+
+FORMATS = {".nt" : "nt", ".nq" : "nquads"}
+
+class NQuadsParser(NTriplesParser):
+    """ N-Quads parser, passes ``(s, p, o, g)`` to ``sink.quad``, `g`
+    is None for lines without a graph. """
+
+    def parseline(self):
+        self.eat(r_wspace)
+        if (not self.line) or self.line.startswith('#'):
+            return
+
+        subject = self.subject()
+        self.eat(r_wspaces)
+        predicate = self.predicate()
+        self.eat(r_wspaces)
+        object = self.object()
+        self.eat(r_wspace)
+        graph = self.uriref() or self.nodeid() or None
+        self.eat(r_tail)
+
+        if self.line:
+            raise ParseError("Trailing garbage")
+        self.sink.quad(subject, predicate, object, graph)
+
+class QuadFileBuilder(object):
+    """ Collect quads and write them as a quad file.
+
+    Triples without a graph go to `default_graph`, a new blank node if not
+    given.
+
+    """
+
+    def __init__(self, default_graph = None):
+        if default_graph is None:
+            default_graph = BNode()
+        elif not isinstance(default_graph, (URIRef, BNode)):
+            default_graph = URIRef(default_graph)
+
+        self.__default_graph = default_graph
+        self.__terms = {}
+        self.__quads = set()
+
+    default_graph = property(lambda self: self.__default_graph)
+
+    def __len__(self):
+        return len(self.__quads)
+
+    def __term_id(self, term):
+        data = encode_term(term)
+        return self.__terms.setdefault(data, len(self.__terms))
+
+    def triple(self, s, p, o):
+        """ Add triple to the default graph. """
+
+        self.quad(s, p, o, None)
+
+    def quad(self, s, p, o, g):
+        """ Add triple to graph `g`, the default graph if `g` is None. """
+
+        if g is None:
+            g = self.__default_graph
+        self.__quads.add((self.__term_id(s), self.__term_id(p),
+                          self.__term_id(o), self.__term_id(g)))
+
+    def parse(self, source, format = "nt"):
+        """ Add quads read from file object `source`, `format` is ``nt``
+        or ``nquads``. """
+
+        if format == "nquads":
+            NQuadsParser(sink = self).parse(source)
+        elif format == "nt":
+            NTriplesParser(sink = self).parse(source)
+        else:
+            raise ValueError("Unsupported format %r" % format)
+
+    @staticmethod
+    def __write_array(output, code, values):
+        """ Write `values` as an array of `code` (a :mod:`struct` format
+        character) little-endian integers. """
+
+        values = list(values)
+        for start in xrange(0, len(values), CHUNK_SIZE):
+            chunk = values[start:start + CHUNK_SIZE]
+            output.write(struct.pack("<%d%s" % (len(chunk), code),
+                                     *chunk))
+
+    @staticmethod
+    def __pad(output):
+        output.write("\x00" * (align(output.tell()) - output.tell()))
+
+    def write(self, path):
+        """ Write the collected quads to the quad file at `path`. """
+
+        # Term ids follow the order of encoded terms, so terms can be
+        # found by binary search.
+        terms = sorted(self.__terms)
+        final_ids = [0] * len(terms)
+        for term_id, data in enumerate(terms):
+            final_ids[self.__terms[data]] = term_id
+
+        quads = [tuple([final_ids[term_id] for term_id in quad])
+                 for quad in self.__quads]
+        n_triples = len(set([quad[:3] for quad in quads]))
+        default_graph = final_ids[self.__term_id(self.__default_graph)]
+        graphs = sorted(set([quad[3] for quad in quads] + [default_graph]))
+
+        output = open(path, "wb")
+        try:
+            output.write(HEADER.pack(MAGIC, VERSION, default_graph, len(terms),
+                                     n_triples, len(quads), len(graphs)))
+
+            offsets, offset = [], 0
+            for data in terms:
+                offsets.append(offset)
+                offset += len(data)
+            offsets.append(offset)
+            self.__write_array(output, "Q", offsets)
+            for data in terms:
+                output.write(data)
+            self.__pad(output)
+
+            self.__write_array(output, "I", graphs)
+            self.__pad(output)
+
+            for name, order in INDEXES:
+                quads.sort(key = lambda quad: [quad[index] for index in order])
+                self.__write_array(output, "I",
+                                   (quad[index] for quad in quads
+                                    for index in order))
+        finally:
+            output.close()
+
+def build(path, sources, default_graph = None, format = None):
+    """ Build the quad file at `path` from N-Triples or N-Quads `sources`.
+
+    `sources` are file names or file objects. Without `format` it is
+    guessed from file name extensions (``.nq`` for N-Quads), N-Triples by
+    default. Returns the number of quads written.
+
+    """
+
+    builder = QuadFileBuilder(default_graph)
+    for source in sources:
+        source_format = format
+        if source_format is None:
+            name = getattr(source, "name", source)
+            extension = isinstance(name, basestring) and \
+                        os.path.splitext(name)[1].lower()
+            source_format = FORMATS.get(extension, "nt")
+
+        if isinstance(source, basestring):
+            source = open(source, "rb")
+            try:
+                builder.parse(source, source_format)
+            finally:
+                source.close()
+        else:
+            builder.parse(source, source_format)
+
+    builder.write(path)
+    return len(builder)
+
+def main(argv = None):
+    """ Command line entry point. """
+
+    parser = OptionParser(usage = "%prog [options] OUTPUT INPUT...",
+                          description = "Convert N-Triples and N-Quads "
+                                        "files to a SuRF quad file.")
+    parser.add_option("-f", "--format", choices = ["nt", "nquads"],
+                      help = "format of all inputs, nt or nquads "
+                             "(default: guessed from file extensions)")
+    parser.add_option("-g", "--default-graph", metavar = "URI",
+                      help = "graph of triples read without graph "
+                             "(default: a blank node)")
+    options, args = parser.parse_args(argv)
+    if len(args) < 2:
+        parser.error("OUTPUT and at least one INPUT are required")
+
+    count = build(args[0], args[1:], options.default_graph, options.format)
+    print "%d quads written to %s" % (count, args[0])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
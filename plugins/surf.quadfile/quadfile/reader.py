@@ -0,0 +1,67 @@
+# Copyright (c) 2009, Digital Enterprise Research Institute (DERI),
+# NUI Galway
+# All rights reserved.
+
+# author: Cosmin Basca
+# email: cosmin.basca@gmail.com
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer
+#      in the documentation and/or other materials provided with
+#      the distribution.
+#    * Neither the name of DERI nor the
+#      names of its contributors may be used to endorse or promote
+#      products derived from this software without specific prior
+#      written permission.
+
+# THIS SOFTWARE IS PROVIDED BY DERI ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL DERI BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+__author__ = 'Cosmin Basca'
+
+from surf_rdflib.reader import ReaderPlugin as RdflibReaderPlugin
+
+from quadfile.store import QuadFileStore
+
+class ReaderPlugin(RdflibReaderPlugin):
+    """ Reader of quad files built by :mod:`quadfile.builder`.
+
+    The file given by the `path` parameter is memory-mapped, resources are
+    read natively from its indexes and SPARQL queries are evaluated by
+    rdflib over the same store.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        path = kwargs.get("path")
+        if not path:
+            raise ValueError("The quadfile reader requires a path")
+
+        store = QuadFileStore(path)
+        kwargs["rdflib_store"] = store
+        # Triples stored without a graph are in the conjunctive graph's
+        # default context.
+        kwargs.setdefault("rdflib_identifier", store.default_graph)
+        RdflibReaderPlugin.__init__(self, *args, **kwargs)
+
+        self.__path = path
+        self.__quad_store = store
+
+    path = property(lambda self: self.__path)
+    quad_store = property(lambda self: self.__quad_store)
@@ -0,0 +1,382 @@
+# Copyright (c) 2009, Digital Enterprise Research Institute (DERI),
+# NUI Galway
+# All rights reserved.
+
+# author: Cosmin Basca
+# email: cosmin.basca@gmail.com
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer
+#      in the documentation and/or other materials provided with
+#      the distribution.
+#    * Neither the name of DERI nor the
+#      names of its contributors may be used to endorse or promote
+#      products derived from this software without specific prior
+#      written permission.
+
+# THIS SOFTWARE IS PROVIDED BY DERI ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL DERI BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+__author__ = 'Cosmin Basca'
+
+"""
+Read-only rdflib store over a memory-mapped quad file.
+
+A quad file holds a dictionary of terms and four sorted arrays of quads
+of term ids (SPOG, POSG, OSPG and GSPO orders). The file is opened with
+:mod:`mmap`, processes opening the same file share its pages and nothing
+is parsed or copied into memory at startup. Files are written by
+:mod:`quadfile.builder`.
+
+The layout, all integers little-endian::
+
+    header      magic, version, default graph id and counts
+    offsets     n_terms + 1 uint64 offsets of terms in the term data
+    term data   encoded terms, sorted, a term's id is its position
+    graphs      n_graphs uint32 ids of graphs, padded to 8 bytes
+    indexes     4 arrays of n_quads records of 4 uint32 ids
+
+"""
+
+import mmap
+import struct
+
+from rdflib.store import Store, VALID_STORE
+
+from surf.rdf import BNode, Graph, Literal, URIRef
+
+MAGIC = "SURFQUAD"
+VERSION = 1
+
+HEADER = struct.Struct("<8sIIQQQQ")
+OFFSET = struct.Struct("<Q")
+GRAPH = struct.Struct("<I")
+RECORD = struct.Struct("<4I")
+
+# Index name and the positions of s, p, o and g (0 to 3) in its records.
+INDEXES = (("spog", (0, 1, 2, 3)),
+           ("posg", (1, 2, 0, 3)),
+           ("ospg", (2, 0, 1, 3)),
+           ("gspo", (3, 0, 1, 2)))
+
+# Number of decoded terms kept in memory.
+TERM_CACHE_SIZE = 65536
+
+class ReadOnlyStoreError(Exception):
+    """ Raised on attempts to modify a quad file. """
+    pass
+
+def align(offset):
+    """ Round `offset` up to a multiple of 8. """
+    return (offset + 7) & ~7
+
+def encode_term(term):
+    """ Return the `term` as stored in the term data, utf-8 encoded. """
+
+    if isinstance(term, Literal):
+        data = u"L%s\x00%s\x00%s" % (term.language or u"",
+                                     term.datatype or u"", term)
+    elif isinstance(term, BNode):
+        data = u"B" + term
+    else:
+        data = u"U" + term
+    return data.encode("utf-8")
+
+def decode_term(data):
+    """ Return the term stored as `data`. """
+
+    data = data.decode("utf-8")
+    kind, value = data[0], data[1:]
+    if kind == u"U":
+        return URIRef(value)
+    elif kind == u"B":
+        return BNode(value)
+
+    language, datatype, value = value.split(u"\x00", 2)
+    return Literal(value, lang = language or None,
+                   datatype = datatype and URIRef(datatype) or None)
+
+class _Index(object):
+    """ Sorted array of quad records in one of the `INDEXES` orders. """
+
+    def __init__(self, buffer, offset, count, order):
+        self.__buffer = buffer
+        self.__offset = offset
+        self.__count = count
+        self.order = order
+
+    def record(self, position):
+        return RECORD.unpack_from(self.__buffer,
+                                  self.__offset + position * RECORD.size)
+
+    def __search(self, prefix, after):
+        """ Return position of the first record with key not lower than
+        `prefix`, greater than `prefix` when `after`. """
+
+        length = len(prefix)
+        lo, hi = 0, self.__count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = self.record(mid)[:length]
+            if key < prefix or (after and key == prefix):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, prefix):
+        """ Return the positions of records starting with `prefix`. """
+
+        if not prefix:
+            return xrange(self.__count)
+        return xrange(self.__search(prefix, False), self.__search(prefix, True))
+
+    def quads(self, prefix):
+        """ Yield ``(s, p, o, g)`` ids of records starting with `prefix`. """
+
+        order = self.order
+        for position in self.range(prefix):
+            record = self.record(position)
+            quad = [None] * 4
+            for index, value in zip(order, record):
+                quad[index] = value
+            yield tuple(quad)
+
+class QuadFileStore(Store):
+    """ Read-only, context aware rdflib store over a quad file.
+
+    `configuration` is the path of the quad file.
+
+    """
+
+    context_aware = True
+    formula_aware = False
+    transaction_aware = False
+
+    def __init__(self, configuration = None, identifier = None):
+        self.__file = None
+        self.__buffer = None
+        self.__namespaces = {}
+        self.__prefixes = {}
+        self.__terms = {}
+        self.__ids = {}
+        Store.__init__(self, configuration, identifier)
+
+    def open(self, configuration, create = False):
+        if create:
+            raise ReadOnlyStoreError("Quad files are created by quadfile.builder")
+
+        self.__file = open(configuration, "rb")
+        self.__buffer = mmap.mmap(self.__file.fileno(), 0,
+                                  access = mmap.ACCESS_READ)
+
+        magic, version, default_graph, self.__n_terms, self.__n_triples, \
+            n_quads, self.__n_graphs = HEADER.unpack_from(self.__buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("Not a quad file: %r" % configuration)
+
+        self.__offsets = HEADER.size
+        self.__data = self.__offsets + (self.__n_terms + 1) * OFFSET.size
+        self.__graphs = align(self.__data + self.__term_offset(self.__n_terms))
+        offset = align(self.__graphs + self.__n_graphs * GRAPH.size)
+        self.__indexes = {}
+        for name, order in INDEXES:
+            self.__indexes[name] = _Index(self.__buffer, offset, n_quads, order)
+            offset += n_quads * RECORD.size
+
+        self.__default_graph = self.term(default_graph)
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction = False):
+        if self.__buffer is not None:
+            self.__buffer.close()
+            self.__file.close()
+        self.__buffer = self.__file = None
+        self.__terms.clear()
+        self.__ids.clear()
+
+    default_graph = property(lambda self: self.__default_graph)
+    """ Identifier of the graph holding triples read without a graph. """
+
+    # Terms
+
+    def __term_offset(self, term_id):
+        return OFFSET.unpack_from(self.__buffer,
+                                  self.__offsets + term_id * OFFSET.size)[0]
+
+    def __term_data(self, term_id):
+        start = self.__data + self.__term_offset(term_id)
+        end = self.__data + self.__term_offset(term_id + 1)
+        return self.__buffer[start:end]
+
+    def term(self, term_id):
+        """ Return the term with `term_id`. """
+
+        term = self.__terms.get(term_id)
+        if term is None:
+            if len(self.__terms) >= TERM_CACHE_SIZE:
+                self.__terms.clear()
+            term = self.__terms[term_id] = decode_term(self.__term_data(term_id))
+        return term
+
+    def term_id(self, term):
+        """ Return the id of `term`, None if the file doesn't have it. """
+
+        # Cached by encoding, equal terms may differ in datatype.
+        data = encode_term(term)
+        if data in self.__ids:
+            return self.__ids[data]
+
+        lo, hi = 0, self.__n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.__term_data(mid) < data:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        term_id = None
+        if lo < self.__n_terms and self.__term_data(lo) == data:
+            term_id = lo
+        if len(self.__ids) >= TERM_CACHE_SIZE:
+            self.__ids.clear()
+        self.__ids[data] = term_id
+        return term_id
+
+    # Reading
+
+    def __graph(self, graph_id):
+        return Graph(store = self, identifier = self.term(graph_id))
+
+    def __context_id(self, context):
+        """ Return the graph id of `context`, -1 if the file doesn't have
+        it and None for the whole store. """
+
+        if context is None or context is self:
+            return None
+
+        identifier = getattr(context, "identifier", context)
+        graph_id = self.term_id(identifier)
+        if graph_id is None:
+            return -1
+        return graph_id
+
+    def __quads(self, (s, p, o), graph_id):
+        """ Yield ``(s, p, o, g)`` ids of quads matching the pattern, quads
+        of the same triple one after the other. """
+
+        ids = []
+        for term in (s, p, o):
+            if term is None:
+                ids.append(None)
+                continue
+            term_id = self.term_id(term)
+            if term_id is None:
+                return
+            ids.append(term_id)
+        s, p, o = ids
+
+        if s is None and p is None and o is None and graph_id is not None:
+            index, prefix = "gspo", (graph_id,)
+        elif s is not None:
+            if p is not None:
+                index, prefix = "spog", o is None and (s, p) or (s, p, o)
+            elif o is not None:
+                index, prefix = "ospg", (o, s)
+            else:
+                index, prefix = "spog", (s,)
+        elif p is not None:
+            index, prefix = "posg", o is None and (p,) or (p, o)
+        elif o is not None:
+            index, prefix = "ospg", (o,)
+        else:
+            index, prefix = "spog", ()
+
+        for quad in self.__indexes[index].quads(prefix):
+            if graph_id is None or quad[3] == graph_id:
+                yield quad
+
+    def triples(self, (s, p, o), context = None):
+        graph_id = self.__context_id(context)
+        if graph_id == -1:
+            return
+
+        last, graphs = None, []
+        for quad in self.__quads((s, p, o), graph_id):
+            if quad[:3] != last:
+                if last is not None:
+                    yield self.__triple(last, graphs)
+                last, graphs = quad[:3], []
+            graphs.append(quad[3])
+        if last is not None:
+            yield self.__triple(last, graphs)
+
+    def __triple(self, ids, graphs):
+        triple = tuple([self.term(term_id) for term_id in ids])
+        return triple, (self.__graph(graph_id) for graph_id in graphs)
+
+    def __len__(self, context = None):
+        graph_id = self.__context_id(context)
+        if graph_id is None:
+            return self.__n_triples
+        elif graph_id == -1:
+            return 0
+        return len(self.__indexes["gspo"].range((graph_id,)))
+
+    def contexts(self, triple = None):
+        if triple is None:
+            for position in xrange(self.__n_graphs):
+                graph_id = GRAPH.unpack_from(self.__buffer,
+                                             self.__graphs + position * GRAPH.size)[0]
+                yield self.__graph(graph_id)
+            return
+
+        seen = set()
+        for quad in self.__quads(triple, None):
+            if quad[3] not in seen:
+                seen.add(quad[3])
+                yield self.__graph(quad[3])
+
+    # Namespaces are only kept in memory
+
+    def bind(self, prefix, namespace):
+        self.__prefixes[namespace] = prefix
+        self.__namespaces[prefix] = namespace
+
+    def prefix(self, namespace):
+        return self.__prefixes.get(namespace)
+
+    def namespace(self, prefix):
+        return self.__namespaces.get(prefix)
+
+    def namespaces(self):
+        for prefix, namespace in self.__namespaces.iteritems():
+            yield prefix, namespace
+
+    # The file is immutable
+
+    def add(self, triple, context, quoted = False):
+        raise ReadOnlyStoreError("Quad files are read-only")
+
+    def addN(self, quads):
+        raise ReadOnlyStoreError("Quad files are read-only")
+
+    def remove(self, triple, context = None):
+        raise ReadOnlyStoreError("Quad files are read-only")
@@ -0,0 +1,157 @@
+""" Module for quadfile plugin tests. """
+
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+from unittest import TestCase
+
+import surf
+from surf.rdf import BNode, ConjunctiveGraph, Literal, URIRef
+from surf.resource.util import Q
+from surf_rdflib.reader import ReaderPlugin as RdflibReaderPlugin
+
+from quadfile.builder import NQuadsParser, build, main
+from quadfile.reader import ReaderPlugin
+from quadfile.store import QuadFileStore, ReadOnlyStoreError
+
+FOAF = surf.ns.FOAF
+
+QUADS = """
+<http://John> <http://xmlns.com/foaf/0.1/name> "John" .
+<http://John> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://xmlns.com/foaf/0.1/Person> .
+<http://John> <http://xmlns.com/foaf/0.1/age> "30"^^<http://www.w3.org/2001/XMLSchema#integer> .
+<http://Mary> <http://xmlns.com/foaf/0.1/name> "Mary"@en <http://g1> .
+<http://Mary> <http://xmlns.com/foaf/0.1/name> "M\\u00e1ry" <http://g1> .
+<http://Mary> <http://xmlns.com/foaf/0.1/knows> <http://John> <http://g1> .
+<http://Mary> <http://xmlns.com/foaf/0.1/age> "25"^^<http://www.w3.org/2001/XMLSchema#integer> <http://g1> .
+<http://Mary> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://xmlns.com/foaf/0.1/Person> <http://g1> .
+<http://Mary> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://xmlns.com/foaf/0.1/Person> .
+_:b1 <http://xmlns.com/foaf/0.1/knows> <http://Mary> <http://g2> .
+_:b1 <http://xmlns.com/foaf/0.1/knows> <http://John> <http://g2> .
+"""
+
+class _GraphSink(object):
+    """ Add parsed quads to a ConjunctiveGraph. """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def quad(self, s, p, o, g):
+        if g is None:
+            self.graph.default_context.add((s, p, o))
+        else:
+            self.graph.get_context(g).add((s, p, o))
+
+class TestQuadFile(TestCase):
+    """ Tests for the quadfile plugin. """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "test.quads")
+        source = StringIO(QUADS)
+        source.name = "test.nq"
+        self.count = build(self.path, [source],
+                           default_graph = "http://default")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_store(self):
+        """ Test pattern lookups in a quad file store. """
+
+        store = QuadFileStore(self.path)
+        graph = ConjunctiveGraph(store, identifier = store.default_graph)
+        try:
+            self.assertEquals(self.count, 11)
+            self.assertEquals(store.default_graph, URIRef("http://default"))
+            # Mary's type is in two graphs but counts once.
+            self.assertEquals(len(graph), 10)
+            self.assertEquals(len(graph.get_context(URIRef("http://g1"))), 5)
+            self.assertEquals(len(graph.get_context(URIRef("http://none"))), 0)
+            self.assertEquals(sorted([c.identifier for c in graph.contexts()]),
+                              [URIRef("http://default"), URIRef("http://g1"),
+                               URIRef("http://g2")])
+
+            mary = URIRef("http://Mary")
+            self.assertEquals(len(list(graph.triples((mary, None, None)))), 5)
+            self.assertEquals(len(list(graph.triples((None, FOAF.knows, None)))), 3)
+            self.assertEquals(len(list(graph.triples((None, None, mary)))), 1)
+            self.assertEquals(set(graph.objects(mary, FOAF.name)),
+                              set([Literal("Mary", lang = "en"),
+                                   Literal(u"M\u00e1ry")]))
+            self.assertEquals(list(graph.subjects(FOAF.age, Literal(30))),
+                              [URIRef("http://John")])
+            self.assertEquals(list(graph.triples((URIRef("http://nobody"),
+                                                  None, None))), [])
+            self.assertEquals(
+                sorted([c.identifier for c in
+                        graph.contexts((mary, surf.ns.RDF.type, FOAF.Person))]),
+                [URIRef("http://default"), URIRef("http://g1")])
+            self.assertTrue(isinstance(list(graph.subjects(FOAF.knows,
+                                                           mary))[0], BNode))
+
+            self.assertRaises(ReadOnlyStoreError, graph.add,
+                              (mary, FOAF.name, Literal("Mary")))
+            self.assertRaises(ReadOnlyStoreError, graph.remove,
+                              (mary, None, None))
+        finally:
+            graph.close()
+
+        not_quads = os.path.join(self.directory, "not.quads")
+        open(not_quads, "wb").write("x" * 100)
+        self.assertRaises(ValueError, QuadFileStore, not_quads)
+
+    def test_reader(self):
+        """ Test that the reader matches an in-memory rdflib reader. """
+
+        reader = ReaderPlugin(path = self.path)
+        memory = RdflibReaderPlugin(rdflib_identifier = URIRef("http://default"))
+        NQuadsParser(sink = _GraphSink(memory.graph)).parse(StringIO(QUADS))
+
+        subjects = [URIRef("http://John"), URIRef("http://Mary"),
+                    URIRef("http://nobody")]
+        for contexts in [None, [URIRef("http://g1")]]:
+            for subject in subjects:
+                for direct in [True, False]:
+                    self.assertEquals(reader._load(subject, direct, contexts),
+                                      memory._load(subject, direct, contexts))
+                    self.assertEquals(
+                        reader._get(subject, FOAF.knows, direct, contexts),
+                        memory._get(subject, FOAF.knows, direct, contexts))
+                self.assertEquals(reader._is_present(subject, contexts),
+                                  memory._is_present(subject, contexts))
+            self.assertEquals(reader._concept(URIRef("http://Mary")),
+                              memory._concept(URIRef("http://Mary")))
+
+            params = {"get_by" : Q(rdf_type = FOAF.Person),
+                      "filter" : [(FOAF.age, "(%s < 28)", True)],
+                      "contexts" : contexts or []}
+            self.assertEquals(reader._get_by(dict(params)),
+                              memory._get_by(dict(params)))
+
+        # Resources are read through a Store.
+        store = surf.Store(reader = reader)
+        session = surf.Session(store)
+        Person = session.get_class(FOAF.Person)
+        self.assertEquals(sorted([unicode(person.foaf_name.first)
+                                  for person in Person.all()]),
+                          [u"John", u"Mary"])
+        store.close()
+
+    def test_main(self):
+        """ Test building quad files from the command line. """
+
+        source = os.path.join(self.directory, "test.nt")
+        open(source, "wb").write(
+            "<http://John> <http://xmlns.com/foaf/0.1/name> \"John\" .\n")
+        path = os.path.join(self.directory, "main.quads")
+        self.assertEquals(main([path, source, "-g", "http://default"]), 0)
+
+        reader = ReaderPlugin(path = path)
+        self.assertEquals(reader.graph.default_context.identifier,
+                          URIRef("http://default"))
+        self.assertEquals(reader._get(URIRef("http://John"), FOAF.name, True,
+                                      None),
+                          {Literal("John") : {None : []}})
+        reader.close()
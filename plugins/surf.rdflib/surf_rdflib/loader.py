@@ -0,0 +1,277 @@
+# Copyright (c) 2009, Digital Enterprise Research Institute (DERI),
+# NUI Galway
+# All rights reserved.
+
+# author: Cosmin Basca
+# email: cosmin.basca@gmail.com
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer
+#      in the documentation and/or other materials provided with
+#      the distribution.
+#    * Neither the name of DERI nor the
+#      names of its contributors may be used to endorse or promote
+#      products derived from this software without specific prior
+#      written permission.
+
+# THIS SOFTWARE IS PROVIDED BY DERI ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL DERI BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+__author__ = 'Cosmin Basca'
+
+"""
+Streaming loader of N-Triples and N-Quads documents into rdflib graphs.
+
+The source is read in chunks of whole lines. Each chunk is parsed with a
+line oriented parser, optionally in a process pool, and its triples are
+added to the graph in batches with ``addN``. After each chunk the graph
+is committed and progress is reported. A load can be resumed by passing
+the last reported `bytes_read` as `offset`.
+
+"""
+
+from collections import deque
+from multiprocessing import Pool
+import re
+import time
+
+from surf.rdf import BNode, Literal, URIRef
+
+DEFAULT_CHUNK_SIZE = 1048576
+DEFAULT_BATCH_SIZE = 10000
+
+_URI = r'<([^>]*)>'
+_BNODE = r'_:([A-Za-z0-9_][A-Za-z0-9_\-]*)'
+_LITERAL = r'"((?:[^"\\]|\\.)*)"(?:@([a-zA-Z]+(?:-[a-zA-Z0-9]+)*)|\^\^<([^>]*)>)?'
+_LINE = re.compile(r'^[ \t]*(?:%(uri)s|%(bnode)s)[ \t]*%(uri)s[ \t]*'
+                   r'(?:%(uri)s|%(bnode)s|%(literal)s)[ \t]*'
+                   r'(?:%(uri)s|%(bnode)s)?[ \t]*\.[ \t]*$'
+                   % {"uri" : _URI, "bnode" : _BNODE, "literal" : _LITERAL})
+_ESCAPE = re.compile(r'\\(?:([tbnrf"\'\\])|u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8}))')
+_ESCAPES = {"t" : u"\t", "b" : u"\b", "n" : u"\n", "r" : u"\r", "f" : u"\f",
+            '"' : u'"', "'" : u"'", "\\" : u"\\"}
+
+class ParseError(ValueError):
+    """ Raised on lines that are not N-Triples or N-Quads. """
+    pass
+
+def _unescape_match(match):
+    char, short, long = match.groups()
+    if char:
+        return _ESCAPES[char]
+    return unichr(int(short or long, 16))
+
+def unescape(text):
+    """ Replace N-Triples escape sequences in `text`. """
+
+    if u"\\" not in text:
+        return text
+    return _ESCAPE.sub(_unescape_match, text)
+
+def parse_line(line):
+    """ Parse one N-Triples or N-Quads `line`.
+
+    Return ``(s, p, o, g)`` where `g` is None if the line has no graph, or
+    None for empty and comment lines.
+
+    """
+
+    stripped = line.strip()
+    if not stripped or stripped.startswith(u"#"):
+        return None
+
+    match = _LINE.match(line)
+    if match is None:
+        raise ParseError("Invalid line: %r" % line)
+
+    (s_uri, s_bnode, p, o_uri, o_bnode, o_literal, o_language, o_datatype,
+     g_uri, g_bnode) = match.groups()
+
+    s = s_uri is not None and URIRef(unescape(s_uri)) or BNode(s_bnode)
+    if o_uri is not None:
+        o = URIRef(unescape(o_uri))
+    elif o_bnode is not None:
+        o = BNode(o_bnode)
+    else:
+        o = Literal(unescape(o_literal), lang = o_language,
+                    datatype = o_datatype and URIRef(unescape(o_datatype)) \
+                               or None)
+
+    g = None
+    if g_uri is not None:
+        g = URIRef(unescape(g_uri))
+    elif g_bnode is not None:
+        g = BNode(g_bnode)
+
+    return s, URIRef(unescape(p)), o, g
+
+def parse_chunk(data):
+    """ Parse a chunk of whole lines, utf-8 encoded, to a list of
+    ``(s, p, o, g)`` quads. """
+
+    quads = []
+    for line in data.decode("utf-8").splitlines():
+        quad = parse_line(line)
+        if quad is not None:
+            quads.append(quad)
+    return quads
+
+def _parse_read_chunk((bytes_read, data)):
+    return bytes_read, parse_chunk(data)
+
+def read_chunks(stream, chunk_size = DEFAULT_CHUNK_SIZE):
+    """ Yield chunks of whole lines read from `stream`, each about
+    `chunk_size` bytes. """
+
+    rest = ""
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+
+        data = rest + data
+        end = max(data.rfind("\n"), data.rfind("\r")) + 1
+        if end == 0:
+            # No line ends yet, keep reading.
+            rest = data
+            continue
+
+        rest = data[end:]
+        yield data[:end]
+
+    if rest:
+        yield rest
+
+class LoadProgress(object):
+    """ Progress of a load, passed to the `progress` callback. """
+
+    def __init__(self, triples, bytes_read, elapsed):
+        self.triples = triples
+        self.bytes_read = bytes_read
+        self.elapsed = elapsed
+
+    triples_per_second = property(lambda self: self.elapsed and
+                                  self.triples / self.elapsed or 0.0)
+
+    def __repr__(self):
+        return "<LoadProgress %d triples, %d bytes, %.1f triples/s>" % \
+            (self.triples, self.bytes_read, self.triples_per_second)
+
+class StreamingLoader(object):
+    """ Load N-Triples or N-Quads into a `ConjunctiveGraph`.
+
+    Triples without a graph go to `context`, the graph's default context
+    if None. `progress` is called with a :class:`LoadProgress` after
+    each chunk. With `processes` greater than 1 chunks are parsed in a
+    process pool of that size.
+
+    """
+
+    def __init__(self, graph, context = None, chunk_size = DEFAULT_CHUNK_SIZE,
+                 batch_size = DEFAULT_BATCH_SIZE, processes = None,
+                 progress = None):
+        self.__graph = graph
+        if context is None:
+            self.__default_graph = graph.default_context
+        else:
+            self.__default_graph = graph.get_context(context)
+        self.__chunk_size = int(chunk_size)
+        self.__batch_size = int(batch_size)
+        self.__processes = int(processes or 0)
+        self.__progress = progress
+        self.__graphs = {}
+
+    graph = property(lambda self: self.__graph)
+    chunk_size = property(lambda self: self.__chunk_size)
+    batch_size = property(lambda self: self.__batch_size)
+    processes = property(lambda self: self.__processes)
+
+    def __context_graph(self, context):
+        if context is None:
+            return self.__default_graph
+
+        graph = self.__graphs.get(context)
+        if graph is None:
+            graph = self.__graphs[context] = self.__graph.get_context(context)
+        return graph
+
+    def __add(self, quads):
+        for start in xrange(0, len(quads), self.__batch_size):
+            self.__graph.addN([(s, p, o, self.__context_graph(g))
+                               for s, p, o, g
+                               in quads[start:start + self.__batch_size]])
+
+    def __parse_in_pool(self, pool, chunks):
+        """ Parse `chunks` in `pool`, yield the results in order.
+
+        At most two chunks per process are read ahead of the consumer, so
+        large inputs aren't buffered in memory.
+
+        """
+
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_parse_read_chunk, (chunk,)))
+            if len(pending) >= 2 * self.__processes:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+
+    def load(self, stream, offset = 0):
+        """ Load triples read from file object `stream`, skipping the
+        first `offset` bytes. Return the number of triples loaded. """
+
+        if offset and hasattr(stream, "seek"):
+            stream.seek(offset)
+        elif offset:
+            remaining = offset
+            while remaining > 0:
+                data = stream.read(min(remaining, self.__chunk_size))
+                if not data:
+                    break
+                remaining -= len(data)
+
+        def chunks(bytes_read):
+            for chunk in read_chunks(stream, self.__chunk_size):
+                bytes_read += len(chunk)
+                yield bytes_read, chunk
+
+        pool = None
+        if self.__processes > 1:
+            pool = Pool(self.__processes)
+            parsed = self.__parse_in_pool(pool, chunks(offset))
+        else:
+            parsed = (_parse_read_chunk(chunk) for chunk in chunks(offset))
+
+        started = time.time()
+        triples = 0
+        try:
+            for bytes_read, quads in parsed:
+                self.__add(quads)
+                self.__graph.commit()
+                triples += len(quads)
+                if self.__progress:
+                    self.__progress(LoadProgress(triples, bytes_read,
+                                                 time.time() - started))
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        return triples
@@ -35,13 +35,34 @@
 # -*- coding: utf-8 -*-
 __author__ = 'Cosmin Basca'
 
-try:
-    from json import loads
-except Exception, e:
-    from simplejson import loads
+from decimal import Decimal
+from itertools import islice
+import operator
+import re
 
 from surf.plugin.query_reader import RDFQueryReader
-from surf.rdf import ConjunctiveGraph
+from surf.query import a
+from surf.rdf import BNode, ConjunctiveGraph, Literal, URIRef
+from surf.resource.util import Q
+
+# Stop counting matches of a pattern once this many were seen when
+# estimating which get_by clause is the cheapest to evaluate.
+ESTIMATE_LIMIT = 1000
+
+# Filters that can be evaluated natively: a single comparison of the
+# filter variable with a number, a simple string literal or an URI.
+_FILTER = re.compile(r"""^\s*\(\s*\?f\s*(=|!=|<=|>=|<|>)\s*
+                         (?:(?P<number>[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+                          |"(?P<dstring>[^"\\]*)"
+                          |'(?P<sstring>[^'\\]*)'
+                          |<(?P<uri>[^<>"\s]*)>)
+                         \s*\)\s*$""", re.VERBOSE)
+
+_OPERATORS = {"=" : operator.eq, "!=" : operator.ne,
+              "<" : operator.lt, ">" : operator.gt,
+              "<=" : operator.le, ">=" : operator.ge}
+
+_NUMBERS = (int, long, float, Decimal)
 
 class ReaderPlugin(RDFQueryReader):
     def __init__(self, *args, **kwargs):
@@ -55,11 +76,411 @@ class ReaderPlugin(RDFQueryReader):
         self.__graph = ConjunctiveGraph(store = self.__rdflib_store,
                                         identifier = self.__rdflib_identifier)
 
+        use_native_index = kwargs.get("use_native_index", True)
+        if isinstance(use_native_index, basestring):
+            use_native_index = use_native_index.lower().strip() == "true"
+        self.__use_native_index = use_native_index
+
     rdflib_store = property(lambda self: self.__rdflib_store)
     rdflib_identifier = property(lambda self: self.__rdflib_identifier)
     graph = property(lambda self: self.__graph)
     commit_pending_transaction_on_close = \
         property(lambda self: self.__commit_pending_transaction_on_close)
+    use_native_index = property(lambda self: self.__use_native_index)
+
+    # Native access to the graph indexes. These methods return the same
+    # structures as the SPARQL queries of RDFQueryReader, following SPARQL
+    # dataset rules: with `contexts` the default graph is the merge of
+    # those contexts and they are the named graphs, otherwise the default
+    # graph is the whole store and every context except the store's
+    # default one is a named graph.
+
+    def __dataset(self, contexts):
+        """ Return the default graphs and the named graphs identifiers. """
+
+        if contexts:
+            # Contexts may be given as plain strings or namespaces.
+            contexts = [isinstance(context, (URIRef, BNode)) and context
+                        or URIRef(context) for context in contexts]
+            return [self.__graph.get_context(context) for context in contexts], \
+                   set(contexts)
+
+        default_identifier = self.__graph.default_context.identifier
+        named = set([graph.identifier for graph in self.__graph.contexts()])
+        named.discard(default_identifier)
+        return [self.__graph], named
+
+    @staticmethod
+    def __triples(graphs, pattern):
+        """ Return distinct triples matching `pattern` in the merge of
+        `graphs`. """
+
+        if len(graphs) == 1:
+            return list(set(graphs[0].triples(pattern)))
+
+        triples = set()
+        for graph in graphs:
+            triples.update(graph.triples(pattern))
+        return list(triples)
+
+    def __named_graphs(self, triple, named):
+        """ Return identifiers of the named graphs holding `triple`. """
+
+        # Some stores fail to list contexts of a triple they don't have.
+        if triple not in self.__graph:
+            return []
+
+        return [graph.identifier for graph in self.__graph.contexts(triple)
+                if graph.identifier in named]
+
+    def __typed_values(self, solutions, graphs, named):
+        """ Extend `solutions`, lists ending with ``[v, g]``, with the types
+        ``c`` of ``v`` and the named graphs ``g`` stating them.
+
+        Evaluates ``OPTIONAL { ?v a ?c } OPTIONAL { GRAPH ?g { ?v a ?c } }``
+        where ``?g`` may already be bound.
+
+        """
+
+        rows = []
+        for solution in solutions:
+            v, g = solution[-2:]
+            types = [triple[2] for triple in self.__triples(graphs, (v, a, None))]
+            if not types:
+                rows.append(tuple(solution) + (None,))
+                continue
+
+            for c in types:
+                graphs_of_type = self.__named_graphs((v, a, c), named)
+                if g is not None:
+                    # ?g is bound, the optional only matches if the type
+                    # is stated in that graph, it never discards the row.
+                    rows.append(tuple(solution) + (c,))
+                elif graphs_of_type:
+                    for type_graph in graphs_of_type:
+                        rows.append(tuple(solution[:-1]) + (type_graph, c))
+                else:
+                    rows.append(tuple(solution) + (c,))
+
+        return rows
+
+    @staticmethod
+    def __nest(rows):
+        """ Convert distinct rows of keys ending with a value to nested
+        dictionaries, like :meth:`RDFQueryReader.convert`. """
+
+        results = {}
+        seen = set()
+        for row in rows:
+            if row in seen:
+                continue
+            seen.add(row)
+
+            data = results
+            for key in row[:-2]:
+                data = data.setdefault(key, {})
+            values = data.setdefault(row[-2], [])
+            if row[-1]:
+                values.append(row[-1])
+
+        return results
+
+    def _get(self, subject, attribute, direct, contexts):
+        if not self.__use_native_index:
+            return RDFQueryReader._get(self, subject, attribute, direct, contexts)
+
+        graphs, named = self.__dataset(contexts)
+        if direct:
+            values = [o for _, _, o in self.__triples(graphs, (subject, attribute, None))]
+        else:
+            values = [s for s, _, _ in self.__triples(graphs, (None, attribute, subject))]
+
+        return self.__nest(self.__typed_values([[v, None] for v in values],
+                                               graphs, named))
+
+    def _load(self, subject, direct, contexts):
+        if not self.__use_native_index:
+            return RDFQueryReader._load(self, subject, direct, contexts)
+
+        graphs, named = self.__dataset(contexts)
+        solutions = []
+        if direct:
+            for _, p, v in self.__triples(graphs, (subject, None, None)):
+                # OPTIONAL { GRAPH ?g { <subject> a ?v } }
+                for g in self.__named_graphs((subject, a, v), named) or [None]:
+                    solutions.append([p, v, g])
+        else:
+            for v, p, _ in self.__triples(graphs, (None, None, subject)):
+                # OPTIONAL { GRAPH ?g { ?v a <subject> } }
+                for g in self.__named_graphs((v, a, subject), named) or [None]:
+                    solutions.append([p, v, g])
+
+        return self.__nest(self.__typed_values(solutions, graphs, named))
+
+    def _is_present(self, subject, contexts):
+        if not self.__use_native_index:
+            return RDFQueryReader._is_present(self, subject, contexts)
+
+        graphs, _ = self.__dataset(contexts)
+        for graph in graphs:
+            for _ in graph.triples((subject, None, None)):
+                return True
+
+        return False
+
+    def _concept(self, subject):
+        if not self.__use_native_index:
+            return RDFQueryReader._concept(self, subject)
+
+        return list(set(self.__graph.objects(subject, a)))
+
+    # Native get_by: the Q tree is evaluated to a set of subjects by walking
+    # the edges of each clause backwards from its values, AND children are
+    # intersected starting from the cheapest one and OR children are merged.
+
+    def __step(self, graphs, nodes, attribute, direct, forward):
+        """ Follow the `attribute` edge from `nodes`, towards the value
+        when `forward`, towards the subject otherwise. """
+
+        reached = set()
+        for node in nodes:
+            if direct == forward:
+                reached.update(o for _, _, o in
+                               self.__triples(graphs, (node, attribute, None)))
+            else:
+                reached.update(s for s, _, _ in
+                               self.__triples(graphs, (None, attribute, node)))
+        return reached
+
+    @staticmethod
+    def __values(values):
+        if hasattr(values, "__iter__"):
+            return set(values)
+        return set([values])
+
+    def __estimate(self, graphs, child):
+        """ Estimate the number of subjects matching a get_by `child`. """
+
+        if isinstance(child, Q):
+            estimates = [self.__estimate(graphs, c) for c in child.children]
+            if child.connection == Q.OR:
+                return sum(estimates)
+            return min(estimates)
+
+        edges, values = child
+        attribute, direct = edges[-1]
+        count = 0
+        for value in self.__values(values):
+            pattern = direct and (None, attribute, value) \
+                      or (value, attribute, None)
+            for graph in graphs:
+                count += len(list(islice(graph.triples(pattern),
+                                         ESTIMATE_LIMIT)))
+        return count
+
+    def __match_clause(self, graphs, (edges, values)):
+        """ Return subjects reaching one of `values` through `edges`. """
+
+        nodes = self.__values(values)
+        for attribute, direct in reversed(edges):
+            nodes = self.__step(graphs, nodes, attribute, direct, False)
+        return nodes
+
+    def __check_clause(self, graphs, candidates, (edges, values)):
+        """ Return the `candidates` reaching one of `values` through
+        `edges`. """
+
+        values = self.__values(values)
+        matching = set()
+        for candidate in candidates:
+            nodes = set([candidate])
+            for attribute, direct in edges:
+                nodes = self.__step(graphs, nodes, attribute, direct, True)
+            if not nodes.isdisjoint(values):
+                matching.add(candidate)
+        return matching
+
+    def __match(self, graphs, q):
+        """ Return subjects matching the `q` tree. """
+
+        children = [(self.__estimate(graphs, child), child)
+                    for child in q.children]
+
+        if q.connection == Q.OR:
+            subjects = set()
+            for _, child in children:
+                subjects.update(self.__match_child(graphs, child))
+            return subjects
+
+        children.sort(key = lambda item: item[0])
+        subjects = None
+        for estimate, child in children:
+            if subjects is None:
+                subjects = self.__match_child(graphs, child)
+            elif not isinstance(child, Q) and \
+                    len(subjects) * len(child[0]) < estimate:
+                # Cheaper to check the few candidates left than to list
+                # all the matches of this clause.
+                subjects = self.__check_clause(graphs, subjects, child)
+            else:
+                subjects &= self.__match_child(graphs, child)
+
+            if not subjects:
+                break
+
+        return subjects or set()
+
+    def __match_child(self, graphs, child):
+        if isinstance(child, Q):
+            return self.__match(graphs, child)
+        return self.__match_clause(graphs, child)
+
+    @staticmethod
+    def __compile_filter(expression):
+        """ Return a predicate for values of a natively supported filter
+        `expression`, None for any other filter. """
+
+        try:
+            match = _FILTER.match(unicode(expression) % "?f")
+        except (TypeError, ValueError):
+            return None
+        if match is None:
+            return None
+
+        compare = _OPERATORS[match.group(1)]
+        if match.group("uri") is not None:
+            if compare not in (operator.eq, operator.ne):
+                return None
+            uri = URIRef(match.group("uri"))
+            return lambda term: compare(term, uri)
+
+        if match.group("number") is not None:
+            number = match.group("number")
+            if re.match(r"^[+-]?\d+$", number):
+                number = int(number)
+            else:
+                number = Decimal(number)
+
+            def predicate(term):
+                if not isinstance(term, Literal):
+                    return False
+                value = term.toPython()
+                if isinstance(value, bool) or not isinstance(value, _NUMBERS):
+                    return False
+                if isinstance(value, float):
+                    return compare(value, float(number))
+                return compare(value, number)
+            return predicate
+
+        string = match.group("dstring")
+        if string is None:
+            string = match.group("sstring")
+
+        def predicate(term):
+            # Only simple literals compare with a simple literal.
+            if not isinstance(term, Literal) or term.language or term.datatype:
+                return False
+            return compare(unicode(term), string)
+        return predicate
+
+    @staticmethod
+    def __sort_key(term):
+        """ Order terms like SPARQL ORDER BY: unbound, blank nodes, URIs
+        and literals, numeric literals by value. """
+
+        if term is None:
+            return (0,)
+        if isinstance(term, BNode):
+            return (1, unicode(term))
+        if isinstance(term, Literal):
+            value = term.toPython()
+            if isinstance(value, _NUMBERS) and not isinstance(value, bool):
+                return (3, 0, value)
+            return (3, 1, unicode(term))
+        return (2, unicode(term))
+
+    def __order(self, graphs, subjects, params):
+        subjects = sorted(subjects, key = self.__sort_key)
+        order = params.get("order")
+        desc = bool(params.get("desc"))
+        if order is True:
+            if desc:
+                subjects.reverse()
+        elif order:
+            # Subjects are sorted by their first value in the requested
+            # order, subjects without value first (last when descending).
+            def key(subject):
+                nodes = set([subject])
+                for attribute, direct in order:
+                    nodes = self.__step(graphs, nodes, attribute, direct, True)
+                keys = [self.__sort_key(node) for node in nodes]
+                if not keys:
+                    return self.__sort_key(None)
+                return desc and max(keys) or min(keys)
+            subjects.sort(key = key, reverse = desc)
+
+        offset = params.get("offset") or 0
+        limit = params.get("limit")
+        if limit is not None:
+            return subjects[offset:offset + limit]
+        return subjects[offset:]
+
+    def _get_by(self, params):
+        if not self.__use_native_index:
+            return RDFQueryReader._get_by(self, params)
+
+        q = params.get("get_by")
+        if q is not None and not q.children:
+            q = None
+        filters = []
+        for attribute, expression, direct in params.get("filter", []):
+            predicate = self.__compile_filter(expression)
+            if predicate is None:
+                return RDFQueryReader._get_by(self, params)
+            filters.append((attribute, predicate))
+        if q is None and not filters:
+            return RDFQueryReader._get_by(self, params)
+
+        contexts = params.get("contexts", None)
+        graphs, named = self.__dataset(contexts)
+
+        if q is not None:
+            subjects = self.__match(graphs, q)
+        else:
+            attribute = filters[0][0]
+            subjects = set(s for s, _, _ in
+                           self.__triples(graphs, (None, attribute, None)))
+
+        for attribute, predicate in filters:
+            subjects = set(subject for subject in subjects
+                           if [value for value in
+                               self.__step(graphs, [subject], attribute,
+                                           True, True)
+                               if predicate(value)])
+
+        subjects = self.__order(graphs, subjects, params)
+
+        results = []
+        if "full" in params:
+            for subject in subjects:
+                instance_data = {"direct" : self._load(subject, True, contexts)}
+                if not params.get("only_direct"):
+                    instance_data["inverse"] = self._load(subject, False,
+                                                          contexts)
+                results.append((subject, instance_data))
+            return results
+
+        for subject in subjects:
+            concepts = {}
+            for _, _, concept in self.__triples(graphs, (subject, a, None)):
+                # Like the SPARQL results, the last named graph wins.
+                contexts_of_type = self.__named_graphs((subject, a, concept),
+                                                       named)
+                context = contexts_of_type and contexts_of_type[-1] or None
+                concepts[concept] = {context: []}
+            results.append((subject, {"direct" : {a : concepts}}))
+
+        return results
 
     def _to_table(self, result):
         # Elements in result.selectionF are instances of rdflib.Variable,
@@ -70,6 +491,49 @@ class ReaderPlugin(RDFQueryReader):
         # Convert each row to dict: { var->value, ... }
         return [dict(zip(vars, row)) for row in result]
 
+    @staticmethod
+    def __variables(result):
+        """ Return names of the variables selected by `result`. """
+
+        return [unicode(var) for var in result.selectionF or result.allVariables]
+
+    def __rows(self, result):
+        """ Yield SELECT `result` rows as dictionaries of bound variables. """
+
+        vars = self.__variables(result)
+        for row in result:
+            # Rows of single variable results may be plain terms.
+            if not isinstance(row, (tuple, list)):
+                row = (row,)
+            yield dict([(var, value) for var, value in zip(vars, row)
+                        if value is not None])
+
+    @staticmethod
+    def __json_term(term):
+        """ Return SPARQL-JSON form of `term`. """
+
+        if isinstance(term, URIRef):
+            return {"type" : "uri", "value" : unicode(term)}
+        elif isinstance(term, BNode):
+            return {"type" : "bnode", "value" : unicode(term)}
+        elif isinstance(term, Literal) and term.datatype:
+            return {"type" : "typed-literal", "datatype" : unicode(term.datatype),
+                    "value" : unicode(term)}
+        elif isinstance(term, Literal) and term.language:
+            return {"type" : "literal", "xml:lang" : term.language,
+                    "value" : unicode(term)}
+        return {"type" : "literal", "value" : unicode(term)}
+
+    def _to_columns(self, result):
+        vars = [unicode(var) for var in result.selectionF]
+
+        # Rows of single variable results are plain terms, not sequences.
+        if len(vars) == 1:
+            return vars, [list(result)]
+
+        columns = zip(*result) or [()] * len(vars)
+        return vars, [list(column) for column in columns]
+
     def _ask(self, result):
         # askAnswer is list with boolean values, we want first value. 
         return result.askAnswer[0]
@@ -81,10 +545,38 @@ class ReaderPlugin(RDFQueryReader):
         return self.__graph.query(q_string)
 
     def execute_sparql(self, q_string, format = None):
+        """ Execute `q_string` and return a SPARQL-JSON shaped dictionary.
+
+        With `format` ``rows`` the SELECT results are returned as an iterator
+        of dictionaries mapping variable names to rdflib terms instead. ASK
+        returns a boolean in this mode. CONSTRUCT and DESCRIBE return the
+        resulting rdflib graph in both modes.
+
+        """
+
         self.log.debug(q_string)
 
         result = self.__graph.query(q_string)
-        return loads(result.serialize('json'))
+        if result.construct:
+            return result.result
+
+        rows = format is not None and format.lower() == "rows"
+        if result.askAnswer:
+            if rows:
+                return result.askAnswer[0]
+            return {"head" : {}, "boolean" : result.askAnswer[0]}
+
+        if rows:
+            return self.__rows(result)
+
+        json_term = self.__json_term
+        bindings = [dict([(var, json_term(value))
+                          for var, value in row.iteritems()])
+                    for row in self.__rows(result)]
+        return {"head" : {"vars" : self.__variables(result)},
+                "results" : {"ordered" : bool(result.orderBy),
+                             "distinct" : bool(result.distinct),
+                             "bindings" : bindings}}
 
     def close(self):
         self.__graph.close(commit_pending_transaction = self.__commit_pending_transaction_on_close)
@@ -31,3 +31,251 @@ class RdflibTestMixin(object):
 
 class StandardPluginTest(TestCase, RdflibTestMixin, PluginTestMixin):
     pass
+
+class TestRdflib(TestCase, RdflibTestMixin):
+    """ Tests specific to the rdflib plugin. """
+
+    def test_save_into_context(self):
+        """ Test that resources are written into their context graphs. """
+
+        from surf.rdf import URIRef
+
+        store, session = self._get_store_session()
+        graph = store.writer.graph
+        context = URIRef("http://my_context_1")
+
+        Person = session.get_class(surf.ns.FOAF + "Person")
+        john = session.get_resource("http://John", Person, context = context)
+        john.foaf_name = "John"
+        john.save()
+        mary = session.get_resource("http://Mary", Person)
+        mary.foaf_name = "Mary"
+        mary.save()
+
+        in_context = set(graph.get_context(context).subjects())
+        self.assertEquals(in_context, set([URIRef("http://John")]))
+        in_default = set(graph.default_context.subjects())
+        self.assertEquals(in_default, set([URIRef("http://Mary")]))
+
+        store.clear(context)
+        self.assertEquals(len(graph.get_context(context)), 0)
+        self.assertEquals(len(graph), 2)
+
+    def test_native_index(self):
+        """ Test that native index reads match the SPARQL queries. """
+
+        from rdflib import plugin
+        from rdflib.store import Store as RdflibStore
+        from surf.rdf import URIRef
+        from surf_rdflib.reader import ReaderPlugin
+
+        backend = plugin.get("IOMemory", RdflibStore)()
+        store = surf.Store(reader = "rdflib", writer = "rdflib",
+                           rdflib_store = backend)
+        session = surf.Session(store)
+        Person = session.get_class(surf.ns.FOAF + "Person")
+        john = session.get_resource("http://John", Person)
+        john.foaf_name = "John"
+        john.save()
+        mary = session.get_resource("http://Mary", Person)
+        mary.foaf_name = ["Mary", "M"]
+        mary.foaf_knows = john
+        mary.foaf_homepage = URIRef("http://mary.com")
+        mary.save()
+
+        native = store.reader
+        sparql = ReaderPlugin(rdflib_store = backend,
+                              use_native_index = "false")
+        self.assertTrue(native.use_native_index)
+        self.assertFalse(sparql.use_native_index)
+
+        foaf = surf.ns.FOAF
+        for subject in [URIRef("http://John"), URIRef("http://Mary"),
+                        URIRef("http://nobody")]:
+            for direct in [True, False]:
+                self.assertEquals(native._load(subject, direct, None),
+                                  sparql._load(subject, direct, None))
+                for attribute in [foaf.name, foaf.knows, foaf.homepage]:
+                    self.assertEquals(
+                        native._get(subject, attribute, direct, None),
+                        sparql._get(subject, attribute, direct, None))
+
+            self.assertEquals(native._is_present(subject, None),
+                              sparql._is_present(subject, None))
+            self.assertEquals(native._concept(subject),
+                              sparql._concept(subject))
+
+    def test_native_get_by(self):
+        """ Test that native get_by matches the SPARQL queries. """
+
+        from rdflib import plugin
+        from rdflib.store import Store as RdflibStore
+        from surf.rdf import URIRef
+        from surf.resource.util import Q
+        from surf_rdflib.reader import ReaderPlugin
+
+        backend = plugin.get("IOMemory", RdflibStore)()
+        store = surf.Store(reader = "rdflib", writer = "rdflib",
+                           rdflib_store = backend)
+        session = surf.Session(store)
+        Person = session.get_class(surf.ns.FOAF + "Person")
+        persons = {}
+        for name, age in [("John", 30), ("Mary", 25), ("Jane", 41)]:
+            person = session.get_resource("http://%s" % name, Person)
+            person.foaf_name = name
+            person.foaf_age = age
+            persons[name] = person
+        persons["Mary"].foaf_knows = persons["John"]
+        persons["Jane"].foaf_knows = [persons["John"], persons["Mary"]]
+        for person in persons.values():
+            person.save()
+
+        native = store.reader
+        sparql = ReaderPlugin(rdflib_store = backend,
+                              use_native_index = "false")
+
+        def compare(**params):
+            params["contexts"] = []
+            native_results = sorted(native._get_by(dict(params)))
+            self.assertEquals(native_results,
+                              sorted(sparql._get_by(dict(params))))
+            return native_results
+
+        foaf = surf.ns.FOAF
+        is_person = Q(rdf_type = foaf.Person)
+        results = compare(get_by = is_person)
+        self.assertEquals(len(results), 3)
+        # Details of each subject are read like _load does.
+        for subject, data in native._get_by({"get_by" : is_person,
+                                             "full" : True, "contexts" : []}):
+            self.assertEquals(data, {"direct" : sparql._load(subject, True, []),
+                                     "inverse" : sparql._load(subject, False,
+                                                              [])})
+        results = compare(get_by = Q(foaf_name = ["John", "Jane"]))
+        self.assertEquals(len(results), 2)
+        results = compare(get_by = Q(foaf_name = "Mary") | Q(foaf_age = 41))
+        self.assertEquals(len(results), 2)
+        # rdfextras cannot evaluate paths, check the native results only.
+        results = native._get_by({"get_by" : Q(foaf_knows__foaf_name = "Mary"),
+                                  "contexts" : []})
+        self.assertEquals([result[0] for result in results],
+                          [URIRef("http://Jane")])
+        results = compare(get_by = Q(is_foaf_knows_of = persons["Mary"]))
+        self.assertEquals(results[0][0], URIRef("http://John"))
+        results = compare(get_by = is_person & Q(foaf_knows = persons["John"]))
+        self.assertEquals(len(results), 2)
+        results = compare(get_by = is_person,
+                          filter = [(foaf.age, "(%s > 28)", True)])
+        self.assertEquals(len(results), 2)
+        results = compare(get_by = is_person,
+                          filter = [(foaf.name, "(%s = 'John')", True)])
+        self.assertEquals(len(results), 1)
+
+        # rdfextras does not sort descending, check the native order only.
+        results = native._get_by({"get_by" : is_person, "contexts" : [],
+                                  "order" : [(foaf.age, True)], "desc" : True})
+        self.assertEquals([result[0] for result in results],
+                          [URIRef("http://Jane"), URIRef("http://John"),
+                           URIRef("http://Mary")])
+        results = native._get_by({"get_by" : is_person, "contexts" : [],
+                                  "order" : True, "limit" : 1, "offset" : 1})
+        self.assertEquals([result[0] for result in results],
+                          [URIRef("http://John")])
+
+        # Unsupported filters are evaluated by SPARQL.
+        results = compare(get_by = is_person,
+                          filter = [(foaf.name, "(regex(%s, '^J'))", True)])
+        self.assertEquals(len(results), 2)
+
+    def test_load_triples(self):
+        """ Test streaming N-Triples and N-Quads loads. """
+
+        from StringIO import StringIO
+        from surf.rdf import BNode, Literal, URIRef
+        from surf_rdflib.loader import ParseError, parse_line
+
+        self.assertEquals(parse_line(u'  # comment'), None)
+        self.assertEquals(
+            parse_line(u'_:b1 <http://p> "a\\"b\\u00e9"@en <http://g> .'),
+            (BNode("b1"), URIRef("http://p"), Literal(u'a"b\u00e9', lang = "en"),
+             URIRef("http://g")))
+        self.assertEquals(
+            parse_line(u'<http://s> <http://p> "1"^^<http://www.w3.org/2001/XMLSchema#integer>.'),
+            (URIRef("http://s"), URIRef("http://p"), Literal(1), None))
+        self.assertRaises(ParseError, parse_line, u'<http://s> <http://p> .')
+
+        store, session = self._get_store_session()
+        lines = ['<http://s%d> <http://p> "%d" .\n' % (i, i) for i in range(50)]
+        data = "".join(lines)
+        reports = []
+        self.assertTrue(store.load_triples(source = StringIO(data), format = "nt",
+                                           chunk_size = 100, batch_size = 3,
+                                           progress = reports.append))
+        self.assertEquals(store.size(), 50)
+        self.assertTrue(len(reports) > 5)
+        self.assertEquals(reports[-1].triples, 50)
+        self.assertEquals(reports[-1].bytes_read, len(data))
+
+        # Resume after the first reported chunk.
+        store.clear()
+        first = reports[0]
+        resumed = []
+        store.load_triples(source = StringIO(data), format = "nt",
+                           chunk_size = 100, offset = first.bytes_read,
+                           progress = resumed.append)
+        self.assertEquals(store.size(), 50 - first.triples)
+        self.assertEquals(resumed[-1].bytes_read, len(data))
+
+        # Quads go to their graphs, parsed in a process pool.
+        store.clear()
+        data = ('<http://s> <http://p> "a" <http://g1> .\n'
+                '<http://s> <http://p> "b" .\n') * 10
+        store.load_triples(source = StringIO(data), format = "nquads",
+                           chunk_size = 64, processes = 2,
+                           context = URIRef("http://g2"))
+        graph = store.reader.graph
+        self.assertEquals(list(graph.get_context(URIRef("http://g1")).objects()),
+                          [Literal("a")])
+        self.assertEquals(list(graph.get_context(URIRef("http://g2")).objects()),
+                          [Literal("b")])
+
+        # The pool reads only a few chunks ahead of the inserts.
+        stream = StringIO(data * 20)
+        ahead = []
+        store.load_triples(source = stream, format = "nquads",
+                           chunk_size = 64, processes = 2,
+                           progress = lambda report: ahead.append(
+                               stream.tell() - report.bytes_read))
+        self.assertTrue(max(ahead) <= 6 * 64)
+
+    def test_execute_sparql_rows(self):
+        """ Test execute_sparql() results built from result rows. """
+
+        from surf.rdf import Literal, URIRef
+
+        store, session = self._get_store_session()
+        store.add_triple(URIRef("http://s"), URIRef("http://p"),
+                         Literal('say "hi"', lang = "en"))
+        store.add_triple(URIRef("http://s"), URIRef("http://q"), Literal(1))
+        query = "SELECT ?p ?o WHERE { <http://s> ?p ?o }"
+
+        result = store.execute_sparql(query)
+        self.assertEquals(result["head"]["vars"], ["p", "o"])
+        self.assertEquals(
+            sorted(result["results"]["bindings"],
+                   key = lambda binding: binding["p"]["value"]),
+            [{"p" : {"type" : "uri", "value" : "http://p"},
+              "o" : {"type" : "literal", "xml:lang" : "en",
+                     "value" : 'say "hi"'}},
+             {"p" : {"type" : "uri", "value" : "http://q"},
+              "o" : {"type" : "typed-literal", "value" : "1",
+                     "datatype" : "http://www.w3.org/2001/XMLSchema#integer"}}])
+
+        rows = store.reader.execute_sparql(query, format = "rows")
+        self.assertEquals(sorted(rows, key = lambda row: row["p"]),
+                          [{"p" : URIRef("http://p"),
+                            "o" : Literal('say "hi"', lang = "en")},
+                           {"p" : URIRef("http://q"), "o" : Literal(1)}])
+        self.assertEquals(store.reader.execute_sparql(
+                              "ASK { <http://s> ?p ?o }", format = "rows"),
+                          True)
@@ -35,12 +35,19 @@
 # -*- coding: utf-8 -*-
 __author__ = 'Cosmin Basca'
 
+import logging
 import warnings
 
+from rdflib.parser import create_input_source
+
 from surf.plugin.writer import RDFWriter
 from surf.rdf import ConjunctiveGraph
+from loader import DEFAULT_BATCH_SIZE, DEFAULT_CHUNK_SIZE, StreamingLoader
 from reader import ReaderPlugin
 
+# Formats loaded by StreamingLoader instead of rdflib parsers.
+STREAMING_FORMATS = ("nt", "nquads")
+
 class WriterPlugin(RDFWriter):
     def __init__(self, reader, *args, **kwargs):
         RDFWriter.__init__(self, reader, *args, **kwargs)
@@ -71,31 +78,26 @@ class WriterPlugin(RDFWriter):
 
     def _save(self, *resources):
         for resource in resources:
-            s = resource.subject
-            self.__remove(s)
-            for p, objs in resource.rdf_direct.items():
-                for o in objs:
-                    self.__add(s, p, o)
+            self.__remove(resource.subject, context = resource.context)
 
+        self.__add_quads(self.__quads(resources))
         self.__graph.commit()
 
     def _update(self, *resources):
         for resource in resources:
             s = resource.subject
             for p in resource.rdf_direct:
-                self.__remove(s, p)
-            for p, objs in resource.rdf_direct.items():
-                for o in objs:
-                    self.__add(s, p, o)
+                self.__remove(s, p, context = resource.context)
 
+        self.__add_quads(self.__quads(resources))
         self.__graph.commit()
 
     def _remove(self, *resources, **kwargs):
         inverse = kwargs.get("inverse")
         for resource in resources:
-            self.__remove(s = resource.subject)
+            self.__remove(s = resource.subject, context = resource.context)
             if inverse:
-                self.__remove(o = resource.subject)
+                self.__remove(o = resource.subject, context = resource.context)
 
         self.__graph.commit()
 
@@ -103,22 +105,54 @@ class WriterPlugin(RDFWriter):
         return len(self.__graph)
 
     def _add_triple(self, s = None, p = None, o = None, context = None):
-        self.__add(s, p, o, context)
+        self.__add_quads([(s, p, o, self.__context_graph(context))])
 
     def _set_triple(self, s = None, p = None, o = None, context = None):
         self.__remove(s, p, context = context)
-        self.__add(s, p, o, context)
+        self.__add_quads([(s, p, o, self.__context_graph(context))])
 
     def _remove_triple(self, s = None, p = None, o = None, context = None):
         self.__remove(s, p, o, context)
 
-    def __add(self, s = None, p = None, o = None, context = None):
-        self.log.info('ADD: %s, %s, %s, %s' % (s, p, o, context))
-        self.__graph.add((s, p, o))
+    def __context_graph(self, context):
+        """ Return the graph holding triples of `context`, the default
+        graph if `context` is None. """
+
+        if context is None:
+            return self.__graph.default_context
+
+        return self.__graph.get_context(context)
+
+    def __quads(self, resources):
+        """ Return the direct triples of `resources` with their context
+        graphs as a list of quads. """
+
+        quads = []
+        for resource in resources:
+            s = resource.subject
+            graph = self.__context_graph(resource.context)
+            for p, objs in resource.rdf_direct.items():
+                for o in objs:
+                    quads.append((s, p, o, graph))
+
+        return quads
+
+    def __add_quads(self, quads):
+        if self.log.isEnabledFor(logging.DEBUG):
+            for s, p, o, graph in quads:
+                self.log.debug('ADD: %s, %s, %s, %s', s, p, o, graph.identifier)
+
+        self.__graph.addN(quads)
 
     def __remove(self, s = None, p = None, o = None, context = None):
-        self.log.info('REM: %s, %s, %s, %s' % (s, p, o, context))
-        self.__graph.remove((s, p, o))
+        """ Remove matching triples from `context`, from all contexts if
+        `context` is None. """
+
+        self.log.debug('REM: %s, %s, %s, %s', s, p, o, context)
+        if context is None:
+            self.__graph.remove((s, p, o))
+        else:
+            self.__graph.get_context(context).remove((s, p, o))
 
     def index_triples(self, **kwargs):
         """ Index triples if this functionality is present.  
@@ -131,18 +165,47 @@ class WriterPlugin(RDFWriter):
         return True
 
     def load_triples(self, source = None, publicID = None, format = "xml", **args):
-        """ Load files (or resources on the web) into the triple-store. """
-        
-        if source:
+        """ Load files (or resources on the web) into the triple-store.
+
+        N-Triples (`nt`) and N-Quads (`nquads`) sources are streamed with
+        :class:`surf_rdflib.loader.StreamingLoader`, triples without a graph
+        go to `context` or `publicID` if given. These formats also accept
+        `progress`, `chunk_size`, `batch_size`, `processes` and `offset`
+        arguments. Other formats are parsed by rdflib in one go.
+
+        """
+
+        if not source:
+            return False
+
+        if format not in STREAMING_FORMATS:
             self.__graph.parse(source, publicID = publicID, format = format, **args)
             return True
-        
-        return False
+
+        loader = StreamingLoader(self.__graph,
+                                 context = args.get("context") or publicID,
+                                 chunk_size = args.get("chunk_size",
+                                                       DEFAULT_CHUNK_SIZE),
+                                 batch_size = args.get("batch_size",
+                                                       DEFAULT_BATCH_SIZE),
+                                 processes = args.get("processes"),
+                                 progress = args.get("progress"))
+        if hasattr(source, "read"):
+            loader.load(source, args.get("offset", 0))
+        else:
+            stream = create_input_source(source = source, publicID = publicID,
+                                         format = format).getByteStream()
+            try:
+                loader.load(stream, args.get("offset", 0))
+            finally:
+                stream.close()
+        return True
 
     def _clear(self, context = None):
-        """ Clear the triple-store. """
+        """ Clear `context`, the default graph if `context` is None. """
 
-        self.__graph.remove((None, None, None))
+        self.__context_graph(context).remove((None, None, None))
+        self.__graph.commit()
 
     def close(self):
         self.__graph.close(commit_pending_transaction = self.__commit_pending_transaction_on_close)
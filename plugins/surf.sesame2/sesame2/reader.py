@@ -36,9 +36,11 @@
 __author__ = 'Cosmin Basca'
 
 
-from surf.util import json_to_rdflib
+from surf.plugin.compression import HTTPCompression
 from surf.plugin.query_reader import RDFQueryReader
+from surf.plugin.results import collect_columns
 from allegro import Allegro
+from sesame2 import ConnectionPool, DEFAULT_POOL_SIZE, DEFAULT_IDLE_TIMEOUT
 
 class ReaderPlugin(RDFQueryReader):
     def __init__(self, *args, **kwargs):
@@ -49,6 +51,13 @@ class ReaderPlugin(RDFQueryReader):
         self.__repository_path = kwargs['repository_path'] if 'repository_path' in kwargs else ''
         self.__repository = kwargs['repository'] if 'repository' in kwargs else None
         self.__use_allegro_extensions = kwargs['use_allegro_extensions'] if 'use_allegro_extensions' in kwargs else False
+        self.__pool = ConnectionPool(self.__server, self.__port,
+                                     max_size = int(kwargs.get('pool_size', DEFAULT_POOL_SIZE)),
+                                     idle_timeout = float(kwargs.get('pool_idle_timeout', DEFAULT_IDLE_TIMEOUT)))
+        self.__compression = HTTPCompression.from_kwargs(kwargs)
+        self.__allegro = Allegro(self.__server, self.__port, self.__root_path,
+                                 self.__repository_path, pool = self.__pool,
+                                 compression = self.__compression)
 
         self.log.info('INIT: %s, %s, %s, %s' % (self.server, 
                                                 self.port, 
@@ -68,9 +77,20 @@ class ReaderPlugin(RDFQueryReader):
     repository_path = property(lambda self: self.__repository_path)
     repository = property(lambda self: self.__repository)
     use_allegro_extensions = property(lambda self: self.__use_allegro_extensions)
+    pool = property(lambda self: self.__pool)
+    compression = property(lambda self: self.__compression)
 
     def _to_table(self, result):
-        return result
+        # Callers may run further queries while going through the rows (see
+        # RDFQueryReader.get_by), read them all so that the pooled
+        # connection is released first.
+        return list(result)
+
+    def _to_columns(self, result):
+        # Rows are parsed while they are read from the response, they can
+        # only be iterated over once.
+        result = collect_columns(result)
+        return result.variables, result.columns
 
     def _ask(self, result):
         '''
@@ -79,29 +99,21 @@ class ReaderPlugin(RDFQueryReader):
         return result
 
     def get_allegro(self):
-        return Allegro(self.server, self.port, self.root_path, 
-                       self.repository_path)
+        return self.__allegro
 
     # execute
     def _execute(self, query):
         q_string = unicode(query)
-        result = self.execute_sparql(q_string)
-
-        if type(result) == bool:
-            return result
-
-        converted = []
-        for binding in result["results"]["bindings"]:
-            rdf_item = {}
-            for key, obj in binding.items():
-                try:
-                    rdf_item[key] = json_to_rdflib(obj)
-                except ValueError:
-                    continue
-
-            converted.append(rdf_item)
-
-        return converted
+        try:
+            self.log.debug(q_string)
+            # SPARQL XML results are converted to rdflib terms while the
+            # response is read, there is no need for a JSON intermediate.
+            return self.get_allegro().sparql_query(self.repository,
+                                                   q_string,
+                                                   infer = self.inference,
+                                                   format = 'sparql')
+        except Exception, e:
+            self.log.exception("Exception on query")
 
     def execute_sparql(self, query, format='JSON'):
         try:
@@ -114,5 +126,5 @@ class ReaderPlugin(RDFQueryReader):
             self.log.exception("Exception on query")
 
     def close(self):
-        pass
+        self.__pool.close()
 
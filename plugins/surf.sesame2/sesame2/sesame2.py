@@ -37,169 +37,270 @@ __author__ = 'Cosmin Basca'
 
 import httplib
 import logging
+import socket
+import threading
+import time
+from StringIO import StringIO
+from types import GeneratorType
 from urllib import urlencode
-from xml.dom.minidom import parseString, getDOMImplementation
+from xml.sax.saxutils import XMLGenerator
 try:
     from json import loads
 except Exception, e:
     from simplejson import loads
 
 from surf.rdf import BNode, ConjunctiveGraph, Graph, Literal, Namespace, URIRef
+from surf.plugin.compression import HTTPCompression
+from surf.plugin.results import XMLResultReader
+
+log = logging.getLogger(__name__)
+
+def iter_sparql_xml(response):
+    """ Return a :class:`surf.plugin.results.XMLResultReader` over the SPARQL
+    XML ``response``, a string or a file-like object. Iterating over it yields
+    binding rows as they are parsed. """
+
+    if isinstance(response, basestring):
+        response = StringIO(response)
+    return XMLResultReader(response)
 
 def parse_sparql_xml(response):
-        def get_text(node):
-            t = ""
-            for n in node.childNodes:
-                if n.nodeType == n.TEXT_NODE:
-                    t += n.nodeValue
-            return t
-
-        def get_binding(node):
-            cnt = None
-            for cn in node.childNodes:
-                if cn.nodeType == cn.ELEMENT_NODE:
-                    cnt = cn
-                    break
-            if cnt:
-                txt = get_text(cnt)
-                if cnt.nodeName == 'uri':
-                    return URIRef(txt)
-                elif cnt.nodeName == 'literal':
-                    return Literal(txt)
-                elif cnt.nodeName == 'bnode':
-                    return BNode(txt)
-            else:
-                return None
-
-        #print 'response ,',response
+    """ Parse the SPARQL XML ``response``, a string or a file-like object.
+
+    Return an iterator over the binding rows for **SELECT** results, rows
+    are parsed as the iterator is consumed, and a `bool` for **ASK**
+    results.
+
+    """
+
+    try:
+        reader = iter_sparql_xml(response)
+    except SyntaxError, e:
+        log.error('NOT XML Response: %s', e)
+        raise
+    if reader.boolean is not None:
+        return reader.boolean
+    return iter(reader)
+
+class StreamedRows(object):
+    """ Iterator over binding rows still being read from an HTTP response.
 
+    ``finish`` is called once, with `True` when all rows were read and with
+    `False` when the iterator is closed, garbage collected or fails first,
+    so that the connection the response is read from can be released.
+
+    """
+
+    def __init__(self, rows, finish):
+        self.__rows = rows
+        self.__finish = finish
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.__finish is None:
+            raise StopIteration
         try:
-            doc = parseString(response)
-            #head = doc.getElementsByTagName('head')[0]
-            #headers = []
-            #for h in head.childNodes:
-            #    if h.nodeType == h.ELEMENT_NODE:
-            #        headers.append(h.getAttribute('name'))
-            results_nodes = doc.getElementsByTagName('results')
-            if results_nodes:
-                results = results_nodes[0]
-                res_list = []
-                for result in results.childNodes:
-                    if result.nodeType == result.ELEMENT_NODE:
-                        res = {}
-                        for binding in result.childNodes:
-                            if binding.nodeType == binding.ELEMENT_NODE:
-                                res[binding.getAttribute('name')] = get_binding(binding)
-                        res_list.append(res)
-                return res_list
-            else:
-                boolean = doc.getElementsByTagName('boolean')[0]
-                value = boolean.childNodes[0].nodeValue
-                return {'false': False, 'true': True}[value]
+            return self.__rows.next()
+        except StopIteration:
+            self.__done(True)
+            raise
         except:
-            print 'NOT XML Response: %s' % response
-            return []
+            self.__done(False)
+            raise
+
+    def __done(self, complete):
+        finish, self.__finish = self.__finish, None
+        if finish is not None:
+            finish(complete)
+
+    def close(self):
+        """ Stop reading rows, the rest of the response is discarded. """
+
+        self.__done(False)
+
+    def __del__(self):
+        self.close()
 
-'''
-represents an RDF Transaction object
-'''
 class RDFTransaction(object):
+    """ An RDF transaction in Sesame's `application/x-rdftransaction` format.
+
+    Operations are serialized as they are added, with a streaming
+    :class:`xml.sax.saxutils.XMLGenerator`, so the whole document is never
+    held as a DOM tree. A ``None`` context stands for the default (null)
+    context, ``None`` subject, predicate or object in :meth:`remove_triple`
+    are wildcards.
+
+    """
+
     mime = 'application/x-rdftransaction'
 
     def __init__(self):
-        impl = getDOMImplementation()
-        self.transaction = impl.createDocument(None, 'transaction', None)
-        self.root = self.transaction.documentElement
+        self.__buffer = StringIO()
+        self.__writer = XMLGenerator(self.__buffer, 'utf-8')
+        self.__writer.startDocument()
+        self.__writer.startElement('transaction', {})
+        self.__operations = 0
+
+    def __len__(self):
+        """ Return the number of operations in the transaction. """
+
+        return self.__operations
+
+    def _element(self, name, text = None, attributes = {}):
+        self.__writer.startElement(name, attributes)
+        if text is not None:
+            self.__writer.characters(unicode(text))
+        self.__writer.endElement(name)
 
     def _rdf_node(self, entity):
-        node = None
-        if type(entity) is URIRef:
-            node = self.transaction.createElement('uri')
-            node.appendChild(self.transaction.createTextNode(unicode(entity)))
-        elif type(entity) is BNode:
-            node = self.transaction.createElement('bnode')
-            node.appendChild(self.transaction.createTextNode(unicode(entity)))
-        elif type(entity) is Literal:
-            node = self.transaction.createElement('literal')
-            node.appendChild(self.transaction.createTextNode(unicode(entity)))
-            if entity.lang:
-                node.setAttribute('xml:lang', entity.lang)
+        if entity is None:
+            self._element('null')
+        elif isinstance(entity, URIRef):
+            self._element('uri', entity)
+        elif isinstance(entity, BNode):
+            self._element('bnode', entity)
+        elif isinstance(entity, Literal):
+            attributes = {}
+            if entity.language:
+                attributes['xml:lang'] = entity.language
             if entity.datatype:
-                node.setAttribute('datatype', entity.datatype)
-        return node
+                attributes['datatype'] = unicode(entity.datatype)
+            self._element('literal', entity, attributes)
+
+    def _contexts(self, context):
+        self.__writer.startElement('contexts', {})
+        self._rdf_node(context)
+        self.__writer.endElement('contexts')
+
+    def _operation(self, name, s, p, o, context):
+        self.__writer.startElement(name, {})
+        self._rdf_node(s)
+        self._rdf_node(p)
+        self._rdf_node(o)
+        self._contexts(context)
+        self.__writer.endElement(name)
+        self.__operations += 1
 
     def add_triple(self, s, p, o, context = None):
-        try:
-            node = self.transaction.createElement('add')
-            node.appendChild(self._rdf_node(s))
-            node.appendChild(self._rdf_node(p))
-            node.appendChild(self._rdf_node(o))
-            if context:
-                node.appendChild(self.transaction.createTextNode(unicode(context)))
-            self.root.appendChild(node)
-        except:
-            pass
+        self._operation('add', s, p, o, context)
+
+    def remove_triple(self, s = None, p = None, o = None, context = None):
+        self._operation('remove', s, p, o, context)
 
     def add(self, graph, context = None):
-        try:
-            node = self.transaction.createElement('add')
-            for s, p, o in graph:
-                node.appendChild(self._rdf_node(s))
-                node.appendChild(self._rdf_node(p))
-                node.appendChild(self._rdf_node(o))
-                if context:
-                    node.appendChild(self.transaction.createTextNode(unicode(context)))
-            self.root.appendChild(node)
-        except:
-            pass
+        for s, p, o in graph:
+            self._operation('add', s, p, o, context)
 
     def remove(self, graph, context = None):
-        try:
-            node_name = 'removeFromNamedContext' if context else 'remove'
-            node = self.transaction.createElement(node_name)
-            for s, p, o in graph:
-                node.appendChild(self._rdf_node(s))
-                node.appendChild(self._rdf_node(p))
-                node.appendChild(self._rdf_node(o))
-                if context:
-                    node.appendChild(self.transaction.createTextNode(unicode(context)))
-            self.root.appendChild(node)
-        except:
-            pass
+        for s, p, o in graph:
+            self._operation('remove', s, p, o, context)
 
     def clear(self, context = None):
-        node = self.transaction.createElement('clear')
-        if context:
-            node.appendChild(self.transaction.createTextNode(unicode(context)))
-        self.root.appendChild(node)
-
+        self.__writer.startElement('clear', {})
+        if context is not None:
+            self._contexts(context)
+        self.__writer.endElement('clear')
+        self.__operations += 1
 
     def add_namespace(self, **namespaces):
         for prefix in namespaces:
-            node = self.transaction.createElement('setNamespace')
-            node.setAttribute('prefix', prefix)
-            node.setAttribute('name', unicode(namespaces[prefix]))
-            self.root.appendChild(node)
+            self._element('setNamespace', attributes = {'prefix' : prefix,
+                                                        'name' : unicode(namespaces[prefix])})
+            self.__operations += 1
 
     def remove_namespace(self, *namespaces):
         for prefix in namespaces:
-            node = self.transaction.createElement('removeNamespace')
-            node.setAttribute('prefix', prefix)
-            self.root.appendChild(node)
+            self._element('removeNamespace', attributes = {'prefix' : prefix})
+            self.__operations += 1
 
     def __str__(self):
-        self.xml()
+        return self.xml()
 
     def xml(self):
-        return self.transaction.toxml()
+        return self.__buffer.getvalue() + '</transaction>'
 
 
 class Sesame2Exception(Exception):
     def __init__(self, response):
         self._response = response
+        # Read now, the connection is closed once the exception is raised.
+        self._body = response.read()
 
     def __str__(self):
-        return 'Sesame 2 exception, response = [%d, %s, %s]' % (self._response.status, self._response.reason, self._response.read())
+        return 'Sesame 2 exception, response = [%d, %s, %s]' % (self._response.status, self._response.reason, self._body)
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_TIMEOUT = 60
+
+class ConnectionPool(object):
+    """ Thread-safe pool of persistent HTTP/1.1 connections to one server.
+
+    At most ``max_size`` connections are open at a time, :meth:`acquire`
+    blocks until one is released when all are in use. Connections that
+    stayed idle for longer than ``idle_timeout`` seconds are closed instead
+    of being reused.
+
+    """
+
+    def __init__(self, host, port = 80, strict = False,
+                 max_size = DEFAULT_POOL_SIZE,
+                 idle_timeout = DEFAULT_IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.strict = strict
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.__condition = threading.Condition()
+        # (connection, time of release) pairs, most recently released last
+        self.__idle = []
+        self.__open = 0
+
+    def acquire(self):
+        """ Return an idle connection or open a new one. """
+
+        self.__condition.acquire()
+        try:
+            while True:
+                now = time.time()
+                while self.__idle:
+                    connection, released = self.__idle.pop()
+                    if now - released <= self.idle_timeout:
+                        return connection
+                    connection.close()
+                    self.__open -= 1
+
+                if self.__open < self.max_size:
+                    self.__open += 1
+                    return httplib.HTTPConnection(self.host, self.port,
+                                                  self.strict)
+
+                self.__condition.wait()
+        finally:
+            self.__condition.release()
+
+    def release(self, connection):
+        """ Return ``connection`` to the pool. """
+
+        self.__condition.acquire()
+        try:
+            self.__idle.append((connection, time.time()))
+            self.__condition.notify()
+        finally:
+            self.__condition.release()
+
+    def close(self):
+        """ Close all idle connections. """
+
+        self.__condition.acquire()
+        try:
+            for connection, _ in self.__idle:
+                connection.close()
+            self.__open -= len(self.__idle)
+            self.__idle = []
+        finally:
+            self.__condition.release()
 
 class Sesame2(httplib.HTTPConnection):
     url = {
@@ -242,9 +343,13 @@ class Sesame2(httplib.HTTPConnection):
         'DESCRIBE'  : ['xml', 'n3']
     }
 
-    def __init__(self, host, port = 80, root_path = '/sesame', strict = False):
+    def __init__(self, host, port = 80, root_path = '/sesame', strict = False,
+                 pool = None, compression = None):
         httplib.HTTPConnection.__init__(self, host, port, strict)
         self.root_path = root_path
+        self.pool = pool
+        # Identity encoding, still counts the traffic.
+        self.compression = compression or HTTPCompression(accept = False)
 
     def __del__(self):
         self.close()
@@ -254,20 +359,22 @@ class Sesame2(httplib.HTTPConnection):
         serializes the response based on the Content-Type or Accept header
         '''
         content_type = response.getheader('Content-type')
-        content = response.read()
 
         format = 'text'
         if isinstance(content_type, str):
             for type, mimetype in Sesame2.response_format.items():
                 if content_type.startswith(mimetype):
                     format = type
-        
+
+        # SPARQL XML results are parsed straight from the response stream.
+        if format in ['sparql']:
+            return parse_sparql_xml(response)
+
+        content = response.read()
         ser_content = content
         if format in ['nt', 'xml', 'n3', 'turtle']:
             graph = ConjunctiveGraph()
             ser_content = graph.parse(data = content, format = format)
-        elif format in ['sparql']:
-            ser_content = parse_sparql_xml(content)
         elif format in ['sparql+json']:
             ser_content = loads(content)
         return ser_content
@@ -278,13 +385,77 @@ class Sesame2(httplib.HTTPConnection):
         params = urlencode(params)
         url = '%s?%s' % (url, params) if len(params) > 0 else url
 
-        self.connect() # Re-open connection if it was closed.
-        self.request(method, url, body, headers)
-        response = self.getresponse()
+        headers = dict(headers)
+        headers.update(self.compression.request_headers())
+        body, content_encoding = self.compression.encode_body(body)
+        if content_encoding:
+            headers['Content-Encoding'] = content_encoding
+
+        if self.pool is None:
+            self.connect() # Re-open connection if it was closed.
+            response = self.__send(self, method, url, body, headers)
+            return self.__result(self, response,
+                                 self.__handle_response(response), None)
+
+        connection = self.pool.acquire()
+        try:
+            response = self.__send(connection, method, url, body, headers)
+            result = self.__handle_response(response)
+        except:
+            connection.close()
+            self.pool.release(connection)
+            raise
+        return self.__result(connection, response, result, self.pool.release)
+
+    def __result(self, connection, response, result, release):
+        """ Return ``result``, deserialized from ``response``.
+
+        ``release`` is called with ``connection`` once the response is read,
+        for SPARQL XML results that is when the returned rows are consumed.
+
+        """
+
+        def finish(complete):
+            try:
+                if complete:
+                    # Drain the body so the connection can be reused.
+                    response.read()
+                else:
+                    connection.close()
+            finally:
+                if release is not None:
+                    release(connection)
+
+        if isinstance(result, GeneratorType):
+            return StreamedRows(result, finish)
+        finish(True)
+        return result
+
+    def __send(self, connection, method, url, body, headers):
+        """ Send request over ``connection`` and return the response.
+
+        A kept-alive connection may have been closed by the server while
+        idle, in that case the request is sent again over a new socket.
+
+        """
+
+        reused = connection.sock is not None
+        try:
+            connection.request(method, url, body, headers)
+            return connection.getresponse()
+        except (socket.error, httplib.HTTPException):
+            if not reused:
+                raise
+            connection.close()
+            connection.request(method, url, body, headers)
+            return connection.getresponse()
+
+    def __handle_response(self, response):
         if response.status in [200, 204]:
-            return self.__deserialize(response)
+            content_encoding = response.getheader('Content-Encoding')
+            return self.__deserialize(self.compression.decode_response(response,
+                                                                       content_encoding))
         else:
-            print response.read()
             raise Sesame2Exception(response)
 
     def protocol(self):
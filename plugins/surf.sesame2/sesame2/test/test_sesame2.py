@@ -1,5 +1,8 @@
 """ Module for sesame2 plugin tests. """
 
+import BaseHTTPServer
+import SocketServer
+import threading
 from unittest import TestCase
 
 from rdflib import URIRef
@@ -35,3 +38,153 @@ class Sesame2TestMixin(object):
 
 class StandardPluginTest(TestCase, Sesame2TestMixin, PluginTestMixin):
     pass
+
+_RESULTS = """<?xml version="1.0"?>
+<sparql xmlns="http://www.w3.org/2005/sparql-results#">
+  <head><variable name="s"/><variable name="p"/><variable name="v"/></head>
+  <results>%s</results>
+</sparql>""" % "".join(["""<result>
+    <binding name="s"><uri>http://s%d</uri></binding>
+    <binding name="p"><uri>http://p</uri></binding>
+    <binding name="v"><uri>http://v</uri></binding>
+  </result>""" % i for i in range(3)])
+
+class _ResultsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Answers every request with the same SPARQL XML result. """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/sparql-results+xml")
+        self.send_header("Content-Length", str(len(_RESULTS)))
+        self.end_headers()
+        self.wfile.write(_RESULTS)
+
+    def log_message(self, *args):
+        pass
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class TestSesame2(TestCase):
+    """ Tests for sesame2 plugin. """
+
+    def test_parse_sparql_xml(self):
+        """ Test that parse_sparql_xml keeps literal language and datatype. """
+
+        from sesame2.sesame2 import parse_sparql_xml
+        from surf.rdf import Literal
+
+        data = """<?xml version="1.0"?>
+<sparql xmlns="http://www.w3.org/2005/sparql-results#">
+  <head><variable name="s"/><variable name="v"/></head>
+  <results>
+    <result>
+      <binding name="s"><uri>http://s1</uri></binding>
+      <binding name="v"><literal xml:lang="en">name</literal></binding>
+    </result>
+    <result>
+      <binding name="v"><literal datatype="http://www.w3.org/2001/XMLSchema#integer">42</literal></binding>
+    </result>
+  </results>
+</sparql>"""
+
+        rows = list(parse_sparql_xml(data))
+        self.assertEquals(rows, [{"s" : URIRef("http://s1"),
+                                  "v" : Literal("name", lang="en")},
+                                 {"v" : Literal(42)}])
+        self.assertEquals(rows[1]["v"].toPython(), 42)
+
+        data = """<?xml version="1.0"?>
+<sparql xmlns="http://www.w3.org/2005/sparql-results#">
+  <head></head><boolean>false</boolean>
+</sparql>"""
+        self.assertEquals(parse_sparql_xml(data), False)
+        self.assertRaises(SyntaxError, parse_sparql_xml, "NOT XML")
+
+    def test_streamed_rows(self):
+        """ Test that StreamedRows reports whether all rows were read. """
+
+        from sesame2.sesame2 import StreamedRows
+
+        finished = []
+        rows = StreamedRows(iter([{"s" : 1}, {"s" : 2}]), finished.append)
+        self.assertEquals(list(rows), [{"s" : 1}, {"s" : 2}])
+        self.assertEquals(list(rows), [])
+        self.assertEquals(finished, [True])
+
+        finished = []
+        rows = StreamedRows(iter([{"s" : 1}, {"s" : 2}]), finished.append)
+        self.assertEquals(rows.next(), {"s" : 1})
+        rows.close()
+        self.assertEquals(list(rows), [])
+        del rows
+        self.assertEquals(finished, [False])
+
+    def test_connection_pool(self):
+        """ Test that ConnectionPool reuses released connections. """
+
+        from sesame2.sesame2 import ConnectionPool
+
+        pool = ConnectionPool("localhost", 6789, max_size = 2)
+        first = pool.acquire()
+        second = pool.acquire()
+        self.assertNotEqual(first, second)
+
+        pool.release(first)
+        self.assertTrue(pool.acquire() is first)
+
+        # Connections idle for longer than idle_timeout are not reused.
+        pool.release(second)
+        pool.idle_timeout = -1
+        self.assertFalse(pool.acquire() is second)
+
+    def test_get_by_single_connection(self):
+        """ Test that get_by with nested queries works with pool_size=1. """
+
+        server = _Server(("127.0.0.1", 0), _ResultsHandler)
+        thread = threading.Thread(target = server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        store = surf.Store(reader = "sesame2", server = "127.0.0.1",
+                           port = server.server_address[1], root_path = "",
+                           repository = "test", pool_size = 1)
+        results = []
+        reader = threading.Thread(target = lambda: results.extend(
+            store.reader.get_by({"full" : True, "only_direct" : True})))
+        reader.daemon = True
+        reader.start()
+        reader.join(5)
+        server.shutdown()
+
+        self.assertFalse(reader.isAlive())
+        self.assertEquals([subject for subject, _ in results],
+                          [URIRef("http://s%d" % i) for i in range(3)])
+        self.assertEquals(results[0][1]["direct"].keys(),
+                          [URIRef("http://p")])
+
+    def test_rdf_transaction(self):
+        """ Test RDFTransaction serialization. """
+
+        from xml.etree import cElementTree as ElementTree
+        from sesame2.sesame2 import RDFTransaction
+        from surf.rdf import Literal
+
+        s, p = URIRef("http://s1"), URIRef("http://p1")
+        context = URIRef("http://c1")
+        transaction = RDFTransaction()
+        transaction.remove_triple(s = s, context = context)
+        transaction.add_triple(s, p, Literal(u"\u00e9t\u00e9 <", lang = "fr"))
+        self.assertEquals(len(transaction), 2)
+
+        root = ElementTree.fromstring(transaction.xml())
+        self.assertEquals([op.tag for op in root], ["remove", "add"])
+        remove, add = root
+        self.assertEquals([node.tag for node in remove],
+                          ["uri", "null", "null", "contexts"])
+        self.assertEquals(remove[3][0].text, "http://c1")
+        self.assertEquals(add[2].text, u"\u00e9t\u00e9 <")
+        self.assertEquals(add[2].get("{http://www.w3.org/XML/1998/namespace}lang"), "fr")
+        self.assertEquals(add[3][0].tag, "null")
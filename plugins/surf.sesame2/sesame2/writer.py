@@ -36,8 +36,10 @@
 __author__ = 'Cosmin Basca'
 
 
+from surf.plugin.compression import HTTPCompression
 from surf.plugin.writer import RDFWriter
 from allegro import Allegro
+from sesame2 import ConnectionPool, RDFTransaction, DEFAULT_POOL_SIZE, DEFAULT_IDLE_TIMEOUT
 
 from surf.rdf import BNode, Literal, URIRef
 from reader import ReaderPlugin
@@ -52,6 +54,10 @@ class WriterPlugin(RDFWriter):
             self.__repository_path = self.reader.repository_path
             self.__repository = self.reader.repository
             self.__use_allegro_extensions = self.reader.use_allegro_extensions
+            # Share the reader's kept-alive connections.
+            self.__pool = self.reader.pool
+            self.__own_pool = False
+            self.__compression = self.reader.compression
 
         else:
             self.__server = kwargs['server'] if 'server' in kwargs else 'localhost'
@@ -60,6 +66,11 @@ class WriterPlugin(RDFWriter):
             self.__repository_path = kwargs['repository_path'] if 'repository_path' in kwargs else ''
             self.__repository = kwargs['repository'] if 'repository' in kwargs else None
             self.__use_allegro_extensions = kwargs['use_allegro_extensions'] if 'use_allegro_extensions' in kwargs else False
+            self.__pool = ConnectionPool(self.__server, self.__port,
+                                         max_size = int(kwargs.get('pool_size', DEFAULT_POOL_SIZE)),
+                                         idle_timeout = float(kwargs.get('pool_idle_timeout', DEFAULT_IDLE_TIMEOUT)))
+            self.__own_pool = True
+            self.__compression = HTTPCompression.from_kwargs(kwargs)
 
             self.log.info('INIT: %s, %s, %s, %s' % (self.server, 
                                                     self.port, 
@@ -78,44 +89,65 @@ class WriterPlugin(RDFWriter):
     root_path = property(lambda self: self.__root_path)
     repository_path = property(lambda self: self.__repository_path)
     repository = property(lambda self: self.__repository)
+    compression = property(lambda self: self.__compression)
 
     def get_allegro(self):
         return Allegro(self.server, self.port, self.root_path,
-                       self.repository_path)
+                       self.repository_path, pool = self.__pool,
+                       compression = self.__compression)
 
 
     def _save(self, *resources):
-        for resource in resources:
-            allegro = self.get_allegro()
-            s = resource.subject
-            context = resource.context and resource.context.n3() or None
-            allegro.remove_statements(self.__repository, s = s.n3(), context = context)
-            graph = resource.graph()
-            allegro.add_statements(self.__repository,
-                                   graph.serialize(format = 'nt'), update = True, content_type = 'nt', context = context)
+        transaction = RDFTransaction()
+        for context, resources in self.__by_context(resources):
+            for resource in resources:
+                transaction.remove_triple(s = resource.subject, context = context)
+                transaction.add(resource.graph(), context = context)
+        self.__commit(transaction)
 
     def _update(self, *resources):
-        for resource in resources:
-            allegro = self.get_allegro()
-            graph = resource.graph()
-            context = resource.context and resource.context.n3() or None
-            for s, p, o in graph:
-                allegro.remove_statements(self.__repository, s = s.n3(), p = p.n3(), context = context)
-            allegro.add_statements(self.__repository,
-                                   graph.serialize(format = 'nt'), update = True, content_type = 'nt', context = context)
+        transaction = RDFTransaction()
+        for context, resources in self.__by_context(resources):
+            graphs = [resource.graph() for resource in resources]
+            removed = set()
+            for graph in graphs:
+                for s, p, o in graph:
+                    if (s, p) not in removed:
+                        removed.add((s, p))
+                        transaction.remove_triple(s = s, p = p, context = context)
+            for graph in graphs:
+                transaction.add(graph, context = context)
+        self.__commit(transaction)
 
     def _remove(self, *resources, **kwargs):
         inverse = kwargs.get("inverse")
-        
-        allegro = self.get_allegro()
+
+        transaction = RDFTransaction()
+        for context, resources in self.__by_context(resources):
+            for resource in resources:
+                transaction.remove_triple(s = resource.subject, context = context)
+                if inverse:
+                    transaction.remove_triple(o = resource.subject, context = context)
+        self.__commit(transaction)
+
+    def __by_context(self, resources):
+        """ Group `resources` by context, keeping the order of first use. """
+
+        contexts = []
+        grouped = {}
         for resource in resources:
-            context = resource.context and resource.context.n3() or None
-            allegro.remove_statements(self.__repository, 
-                                      s = resource.subject.n3(), context = context)
-            
-            if inverse:
-                allegro.remove_statements(self.__repository, 
-                                          o = resource.subject.n3(), context = context)
+            context = resource.context or None
+            if context not in grouped:
+                contexts.append(context)
+                grouped[context] = []
+            grouped[context].append(resource)
+        return [(context, grouped[context]) for context in contexts]
+
+    def __commit(self, transaction):
+        """ Send all operations of `transaction` in a single request. """
+
+        if len(transaction):
+            self.get_allegro().transaction(self.__repository, transaction)
 
     def _size(self):
         return self.get_allegro().size(self.__repository)
@@ -171,3 +203,7 @@ class WriterPlugin(RDFWriter):
                                            externalFormat = externalFormat,
                                            saveStrings = saveStrings)
         return True
+
+    def close(self):
+        if self.__own_pool:
+            self.__pool.close()
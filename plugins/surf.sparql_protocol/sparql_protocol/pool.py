@@ -0,0 +1,100 @@
+# Copyright (c) 2009, Digital Enterprise Research Institute (DERI),
+# NUI Galway
+# All rights reserved.
+
+# author: Cosmin Basca
+# email: cosmin.basca@gmail.com
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer
+#      in the documentation and/or other materials provided with
+#      the distribution.
+#    * Neither the name of DERI nor the
+#      names of its contributors may be used to endorse or promote  
+#      products derived from this software without specific prior
+#      written permission.
+
+# THIS SOFTWARE IS PROVIDED BY DERI ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL DERI BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+__author__ = 'Cosmin Basca'
+
+import threading
+
+DEFAULT_POOL_SIZE = 4
+
+class ClientPool(object):
+    """ Thread-safe pool of SPARQL clients.
+
+    Clients are created on demand by calling ``factory`` and are checked
+    out for the duration of one query with :meth:`acquire` and
+    :meth:`release`, so threads sharing a plugin never interleave the
+    ``setQuery()`` and ``query()`` calls on one client. At most
+    ``max_size`` clients exist, :meth:`acquire` blocks until one is
+    released when all are in use.
+
+    """
+
+    def __init__(self, factory, max_size = DEFAULT_POOL_SIZE):
+        if max_size < 1:
+            raise ValueError("The pool size must be at least 1")
+
+        self.__factory = factory
+        self.__max_size = max_size
+        self.__condition = threading.Condition()
+        self.__idle = []
+        self.__created = 0
+
+    max_size = property(lambda self: self.__max_size)
+
+    def acquire(self):
+        """ Check out an idle client, creating one if the pool isn't full. """
+
+        self.__condition.acquire()
+        try:
+            while not self.__idle and self.__created >= self.__max_size:
+                self.__condition.wait()
+
+            if self.__idle:
+                return self.__idle.pop()
+
+            self.__created += 1
+        finally:
+            self.__condition.release()
+
+        try:
+            return self.__factory()
+        except:
+            self.__condition.acquire()
+            try:
+                self.__created -= 1
+                self.__condition.notify()
+            finally:
+                self.__condition.release()
+            raise
+
+    def release(self, client):
+        """ Return ``client`` to the pool. """
+
+        self.__condition.acquire()
+        try:
+            self.__idle.append(client)
+            self.__condition.notify()
+        finally:
+            self.__condition.release()
@@ -36,32 +36,156 @@
 __author__ = 'Cosmin Basca'
 
 import sys
+import urllib2
 
-from SPARQLWrapper import SPARQLWrapper, jsonlayer, JSON
+from SPARQLWrapper import SPARQLWrapper, jsonlayer, JSON, XML
 from SPARQLWrapper.SPARQLExceptions import EndPointNotFound, QueryBadFormed
 
 from surf.util import json_to_rdflib
+from pool import ClientPool, DEFAULT_POOL_SIZE
+from surf.plugin.compression import HTTPCompression
 from surf.plugin.query_reader import RDFQueryReader
+from surf.plugin.results import SelectResult, parse_csv, parse_tsv, parse_xml
+from surf.query import SELECT
 from surf.rdf import BNode, ConjunctiveGraph, Literal, URIRef
 
 class SparqlReaderException(Exception): pass
 
+# Accepted values of the results_format and bulk_results_format arguments
+# and the media types requested for them.
+RESULTS_FORMATS = {'json' : 'application/sparql-results+json',
+                   'xml'  : 'application/sparql-results+xml',
+                   'tsv'  : 'text/tab-separated-values',
+                   'csv'  : 'text/csv'}
+
+_parsers = {'xml' : parse_xml,
+            'tsv' : parse_tsv,
+            'csv' : parse_csv}
+
+# SELECT queries without LIMIT or with a LIMIT at least this high are
+# considered bulk projections.
+BULK_LIMIT = 1000
+
+class CompressingSPARQLWrapper(SPARQLWrapper):
+    """ `SPARQLWrapper` that accepts compressed responses and can compress
+    request bodies, as configured by a
+    :class:`surf.plugin.compression.HTTPCompression` object. """
+
+    def __init__(self, endpoint, return_format, compression):
+        SPARQLWrapper.__init__(self, endpoint, return_format)
+        self.compression = compression
+
+    def _query(self):
+        return self.__open(self._createRequest())
+
+    def stream(self, media_type):
+        """ Run the query requesting results of ``media_type``, return the
+        response decoded as it is read. """
+
+        # SPARQLWrapper adds the output, results and format parameters for
+        # any return format but XML, some endpoints let them override the
+        # Accept header.
+        return_format, self.returnFormat = self.returnFormat, XML
+        try:
+            request = self._createRequest()
+        finally:
+            self.returnFormat = return_format
+        request.add_header("Accept", media_type)
+        return self.__open(request)
+
+    def __open(self, request):
+        try:
+            return open_request(request, self.compression)
+        except urllib2.HTTPError, e:
+            if e.code == 400:
+                raise QueryBadFormed
+            elif e.code == 404:
+                raise EndPointNotFound
+            raise
+
+def open_request(request, compression):
+    """ Send urllib2 ``request`` with compression headers and body, return
+    the response decoded as it is read. """
+
+    for name, value in compression.request_headers().items():
+        request.add_header(name, value)
+
+    if request.has_data():
+        data, encoding = compression.encode_body(request.get_data())
+        request.add_data(data)
+        if encoding:
+            request.add_header("Content-Encoding", encoding)
+
+    response = urllib2.urlopen(request)
+    return compression.decode_response(response,
+                                       response.info().getheader("Content-Encoding"))
+
 class ReaderPlugin(RDFQueryReader):
     def __init__(self, *args, **kwargs):
         RDFQueryReader.__init__(self, *args, **kwargs)
 
         self.__endpoint = kwargs['endpoint'] if 'endpoint' in kwargs else None
-        self.__results_format = JSON
+        self.__results_format = self.__format_arg(kwargs, "results_format",
+                                                  "json")
+        self.__bulk_results_format = self.__format_arg(kwargs,
+                                                       "bulk_results_format",
+                                                       self.__results_format)
 
-        self.__sparql_wrapper = SPARQLWrapper(self.__endpoint, self.__results_format)
-        if kwargs.get("use_keepalive", "").lower().strip() == "true":
-            if hasattr(SPARQLWrapper, "setUseKeepAlive"):
-                self.__sparql_wrapper.setUseKeepAlive()
+        self.__use_keepalive = \
+            kwargs.get("use_keepalive", "").lower().strip() == "true"
+        self.__pool_size = int(kwargs.get("pool_size", DEFAULT_POOL_SIZE))
+        self.__compression = HTTPCompression.from_kwargs(kwargs)
+        self.__pool = ClientPool(self.__create_client, self.__pool_size)
 
     endpoint = property(lambda self: self.__endpoint)
     results_format = property(lambda self: self.__results_format)
+    bulk_results_format = property(lambda self: self.__bulk_results_format)
+    use_keepalive = property(lambda self: self.__use_keepalive)
+    pool_size = property(lambda self: self.__pool_size)
+    compression = property(lambda self: self.__compression)
+
+    def __create_client(self):
+        sparql_wrapper = CompressingSPARQLWrapper(self.__endpoint, JSON,
+                                                  self.__compression)
+        if self.__use_keepalive:
+            if hasattr(SPARQLWrapper, "setUseKeepAlive"):
+                sparql_wrapper.setUseKeepAlive()
+        return sparql_wrapper
+
+    @staticmethod
+    def __format_arg(kwargs, name, default):
+        value = (kwargs.get(name) or default).lower().strip()
+        if value not in RESULTS_FORMATS:
+            raise ValueError("The %s parameter must be one of %s" %
+                             (name, ", ".join(RESULTS_FORMATS)))
+        return value
+
+    def _select_format(self, query):
+        """ Return the results format to request for ``query``.
+
+        **ASK** queries always use JSON, CSV and TSV can't express boolean
+        results. **SELECT** queries that project plain variables without a
+        (small) LIMIT are bulk projections and use `bulk_results_format`,
+        other queries use `results_format`.
+
+        """
+
+        if query.query_type != SELECT:
+            return self.__results_format in ('json', 'xml') \
+                and self.__results_format or 'json'
+
+        limit = query.query_limit
+        plain_vars = [var for var in query.query_vars if var.startswith('?')]
+        if (limit is None or limit >= BULK_LIMIT) \
+                and len(plain_vars) == len(query.query_vars):
+            return self.__bulk_results_format
+
+        return self.__results_format
 
     def _to_table(self, result):
+        if isinstance(result, SelectResult):
+            return result.to_table()
+
         if not isinstance(result, dict):
             return result
 
@@ -81,18 +205,73 @@ class ReaderPlugin(RDFQueryReader):
 
         return converted
 
+    def _to_columns(self, result):
+        if isinstance(result, SelectResult):
+            return result.variables, result.columns
+
+        if not isinstance(result, dict) or not "results" in result \
+                or not "vars" in result.get("head", {}):
+            return RDFQueryReader._to_columns(self, result)
+
+        vars = result["head"]["vars"]
+        bindings = result["results"]["bindings"]
+        columns = []
+        for var in vars:
+            column = []
+            for binding in bindings:
+                obj = binding.get(var)
+                if obj is None:
+                    column.append(None)
+                    continue
+                try:
+                    column.append(json_to_rdflib(obj))
+                except ValueError:
+                    column.append(None)
+            columns.append(column)
+
+        return vars, columns
+
     def _ask(self, result):
         '''
         returns the boolean value of a ASK query
         '''
 
+        if isinstance(result, bool):
+            return result
+
         return result.get("boolean")
 
     def execute_sparql(self, q_string, format = 'JSON'):
         try:
             self.log.debug(q_string)
-            self.__sparql_wrapper.setQuery(q_string)
-            return self.__sparql_wrapper.query().convert()
+            sparql_wrapper = self.__pool.acquire()
+            try:
+                sparql_wrapper.setQuery(q_string)
+                return sparql_wrapper.query().convert()
+            finally:
+                self.__pool.release(sparql_wrapper)
+        except EndPointNotFound, _:
+            raise SparqlReaderException("Endpoint not found"), None, sys.exc_info()[2]
+        except QueryBadFormed, _:
+            raise SparqlReaderException("Bad query: %s" % q_string), None, sys.exc_info()[2]
+        except Exception, e:
+            raise SparqlReaderException("Exception: %s" % e), None, sys.exc_info()[2]
+
+    def __execute_streamed(self, q_string, format):
+        """ Execute query, parse the response as it is read. """
+
+        try:
+            self.log.debug(q_string)
+            sparql_wrapper = self.__pool.acquire()
+            try:
+                sparql_wrapper.setQuery(q_string)
+                response = sparql_wrapper.stream(RESULTS_FORMATS[format])
+                try:
+                    return _parsers[format](response)
+                finally:
+                    response.close()
+            finally:
+                self.__pool.release(sparql_wrapper)
         except EndPointNotFound, _:
             raise SparqlReaderException("Endpoint not found"), None, sys.exc_info()[2]
         except QueryBadFormed, _:
@@ -102,7 +281,11 @@ class ReaderPlugin(RDFQueryReader):
 
     # execute
     def _execute(self, query):
-        return self.execute_sparql(unicode(query))
+        format = self._select_format(query)
+        if format == 'json':
+            return self.execute_sparql(unicode(query))
+
+        return self.__execute_streamed(unicode(query), format)
 
     def close(self):
         pass
@@ -71,3 +71,312 @@ class TestSparqlProtocol(TestCase, SparqlProtocolTestMixin):
             store.add_triple("?s", "?p", "?o")
 
         self.assertRaises(SparqlWriterException, try_add_triple)
+
+    def test_select_format(self):
+        """ Test that results format is chosen per query. """
+
+        store = surf.store.Store(reader = "sparql_protocol",
+                                 results_format = "xml")
+        reader = store.reader
+
+        self.assertEquals(reader._select_format(select("?s")), "xml")
+        self.assertEquals(reader._select_format(select("?s").limit(10)), "xml")
+        self.assertEquals(reader._select_format(select("count(?s)")), "xml")
+        self.assertEquals(reader._select_format(surf.query.ask()), "xml")
+
+        self.assertRaises(ValueError, surf.store.Store,
+                          reader = "sparql_protocol", results_format = "n3")
+
+        store = surf.store.Store(reader = "sparql_protocol",
+                                 bulk_results_format = "tsv")
+        reader = store.reader
+        self.assertEquals(reader._select_format(select("?s")), "tsv")
+        self.assertEquals(reader._select_format(select("?s").limit(10)),
+                          "json")
+
+    def test_client_pool(self):
+        """ Test that ClientPool hands each client to one thread at a time. """
+
+        import threading
+        import time
+        from sparql_protocol.pool import ClientPool
+
+        created = []
+        def factory():
+            created.append(object())
+            return created[-1]
+
+        pool = ClientPool(factory, max_size = 2)
+        in_use = []
+        errors = []
+        def worker():
+            for _ in range(20):
+                client = pool.acquire()
+                try:
+                    if client in in_use:
+                        errors.append(client)
+                    in_use.append(client)
+                    time.sleep(0.001)
+                    in_use.remove(client)
+                finally:
+                    pool.release(client)
+
+        threads = [threading.Thread(target = worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(errors, [])
+        self.assertEquals(len(created), 2)
+        self.assertRaises(ValueError, ClientPool, factory, 0)
+
+    def test_submit_stand_in_endpoint(self):
+        """ Test concurrent background queries against a local endpoint. """
+
+        from surf.executor import wait
+
+        def respond(query):
+            return 200, ('{"head" : {"vars" : ["q"]}, "results" : '
+                         '{"bindings" : [{"q" : {"type" : "literal", '
+                         '"value" : "%s"}}]}}' % query)
+
+        server, endpoint = _start_endpoint(respond)
+        try:
+            store = surf.store.Store(reader = "sparql_protocol",
+                                     endpoint = endpoint, pool_size = 3)
+            queries = ["ASK { <http://s%d> ?p ?o }" % i for i in range(20)]
+            futures = [store.submit(store.execute_sparql, query)
+                       for query in queries]
+            results = wait(futures, 30)
+            values = [result["results"]["bindings"][0]["q"]["value"]
+                      for result in results]
+            self.assertEquals(values, queries)
+            store.close()
+        finally:
+            server.shutdown()
+
+    def test_streamed_results(self):
+        """ Test that streamed results go through the pooled clients. """
+
+        from urlparse import parse_qs, urlparse
+        from sparql_protocol import reader
+        from sparql_protocol.reader import CompressingSPARQLWrapper
+
+        streamed = []
+        stream = CompressingSPARQLWrapper.stream
+        def counting_stream(wrapper, media_type):
+            streamed.append((wrapper, media_type))
+            return stream(wrapper, media_type)
+
+        requests = []
+        open_request = reader.open_request
+        def recording_open_request(request, compression):
+            requests.append(request)
+            return open_request(request, compression)
+
+        server, endpoint = _start_endpoint(
+            lambda query: (200, "?s\n<http://s1>\n<http://s2>\n"))
+        CompressingSPARQLWrapper.stream = counting_stream
+        reader.open_request = recording_open_request
+        try:
+            store = surf.store.Store(reader = "sparql_protocol",
+                                     endpoint = endpoint, pool_size = 1,
+                                     bulk_results_format = "tsv")
+            rows = store.reader._to_table(store.execute(select("?s")))
+            rows += store.reader._to_table(store.execute(select("?s")))
+        finally:
+            CompressingSPARQLWrapper.stream = stream
+            reader.open_request = open_request
+            server.shutdown()
+
+        # Format parameters in the URL would override the Accept header.
+        params = parse_qs(urlparse(requests[0].get_full_url()).query)
+        self.assertEquals(params.keys(), ["query"])
+        self.assertEquals(requests[0].get_header("Accept"),
+                          "text/tab-separated-values")
+
+        self.assertEquals([row["s"] for row in rows],
+                          [URIRef("http://s1"), URIRef("http://s2")] * 2)
+        self.assertEquals(len(streamed), 2)
+        self.assertTrue(streamed[0][0] is streamed[1][0])
+        self.assertEquals(streamed[0][1], "text/tab-separated-values")
+
+    def test_compression(self):
+        """ Test that gzip encoded responses are decoded and counted. """
+
+        from cStringIO import StringIO
+        from gzip import GzipFile
+
+        body = ('{"head" : {"vars" : ["s"]}, "results" : {"bindings" : [%s]}}'
+                % ", ".join(['{"s" : {"type" : "uri", "value" : "http://s"}}']
+                            * 100))
+        buffer = StringIO()
+        gzip_file = GzipFile(fileobj = buffer, mode = "wb")
+        gzip_file.write(body)
+        gzip_file.close()
+
+        server, endpoint = _start_endpoint(
+            lambda query: (200, buffer.getvalue(), ("Content-Encoding", "gzip")))
+        try:
+            store = surf.store.Store(reader = "sparql_protocol",
+                                     endpoint = endpoint)
+            result = store.execute(select("?s").limit(10))
+        finally:
+            server.shutdown()
+
+        self.assertEquals(len(result["results"]["bindings"]), 100)
+        stats = store.reader.compression.stats()
+        self.assertEquals(stats["bytes_received"], len(buffer.getvalue()))
+        self.assertEquals(stats["bytes_received_uncompressed"], len(body))
+
+    def test_delete_queries(self):
+        """ Test that deletes match bound terms instead of FILTER scans. """
+
+        received = []
+        def respond(query):
+            received.append(query)
+            return 200, "{}"
+
+        s, p = URIRef("http://s"), URIRef("http://p")
+        server, endpoint = _start_endpoint(respond)
+        try:
+            store = surf.store.Store(reader = "sparql_protocol",
+                                     writer = "sparql_protocol",
+                                     endpoint = endpoint)
+            store.remove_triple(s, p, Literal("o"))
+            store.remove_triple(s, p)
+
+            store = surf.store.Store(reader = "sparql_protocol",
+                                     writer = "sparql_protocol",
+                                     endpoint = endpoint,
+                                     use_filter_deletes = "true")
+            store.remove_triple(s, p)
+        finally:
+            server.shutdown()
+
+        self.assertEquals(received[0].split(),
+                          ["DELETE", "DATA", "{", "<http://s>", "<http://p>",
+                           '"o"', "}"])
+        self.assertEquals(received[1].split(),
+                          ["DELETE", "{", "<http://s>", "<http://p>", "?o0",
+                           "}", "WHERE", "{", "<http://s>", "<http://p>",
+                           "?o0", "}"])
+        self.assertTrue("FILTER" in received[2])
+
+    def _save_persons(self, endpoint, count, **kwargs):
+        store = surf.store.Store(reader = "sparql_protocol",
+                                 writer = "sparql_protocol",
+                                 endpoint = endpoint, **kwargs)
+        session = surf.Session(store)
+        Person = session.get_class(surf.ns.FOAF.Person)
+        persons = []
+        for i in range(count):
+            person = session.get_resource("http://p%d" % i, Person)
+            person.foaf_name = "P%d" % i
+            persons.append(person)
+        store.save(*persons)
+        store.close()
+        return store
+
+    def test_write_chunks(self):
+        """ Test that writes are split in chunks, DELETE before INSERT. """
+
+        received = []
+        def respond(query):
+            received.append(query)
+            return 200, "{}"
+
+        server, endpoint = _start_endpoint(respond)
+        try:
+            # Two triples per person, rdf:type and foaf:name.
+            self._save_persons(endpoint, 5, max_triples_per_request = 4)
+        finally:
+            server.shutdown()
+
+        self.assertEquals(len(received), 6)
+        for delete, insert in zip(received[::2], received[1::2]):
+            self.assertTrue(delete.startswith("DELETE"))
+            self.assertTrue(insert.startswith("INSERT"))
+            subjects = [s for s in ("p%d>" % i for i in range(5))
+                        if s in insert]
+            self.assertEquals(subjects, [s for s in subjects if s in delete])
+            self.assertTrue(len(subjects) <= 2)
+
+    def test_write_back_off(self):
+        """ Test that chunks rejected with HTTP 413 are split. """
+
+        # Each subject shows up twice in a DELETE, in the template and in
+        # the WHERE pattern.
+        def subjects(query):
+            return query.count(" ?p") / 2
+
+        received = []
+        def respond(query):
+            if subjects(query) > 2:
+                return 413, "Request Entity Too Large"
+            received.append(query)
+            return 200, "{}"
+
+        server, endpoint = _start_endpoint(respond)
+        try:
+            store = self._save_persons(endpoint, 8)
+        finally:
+            server.shutdown()
+
+        deletes = [query for query in received if query.startswith("DELETE")]
+        self.assertEquals(sum([subjects(query) for query in deletes]), 8)
+        self.assertTrue(store.writer.chunk_triples < 16)
+
+        # A single resource can't be split any further.
+        server, endpoint = _start_endpoint(lambda query: (413, ""))
+        try:
+            self.assertRaises(SparqlWriterException, self._save_persons,
+                              endpoint, 2)
+        finally:
+            server.shutdown()
+
+def _start_endpoint(respond):
+    """ Start a local stand-in SPARQL endpoint.
+
+    ``respond(query)`` returns the status, JSON body and optionally extra
+    header pairs for each GET or POST request. Return the server and the endpoint URL.
+
+    """
+
+    import threading
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self._respond(urlparse(self.path).query)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self._respond(self.rfile.read(length))
+
+        def _respond(self, params):
+            response = respond(parse_qs(params)["query"][0])
+            status, body = response[:2]
+            self.send_response(status)
+            self.send_header("Content-Type",
+                             "application/sparql-results+json")
+            for header in response[2:]:
+                self.send_header(*header)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = Server(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target = server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    return server, "http://127.0.0.1:%d/sparql" % server.server_address[1]
@@ -33,12 +33,18 @@
 # -*- coding: utf-8 -*-
 __author__ = 'Cosmin Basca, Adam Gzella'
 
+import socket
 import sys
+import threading
+import urllib2
 
 from SPARQLWrapper import SPARQLWrapper, JSON
 from SPARQLWrapper.SPARQLExceptions import EndPointNotFound, QueryBadFormed, SPARQLWrapperException
 
-from reader import ReaderPlugin
+from pool import ClientPool, DEFAULT_POOL_SIZE
+from reader import CompressingSPARQLWrapper, ReaderPlugin
+from surf.executor import Executor, wait
+from surf.plugin.compression import HTTPCompression
 from surf.plugin.writer import RDFWriter
 from surf.query import Filter, Group, NamedGroup, Union
 from surf.query.update import insert, delete, clear, load
@@ -46,22 +52,72 @@ from surf.rdf import BNode, Literal, URIRef
 
 class SparqlWriterException(Exception): pass
 
+# Default upper bounds for one SPARQL Update request sent by save, update
+# and remove.
+MAX_TRIPLES_PER_REQUEST = 1000
+MAX_REQUEST_BYTES = 1024 * 1024
+
 class WriterPlugin(RDFWriter):
     def __init__(self, reader, *args, **kwargs):
         RDFWriter.__init__(self, reader, *args, **kwargs)
         
         if isinstance(self.reader, ReaderPlugin):
             self.__endpoint = self.reader.endpoint
+            self.__use_keepalive = self.reader.use_keepalive
+            pool_size = self.reader.pool_size
+            self.__compression = self.reader.compression
         else:
             self.__endpoint = kwargs.get("endpoint")
+            self.__use_keepalive = \
+                kwargs.get("use_keepalive", "").lower().strip() == "true"
+            pool_size = int(kwargs.get("pool_size", DEFAULT_POOL_SIZE))
+            self.__compression = HTTPCompression.from_kwargs(kwargs)
 
         self.__combine_queries = kwargs.get("combine_queries")
+        self.__filter_deletes = \
+            str(kwargs.get("use_filter_deletes", "")).lower().strip() == "true"
         self.__results_format = JSON
-
-        self.__sparql_wrapper = SPARQLWrapper(self.__endpoint, self.__results_format)
-        self.__sparql_wrapper.setMethod("POST")
+        self.__max_triples = int(kwargs.get("max_triples_per_request",
+                                            MAX_TRIPLES_PER_REQUEST))
+        self.__max_bytes = int(kwargs.get("max_request_bytes",
+                                          MAX_REQUEST_BYTES))
+        # Lowered when the endpoint rejects or times out on a request,
+        # updated by the executor threads under __chunk_lock.
+        self.__chunk_triples = self.__max_triples
+        self.__chunk_lock = threading.Lock()
+
+        self.__pool = ClientPool(self.__create_client, pool_size)
+        self.__executor = None
+        self.__executor_lock = threading.Lock()
 
     endpoint = property(lambda self: self.__endpoint)
+    compression = property(lambda self: self.__compression)
+    max_triples_per_request = property(lambda self: self.__max_triples)
+    max_request_bytes = property(lambda self: self.__max_bytes)
+    chunk_triples = property(lambda self: self.__chunk_triples)
+
+    def __create_client(self):
+        sparql_wrapper = CompressingSPARQLWrapper(self.__endpoint,
+                                                  self.__results_format,
+                                                  self.__compression)
+        sparql_wrapper.setMethod("POST")
+        if self.__use_keepalive:
+            if hasattr(SPARQLWrapper, "setUseKeepAlive"):
+                sparql_wrapper.setUseKeepAlive()
+        return sparql_wrapper
+
+    def __query(self, query_str, convert = True):
+        """ Send ``query_str`` with a client checked out of the pool. """
+
+        sparql_wrapper = self.__pool.acquire()
+        try:
+            sparql_wrapper.setQuery(query_str)
+            result = sparql_wrapper.query()
+            if convert:
+                return result.convert()
+            return result
+        finally:
+            self.__pool.release(sparql_wrapper)
 
     def __group_by_context(self, resources):
         contexts = {}
@@ -70,27 +126,169 @@ class WriterPlugin(RDFWriter):
             context_group.append(resource)
         
         return contexts
-    
+
     def _save(self, *resources):
-        for context, items in self.__group_by_context(resources).items():
+        def prepare(items, context):
             # Deletes all triples with matching subjects.
-            remove_query = self.__prepare_delete_many_query(items, context)
-            insert_query = self.__prepare_add_many_query(items, context)
-            self.__execute(remove_query, insert_query)
+            return [self.__prepare_delete_subjects_query(items, context),
+                    self.__prepare_add_many_query(items, context)]
+
+        self.__write(prepare, resources)
 
     def _update(self, *resources):
-        for context, items in self.__group_by_context(resources).items():
+        def prepare(items, context):
             # Explicitly enumerates triples for deletion.
-            remove_query = self.__prepare_selective_delete_query(items, context)
-            insert_query = self.__prepare_add_many_query(items, context)
-            self.__execute(remove_query, insert_query)
+            if self.__filter_deletes:
+                remove_query = self.__prepare_selective_delete_query(items, context)
+            else:
+                patterns = []
+                for resource in items:
+                    for p in resource.rdf_direct:
+                        patterns.append((resource.subject, p, None))
+                remove_query = self.__prepare_pattern_delete_query(patterns, context)
+
+            return [remove_query, self.__prepare_add_many_query(items, context)]
+
+        self.__write(prepare, resources)
 
     def _remove(self, *resources, **kwargs):
-        for context, items in self.__group_by_context(resources).items():
+        inverse = kwargs.get("inverse")
+        def prepare(items, context):
             # Deletes all triples with matching subjects.
-            inverse = kwargs.get("inverse")
-            query = self.__prepare_delete_many_query(items, context, inverse)
-            self.__execute(query)
+            return [self.__prepare_delete_subjects_query(items, context, inverse)]
+
+        self.__write(prepare, resources)
+
+    def __write(self, prepare, resources):
+        """ Send the queries built by ``prepare(items, context)`` for
+        `resources`.
+
+        Context groups are independent and are written concurrently, each
+        group is written as a sequence of chunks of whole resources.
+
+        """
+
+        groups = self.__group_by_context(resources).items()
+        if len(groups) == 1:
+            context, items = groups[0]
+            self.__write_group(prepare, items, context)
+            return
+
+        executor = self.__get_executor()
+        wait([executor.submit(self.__write_group, prepare, items, context)
+              for context, items in groups])
+
+    def __get_executor(self):
+        self.__executor_lock.acquire()
+        try:
+            if self.__executor is None:
+                self.__executor = Executor(self.__pool.max_size)
+            return self.__executor
+        finally:
+            self.__executor_lock.release()
+
+    def __write_group(self, prepare, items, context):
+        """ Write `items` of one context in size-bounded chunks.
+
+        The queries for one resource, e.g. its DELETE and INSERT, are
+        always sent together and in order. Chunks rejected as too large
+        (HTTP 413) or timing out are split in halves and retried, and
+        later chunks are made smaller.
+
+        """
+
+        pending = self.__chunk(items)
+        while pending:
+            chunk = pending.pop(0)
+            queries = [unicode(query) for query in prepare(chunk, context)]
+            if self.__combine_queries:
+                queries = ["\n".join(queries)]
+
+            too_large = max([len(query.encode("utf-8"))
+                             for query in queries]) > self.__max_bytes
+            if too_large and len(chunk) > 1:
+                pending[:0] = self.__halve(chunk)
+                continue
+
+            try:
+                self.__send(queries)
+            except Exception, e:
+                if not self.__is_overload(e):
+                    raise
+                if len(chunk) == 1:
+                    raise SparqlWriterException("Exception: %s" % e), None, sys.exc_info()[2]
+
+                self.log.warning("Request too large, splitting: %s" % e)
+                self.__shrink_chunks(self.__triples(chunk) / 2)
+                pending[:0] = self.__halve(chunk)
+                continue
+
+            self.__grow_chunks()
+
+    def __shrink_chunks(self, triples):
+        """ Send at most `triples` triples per request from now on. """
+
+        self.__chunk_lock.acquire()
+        try:
+            self.__chunk_triples = max(1, min(self.__chunk_triples, triples))
+        finally:
+            self.__chunk_lock.release()
+
+    def __grow_chunks(self):
+        """ Recover slowly from earlier back-offs. """
+
+        self.__chunk_lock.acquire()
+        try:
+            if self.__chunk_triples < self.__max_triples:
+                self.__chunk_triples = min(self.__max_triples,
+                                           self.__chunk_triples +
+                                           max(1, self.__chunk_triples / 4))
+        finally:
+            self.__chunk_lock.release()
+
+    def __chunk(self, items):
+        """ Split `items` into lists with at most `chunk_triples` triples. """
+
+        chunks = []
+        chunk, size = [], 0
+        limit = self.__chunk_triples
+        for resource in items:
+            triples = self.__triples([resource])
+            if chunk and size + triples > limit:
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(resource)
+            size += triples
+        if chunk:
+            chunks.append(chunk)
+
+        return chunks
+
+    @staticmethod
+    def __halve(chunk):
+        middle = len(chunk) / 2
+        return [chunk[:middle], chunk[middle:]]
+
+    @staticmethod
+    def __triples(resources):
+        """ Return the triple count of `resources`, at least 1 each. """
+
+        count = 0
+        for resource in resources:
+            count += max(1, sum([len(objs) for objs
+                                 in resource.rdf_direct.values()]))
+        return count
+
+    @staticmethod
+    def __is_overload(exception):
+        """ True if `exception` means the request was too large or slow. """
+
+        if isinstance(exception, urllib2.HTTPError):
+            return exception.code in (408, 413, 504)
+        if isinstance(exception, urllib2.URLError):
+            return isinstance(exception.reason, socket.timeout)
+
+        return isinstance(exception, socket.timeout)
 
     def _size(self):
         """ Return total count of triples, not implemented. """
@@ -121,6 +319,59 @@ class WriterPlugin(RDFWriter):
 
         return query
     
+    def __prepare_delete_subjects_query(self, resources, context, inverse = False):
+        if self.__filter_deletes:
+            return self.__prepare_delete_many_query(resources, context, inverse)
+
+        patterns = [(resource.subject, None, None) for resource in resources]
+        if inverse:
+            patterns.extend([(None, None, resource.subject)
+                             for resource in resources])
+
+        return self.__prepare_pattern_delete_query(patterns, context)
+
+    def __prepare_pattern_delete_query(self, patterns, context = None):
+        """ Return a query deleting triples matching any of `patterns`.
+
+        `patterns` are (s, p, o) tuples where None matches anything. Each
+        pattern is matched with its bound terms in place, instead of
+        filtering a scan of all triples, and gets its own variables so
+        that matches of different patterns don't mix. Fully bound
+        patterns are deleted with DELETE DATA.
+
+        """
+
+        if not [pattern for pattern in patterns if None in pattern]:
+            query = delete(data = True)
+            if context:
+                query.from_(context)
+            query.template(*patterns)
+            return query
+
+        query = delete()
+        if context:
+            query.from_(context)
+
+        clauses = []
+        for i, pattern in enumerate(patterns):
+            triple = tuple([term is None and "?%s%d" % (name, i) or term
+                            for name, term in zip("spo", pattern)])
+            query.template(triple)
+            clauses.append(triple)
+
+        if len(clauses) == 1:
+            where_clause = clauses[0]
+        else:
+            where_clause = Union(clauses)
+
+        if context:
+            named_group = NamedGroup(context)
+            named_group.append(where_clause)
+            where_clause = named_group
+
+        query.where(where_clause)
+        return query
+
     def __prepare_delete_many_query(self, resources, context, inverse = False):
         query = delete()
         if context:
@@ -168,29 +419,23 @@ class WriterPlugin(RDFWriter):
         query.union(*clauses)
         return query        
     
-    def __execute(self, *queries):
-        """ Execute several queries. """
-        
-        translated = [unicode(query) for query in queries]  
-        if self.__combine_queries:
-            translated = ["\n".join(translated)]
-
-        try:
-            for query_str in translated:
-                self.log.debug(query_str)
-                
-                    
-                self.__sparql_wrapper.setQuery(query_str)
-                self.__sparql_wrapper.query()
-
-            return True
+    def __send(self, queries):
+        """ Send query strings one after another. """
 
-        except EndPointNotFound, _:
-            raise SparqlWriterException("Endpoint not found"), None, sys.exc_info()[2]
-        except QueryBadFormed, _:
-            raise SparqlWriterException("Bad query: %s" % query_str), None, sys.exc_info()[2]
-        except Exception, e:
-            raise SparqlWriterException("Exception: %s" % e), None, sys.exc_info()[2]
+        for query_str in queries:
+            self.log.debug(query_str)
+            try:
+                self.__query(query_str, convert = False)
+            except EndPointNotFound, _:
+                raise SparqlWriterException("Endpoint not found"), None, sys.exc_info()[2]
+            except QueryBadFormed, _:
+                raise SparqlWriterException("Bad query: %s" % query_str), None, sys.exc_info()[2]
+            except Exception, e:
+                if self.__is_overload(e):
+                    raise
+                raise SparqlWriterException("Exception: %s" % e), None, sys.exc_info()[2]
+
+        return True
 
     def __add_many(self, triples, context = None):
         self.log.debug("ADD several triples")
@@ -206,8 +451,7 @@ class WriterPlugin(RDFWriter):
         try:
             query_str = unicode(query)
             self.log.debug(query_str)
-            self.__sparql_wrapper.setQuery(query_str)
-            self.__sparql_wrapper.query().convert()
+            self.__query(query_str)
             return True
 
         except EndPointNotFound, notfound:
@@ -228,6 +472,9 @@ class WriterPlugin(RDFWriter):
             #clear
             if s == None and p == None and o == None and context:
                 query = clear().graph(context)
+            elif not self.__filter_deletes:
+                query = self.__prepare_pattern_delete_query([(s, p, o)],
+                                                            context)
             else:
                 if context:
                     query = delete().from_(context)
@@ -247,8 +494,7 @@ class WriterPlugin(RDFWriter):
 
             query_str = unicode(query)
             self.log.debug(query_str)
-            self.__sparql_wrapper.setQuery(query_str)
-            self.__sparql_wrapper.query().convert()
+            self.__query(query_str)
             return True
         except EndPointNotFound, notfound:
             self.log.exception("SPARQL endpoint not found")
@@ -289,12 +535,20 @@ class WriterPlugin(RDFWriter):
 
             query_str = unicode(query)
             self.log.debug(query_str)
-            self.__sparql_wrapper.setQuery(query_str)
-            self.__sparql_wrapper.query().convert()
+            self.__query(query_str)
             return True
 
         return False
 
+    def close(self):
+        self.__executor_lock.acquire()
+        try:
+            executor, self.__executor = self.__executor, None
+        finally:
+            self.__executor_lock.release()
+        if executor:
+            executor.shutdown()
+
     def _clear(self, context = None):
         """ Clear the triple-store. """
 
@@ -0,0 +1,229 @@
+# Copyright (c) 2009, Digital Enterprise Research Institute (DERI),
+# NUI Galway
+# All rights reserved.
+
+# author: Cosmin Basca
+# email: cosmin.basca@gmail.com
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer
+#      in the documentation and/or other materials provided with
+#      the distribution.
+#    * Neither the name of DERI nor the
+#      names of its contributors may be used to endorse or promote
+#      products derived from this software without specific prior
+#      written permission.
+
+# THIS SOFTWARE IS PROVIDED BY DERI ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL DERI BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+__author__ = 'Cosmin Basca'
+
+""" Background execution of store operations.
+
+Each :class:`surf.store.Store` owns an :class:`Executor`, a fixed number of
+worker threads that run submitted calls and hand back :class:`Future`
+objects. Many lookups can be issued at once and collected later without
+dedicating a thread to each of them:
+
+.. code-block:: python
+
+    >>> futures = [person.load_async() for person in people]
+    >>> wait(futures)
+
+"""
+
+import Queue
+import sys
+import threading
+
+DEFAULT_WORKERS = 8
+
+class TimeoutError(Exception):
+    """ Raised by :meth:`Future.result` when the call didn't finish in time. """
+
+    pass
+
+class Future(object):
+    """ The pending result of a call submitted to an :class:`Executor`. """
+
+    def __init__(self):
+        self.__done = threading.Event()
+        self.__lock = threading.Lock()
+        self.__result = None
+        self.__exc_info = None
+        self.__callbacks = []
+
+    def done(self):
+        """ True if the call has finished. """
+
+        return self.__done.isSet()
+
+    def result(self, timeout = None):
+        """ Wait for the call to finish and return its result.
+
+        If the call raised, the exception is raised again here. If
+        ``timeout`` seconds pass first, :class:`TimeoutError` is raised.
+
+        """
+
+        self.__done.wait(timeout)
+        if not self.__done.isSet():
+            raise TimeoutError("The call did not finish in %s seconds" % timeout)
+
+        if self.__exc_info:
+            raise self.__exc_info[0], self.__exc_info[1], self.__exc_info[2]
+
+        return self.__result
+
+    def exception(self, timeout = None):
+        """ Wait for the call to finish and return the exception it raised,
+        or None. """
+
+        try:
+            self.result(timeout)
+        except TimeoutError:
+            raise
+        except Exception, e:
+            return e
+
+        return None
+
+    def add_done_callback(self, callback):
+        """ Call ``callback(future)`` once the call has finished.
+
+        The callback runs in the worker thread, or immediately if the call
+        has already finished.
+
+        """
+
+        self.__lock.acquire()
+        try:
+            if not self.__done.isSet():
+                self.__callbacks.append(callback)
+                return
+        finally:
+            self.__lock.release()
+
+        callback(self)
+
+    def _set_result(self, result, exc_info = None):
+        self.__lock.acquire()
+        try:
+            self.__result = result
+            self.__exc_info = exc_info
+            self.__done.set()
+            callbacks, self.__callbacks = self.__callbacks, []
+        finally:
+            self.__lock.release()
+
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                pass
+
+class Executor(object):
+    """ Run calls on a fixed pool of daemon worker threads.
+
+    Workers are started on the first :meth:`submit`, at most
+    ``max_workers`` calls run at the same time and the rest wait in a
+    queue.
+
+    """
+
+    def __init__(self, max_workers = DEFAULT_WORKERS):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
+        self.__max_workers = max_workers
+        self.__queue = Queue.Queue()
+        self.__lock = threading.Lock()
+        self.__workers = []
+        self.__shutdown = False
+
+    max_workers = property(lambda self: self.__max_workers)
+
+    def submit(self, function, *args, **kwargs):
+        """ Schedule ``function(*args, **kwargs)``, return its :class:`Future`. """
+
+        self.__lock.acquire()
+        try:
+            if self.__shutdown:
+                raise RuntimeError("Cannot submit calls after shutdown")
+
+            if len(self.__workers) < self.__max_workers:
+                worker = threading.Thread(target = self.__work)
+                worker.setDaemon(True)
+                worker.start()
+                self.__workers.append(worker)
+
+            future = Future()
+            self.__queue.put((future, function, args, kwargs))
+            return future
+        finally:
+            self.__lock.release()
+
+    def map(self, function, *iterables):
+        """ Submit ``function`` for each set of arguments, return the list of
+        futures. """
+
+        return [self.submit(function, *args) for args in zip(*iterables)]
+
+    def shutdown(self, wait = True):
+        """ Stop the workers once the already submitted calls are done. """
+
+        self.__lock.acquire()
+        try:
+            if self.__shutdown:
+                return
+            self.__shutdown = True
+            workers = list(self.__workers)
+        finally:
+            self.__lock.release()
+
+        for _ in workers:
+            self.__queue.put(None)
+
+        if wait:
+            for worker in workers:
+                worker.join()
+
+    def __work(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+
+            future, function, args, kwargs = item
+            try:
+                result = function(*args, **kwargs)
+            except Exception:
+                future._set_result(None, sys.exc_info())
+            else:
+                future._set_result(result)
+
+def wait(futures, timeout = None):
+    """ Wait for all ``futures`` and return their results, in order.
+
+    The first exception raised by a call is raised again.
+
+    """
+
+    return [future.result(timeout) for future in futures]
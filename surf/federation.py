@@ -0,0 +1,394 @@
+# Copyright (c) 2009, Digital Enterprise Research Institute (DERI),
+# NUI Galway
+# All rights reserved.
+
+# author: Cosmin Basca
+# email: cosmin.basca@gmail.com
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer
+#      in the documentation and/or other materials provided with
+#      the distribution.
+#    * Neither the name of DERI nor the
+#      names of its contributors may be used to endorse or promote
+#      products derived from this software without specific prior
+#      written permission.
+
+# THIS SOFTWARE IS PROVIDED BY DERI ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL DERI BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+__author__ = 'Cosmin Basca'
+
+""" Query several `stores` as one.
+
+A :class:`FederatedStore` is used like any other :class:`surf.store.Store`,
+but it sends the reads to all its member `stores` at the same time and
+merges what they return. Writes go to a single `primary` store:
+
+.. code-block:: python
+
+    >>> dbpedia = surf.Store(reader = 'sparql_protocol',
+    ...                      endpoint = 'http://dbpedia.org/sparql')
+    >>> local = surf.Store(reader = 'rdflib', writer = 'rdflib',
+    ...                    rdflib_store = 'IOMemory')
+    >>> store = FederatedStore([dbpedia, local], primary = local, timeout = 5)
+    >>> session = surf.Session(store)
+
+"""
+
+import logging
+import time
+
+from surf.executor import Executor, TimeoutError, DEFAULT_WORKERS
+from surf.store import Store
+
+class FederationError(Exception):
+    """ Raised when none of the member `stores` answered a read.
+
+    ``errors`` holds the ``(store, exception)`` pairs of the failed
+    members.
+
+    """
+
+    def __init__(self, message, errors):
+        Exception.__init__(self, message)
+        self.errors = errors
+
+def _merge_into(target, source):
+    """ Merge the nested `dict` ``source`` into ``target``.
+
+    Values of keys missing from ``target`` are taken over, nested `dicts`
+    are merged and lists are extended with the items they don't hold yet.
+
+    """
+
+    for key, value in source.items():
+        if key not in target:
+            target[key] = value
+            continue
+
+        current = target[key]
+        if isinstance(current, dict) and isinstance(value, dict):
+            _merge_into(current, value)
+        elif isinstance(current, list) and isinstance(value, list):
+            current.extend([item for item in value if item not in current])
+    return target
+
+def _merge_query_results(results):
+    """ Merge the results of a query sent to several `stores`.
+
+    SPARQL JSON `SELECT` results are concatenated and `ASK` results are
+    or-ed. Results in other formats can't be merged and are returned as a
+    list, in member order.
+
+    """
+
+    if not results:
+        return None
+
+    if all(isinstance(result, bool) for result in results):
+        return True in results
+
+    if not all(isinstance(result, dict) for result in results):
+        return results
+
+    if all("boolean" in result for result in results):
+        return {"head": {},
+                "boolean": True in [result["boolean"] for result in results]}
+
+    variables, bindings = [], []
+    for result in results:
+        for variable in result.get("head", {}).get("vars", []):
+            if variable not in variables:
+                variables.append(variable)
+        bindings.extend(result.get("results", {}).get("bindings", []))
+    return {"head": {"vars": variables}, "results": {"bindings": bindings}}
+
+class FederatedStore(Store):
+    """ A `store` that reads from several member `stores` concurrently and
+    writes to one of them.
+
+    ``members`` is the list of :class:`surf.store.Store` instances to read
+    from. Writes (`save`, `update`, `remove`, triple level access, `clear`,
+    `size`, ...) go to ``primary``, the first member by default. The
+    `primary` doesn't have to be a member, that way it is only written to.
+
+    Every read is sent to all members at the same time, on a pool of
+    ``max_workers`` threads. A member gets ``timeout`` seconds to answer,
+    ``timeouts`` can map single members to their own limit. Members that
+    fail or don't answer in time are logged and left out of the result, so
+    the result is partial. Only if no member answered,
+    :class:`FederationError` is raised.
+
+    Results are merged per subject: statements about the same `resource`
+    found in several members end up in one `resource`.
+
+    """
+
+    def __init__(self, members, primary=None, timeout=None, timeouts=None,
+                 max_workers=None, *args, **kwargs):
+        if not members:
+            raise ValueError("A FederatedStore needs at least one member")
+
+        Store.__init__(self, *args, **kwargs)
+        self.__members = list(members)
+        self.__primary = primary is None and self.__members[0] or primary
+        self.__timeout = timeout
+        self.__timeouts = dict(timeouts or {})
+        self.__fan_out_executor = Executor(max_workers or
+                                           max(len(self.__members),
+                                               DEFAULT_WORKERS))
+
+    members = property(lambda self: list(self.__members))
+    """ The member `stores` reads are sent to. """
+
+    primary = property(lambda self: self.__primary)
+    """ The `store` writes are sent to. """
+
+    default_context = property(lambda self: self.__primary.default_context)
+
+    def timeout_for(self, member):
+        """ Return the seconds ``member`` gets to answer, or None. """
+
+        return self.__timeouts.get(member, self.__timeout)
+
+    def enable_logging(self, enable):
+        """ Toggle `logging` on or off, for the members too. """
+
+        Store.enable_logging(self, enable)
+        for member in self.__stores():
+            member.enable_logging(enable)
+
+    def close(self):
+        """ Close the `store` and all its members.
+
+        Reads still waiting for members that timed out are not waited for.
+
+        """
+
+        self.__fan_out_executor.shutdown(wait=False)
+        Store.close(self)
+        for member in self.__stores():
+            member.close()
+
+    def __stores(self):
+        """ Return the members and the primary `store`, each once. """
+
+        stores = list(self.__members)
+        if self.__primary not in stores:
+            stores.append(self.__primary)
+        return stores
+
+    def __fan_out(self, method, call):
+        """ Run ``call(member)`` for all members at once and return the
+        results of the members that answered in time, in member order. """
+
+        started = time.time()
+        calls = [(member, self.__fan_out_executor.submit(call, member))
+                 for member in self.__members]
+
+        results, errors = [], []
+        for member, future in calls:
+            timeout = self.timeout_for(member)
+            if timeout is not None:
+                timeout = max(started + timeout - time.time(), 0)
+            try:
+                results.append(future.result(timeout))
+            except TimeoutError, e:
+                self.log.warning("%s on %r timed out" % (method, member))
+                errors.append((member, e))
+            except Exception, e:
+                self.log.exception("%s on %r failed" % (method, member))
+                errors.append((member, e))
+
+        if errors and not results:
+            raise FederationError("No member store answered %s" % method,
+                                  errors)
+        return results
+
+    #---------------------------------------------------------------------------
+    # the reader interface
+    #---------------------------------------------------------------------------
+
+    def get(self, resource, attribute, direct):
+        """ :func:`surf.plugin.reader.RDFReader.get` on all members. """
+
+        merged = {}
+        for result in self.__fan_out("get", lambda member:
+                                     member.get(resource, attribute, direct)):
+            _merge_into(merged, result or {})
+        return merged
+
+    def load(self, resource, direct):
+        """ :func:`surf.plugin.reader.RDFReader.load` on all members. """
+
+        merged = {}
+        for result in self.__fan_out("load", lambda member:
+                                     member.load(resource, direct)):
+            _merge_into(merged, result or {})
+        return merged
+
+    def is_present(self, resource):
+        """ True if any member has the ``resource``. """
+
+        return True in self.__fan_out("is_present", lambda member:
+                                      member.is_present(resource))
+
+    def concept(self, resource):
+        """ The `concept` of ``resource`` from the first member knowing it. """
+
+        for concept in self.__fan_out("concept", lambda member:
+                                      member.concept(resource)):
+            if concept:
+                return concept
+        return None
+
+    def instances_by_attribute(self, resource, attributes, direct, context):
+        """ The instances found by any member, each once. """
+
+        subjects = []
+        call = lambda member: member.instances_by_attribute(resource,
+                                                            attributes,
+                                                            direct, context)
+        for result in self.__fan_out("instances_by_attribute", call):
+            subjects.extend([s for s in result or [] if s not in subjects])
+        return subjects
+
+    def get_by(self, params):
+        """ :meth:`surf.store.Store.get_by` on all members.
+
+        Subjects keep the order they are returned in, member by member, a
+        subject found by several members is returned once with their data
+        merged. With ``order`` set to `True` the merged list is sorted by
+        subject. ``offset`` and ``limit`` are applied to the merged list.
+
+        Ordering by an attribute can't be merged, the values it orders by
+        are not returned, so it is rejected together with ``offset`` or
+        ``limit`` with a `ValueError`.
+
+        """
+
+        offset = params.get("offset") or 0
+        limit = params.get("limit")
+        order = params.get("order")
+        if order not in (None, True) and (offset or limit is not None):
+            raise ValueError("Federated get_by can't combine ordering by an "
+                             "attribute with offset or limit")
+
+        member_params = dict(params)
+        member_params.pop("offset", None)
+        if limit is not None:
+            member_params["limit"] = offset + limit
+        # Every member gets its own copy, Store.get_by() changes them.
+        call = lambda member: member.get_by(dict(member_params))
+
+        subjects = {}
+        merged = []
+        for result in self.__fan_out("get_by", call):
+            for subject, data in result or []:
+                if subject in subjects:
+                    _merge_into(subjects[subject], data)
+                else:
+                    subjects[subject] = data
+                    merged.append((subject, data))
+
+        if order is True:
+            merged.sort(key=lambda item: item[0],
+                        reverse=bool(params.get("desc")))
+        if limit is not None:
+            return merged[offset:offset + limit]
+        return merged[offset:]
+
+    def execute(self, query):
+        """ Run ``query`` on all members.
+
+        SPARQL JSON `SELECT` results are concatenated and `ASK` results are
+        or-ed. Results in other formats are returned as a list, in member
+        order.
+
+        """
+
+        results = self.__fan_out("execute", lambda member:
+                                 member.execute(query))
+        return _merge_query_results([result for result in results
+                                     if result is not None])
+
+    def execute_sparql(self, sparql_query, format='JSON'):
+        """ Run ``sparql_query`` on all members, the results are merged as
+        by :meth:`execute`. """
+
+        results = self.__fan_out("execute_sparql", lambda member:
+                                 member.execute_sparql(sparql_query,
+                                                       format=format))
+        return _merge_query_results([result for result in results
+                                     if result is not None])
+
+    #---------------------------------------------------------------------------
+    # the writer interface
+    #---------------------------------------------------------------------------
+
+    def clear(self, context=None):
+        """ :meth:`surf.store.Store.clear` on the primary `store`. """
+
+        self.__primary.clear(context=context)
+
+    def save(self, *resources):
+        """ :meth:`surf.store.Store.save` on the primary `store`. """
+
+        self.__primary.save(*resources)
+
+    def update(self, *resources):
+        """ :meth:`surf.store.Store.update` on the primary `store`. """
+
+        self.__primary.update(*resources)
+
+    def remove(self, *resources, **kwargs):
+        """ :meth:`surf.store.Store.remove` on the primary `store`. """
+
+        self.__primary.remove(*resources, **kwargs)
+
+    def size(self):
+        """ :meth:`surf.store.Store.size` of the primary `store`. """
+
+        return self.__primary.size()
+
+    def add_triple(self, s=None, p=None, o=None, context=None):
+        """ :meth:`surf.store.Store.add_triple` on the primary `store`. """
+
+        self.__primary.add_triple(s=s, p=p, o=o, context=context)
+
+    def set_triple(self, s=None, p=None, o=None, context=None):
+        """ :meth:`surf.store.Store.set_triple` on the primary `store`. """
+
+        self.__primary.set_triple(s=s, p=p, o=o, context=context)
+
+    def remove_triple(self, s=None, p=None, o=None, context=None):
+        """ :meth:`surf.store.Store.remove_triple` on the primary `store`. """
+
+        self.__primary.remove_triple(s=s, p=p, o=o, context=context)
+
+    def index_triples(self, **kwargs):
+        """ :meth:`surf.store.Store.index_triples` on the primary `store`. """
+
+        return self.__primary.index_triples(**kwargs)
+
+    def load_triples(self, context=None, **kwargs):
+        """ :meth:`surf.store.Store.load_triples` on the primary `store`. """
+
+        return self.__primary.load_triples(context=context, **kwargs)
@@ -36,12 +36,18 @@
 __author__ = 'Cosmin Basca'
 
 
+from collections import deque
+import re
 import sys
+import threading
 
 from surf.rdf import ClosedNamespace, Namespace, RDF, RDFS
 
 __anonymous = 'NS'
 __anonymous_count = 0
+# anonymous prefixes in creation order, the oldest are dropped over the limit
+__anonymous_prefixes = deque()
+__anonymous_limit = 1024
 
 ANNOTATION = Namespace('http://www.w3.org/2000/10/annotation-ns#')
 ANNOTEA = Namespace('http://www.w3.org/2002/01/bookmark#')
@@ -108,29 +114,89 @@ def __unicode(namespace):
         uri = unicode(namespace.uri)
     return uri
 
-# an internal inverted dict - for fast access
-__inverted_dict__ = {}
-for k, v in sys.modules[__name__].__dict__.items():
-    if isinstance(v, Namespace) or isinstance(v, ClosedNamespace):
-        __inverted_dict__[__unicode(v)] = k
-        
-__direct_dict__ = {}
-for k, v in sys.modules[__name__].__dict__.items():
-    if isinstance(v, Namespace) or isinstance(v, ClosedNamespace):
-        __direct_dict__[k] = v
-
-def __add_inverted(prefix):
-    ns_dict = sys.modules[__name__].__dict__
-    __inverted_dict__[__unicode(ns_dict[prefix])] = prefix
-    
-def __add_direct(prefix):
-    ns_dict = sys.modules[__name__].__dict__
-    __direct_dict__[prefix] = ns_dict[prefix]
+class _Snapshot(object):
+    """ Immutable state of the `namespace` registry.
+
+    Readers take the current snapshot with a single global lookup and never
+    lock, writers build a new snapshot under `__lock` and swap it in.
+
+    ``direct`` maps prefixes to namespaces, ``inverted`` maps namespace URIs
+    to prefixes, and ``trie`` is a prefix trie over the URIs of the
+    namespaces that end with a *#* or a */*. Each trie level is keyed by a URI
+    segment up to and including the next *#* or */*, the `None` key of a node
+    holds the ``(prefix, namespace)`` that ends there. ``generation`` is
+    incremented by every change.
+
+    """
+
+    __slots__ = ('direct', 'inverted', 'trie', 'generation')
+
+    def __init__(self, direct, inverted, trie, generation):
+        self.direct = direct
+        self.inverted = inverted
+        self.trie = trie
+        self.generation = generation
+
+__segment = re.compile('[^/#]*[/#]')
+
+def __trie_add(trie, uri, prefix, namespace):
+    """ Return a copy of `trie` with `uri` added, only the nodes on the path
+    of `uri` are copied. """
+
+    if not uri.endswith(('#', '/')):
+        return trie
+    root = node = dict(trie)
+    for segment in __segment.findall(uri):
+        child = dict(node.get(segment, {}))
+        node[segment] = child
+        node = child
+    node[None] = (prefix, namespace)
+    return root
+
+def __trie_remove(trie, uri, prefix):
+    """ Return a copy of `trie` without `uri` if it is held for `prefix`,
+    nodes left empty are pruned. """
+
+    segments = __segment.findall(uri)
+    path = [trie]
+    for segment in segments:
+        node = path[-1].get(segment)
+        if node is None:
+            return trie
+        path.append(node)
+    if path[-1].get(None, (None, None))[0] != prefix:
+        return trie
+
+    node = dict(path[-1])
+    del node[None]
+    for i in reversed(range(len(segments))):
+        parent = dict(path[i])
+        if node:
+            parent[segments[i]] = node
+        else:
+            del parent[segments[i]]
+        node = parent
+    return node
+
+def __initial_snapshot():
+    direct, inverted, trie = {}, {}, {}
+    for k, v in sys.modules[__name__].__dict__.items():
+        if isinstance(v, Namespace) or isinstance(v, ClosedNamespace):
+            direct[k] = v
+            inverted[__unicode(v)] = k
+            trie = __trie_add(trie, __unicode(v), k, v)
+    return _Snapshot(direct, inverted, trie, 0)
+
+# Serializes the writers, reentrant since get_namespace() calls register().
+__lock = threading.RLock()
+__snapshot = __initial_snapshot()
 
 def all():
     """ Return all the namespaces registered as a dict.
+
+    The dict is a snapshot of the registry and must not be modified.
     """
-    return __direct_dict__
+    return __snapshot.direct
 
 def base(property):
     """ Return the base part of a URI, `property` is a string denoting a URI.
@@ -173,18 +239,52 @@ def register(**namespaces):
 
     """
 
+    __register(namespaces, 1)
+
+def __register(namespaces, step):
+    """ Add ``namespaces`` to the prefix tables, the `generation` is
+    increased by ``step``. """
+
+    global __snapshot
     ns_dict = sys.modules[__name__].__dict__
-    for key in namespaces:
-        uri = namespaces[key]
-        prefix = key.upper()
-        if not type(uri) in [Namespace, ClosedNamespace]:
-            uri = Namespace(uri)
+    __lock.acquire()
+    try:
+        current = __snapshot
+        direct = dict(current.direct)
+        inverted = dict(current.inverted)
+        trie = current.trie
+        for key in namespaces:
+            uri = namespaces[key]
+            prefix = key.upper()
+            if not type(uri) in [Namespace, ClosedNamespace]:
+                uri = Namespace(uri)
+
+            ns_dict[prefix] = uri
+            direct[prefix] = uri
+            inverted[__unicode(uri)] = prefix
+            trie = __trie_add(trie, __unicode(uri), prefix, uri)
+
+        __snapshot = _Snapshot(direct, inverted, trie,
+                               current.generation + step)
+    finally:
+        __lock.release()
+
+def generation():
+    """ Return a counter that increases every time a `namespace` is
+    registered or an anonymous one is dropped.
+
+    Adding an anonymous `namespace` (see `get_namespace`) leaves it as is:
+    the prefix is new and its base was not covered by any other `namespace`,
+    so only lookups of that prefix, which failed until then, give a
+    different answer.
+
+    Caches of values derived from the prefix tables (such as the ones used by
+    `surf.util.attr2rdf` and `surf.util.rdf2attr`) compare it with the value
+    they were filled under and drop their entries when it differs.
 
-        ns_dict[prefix] = uri
+    """
 
-        # Also keep inverted dict up-to-date.
-        __add_inverted(prefix)
-        __add_direct(prefix)
+    return __snapshot.generation
 
 def register_fallback(namespace):
     """ Register a fallback namespace to use when creating resource without
@@ -225,20 +325,121 @@ def get_namespace(base):
     """
 
     global __anonymous_count
-    ns_dict = sys.modules[__name__].__dict__
 
     if not type(base) in [str, unicode]:
         base = str(base)
 
+    snapshot = __snapshot
+    prefix = snapshot.inverted.get(base)
+    if prefix is not None:
+        return prefix, snapshot.direct[prefix]
+
+    __lock.acquire()
     try:
-        prefix = __inverted_dict__[base]
-        uri = ns_dict[prefix]
-    except KeyError:
+        # Another thread may have registered the base meanwhile.
+        snapshot = __snapshot
+        prefix = snapshot.inverted.get(base)
+        if prefix is not None:
+            return prefix, snapshot.direct[prefix]
+
         prefix = '%s%d' % (__anonymous, __anonymous_count + 1)
         __anonymous_count += 1
         uri = Namespace(base)
-        register(**{prefix: uri})
-    return prefix, uri
+        __register({prefix: uri}, 0)
+        __anonymous_prefixes.append((prefix, base))
+        __evict_anonymous()
+        return prefix, uri
+    finally:
+        __lock.release()
+
+def split(uri):
+    """ Split `uri` into the `namespace` prefix, the `namespace` and the
+    remainder of the `uri`.
+
+    The longest registered `namespace` the `uri` starts with is used, so the
+    remainder may contain *#* or */*. If no registered `namespace` matches,
+    the `uri` is split after its last *#* or */* and the base is registered
+    as an anonymous `namespace` (see `get_namespace`).
+
+    .. code-block:: python
+
+        >>> print ns.split('http://xmlns.com/foaf/0.1/name')
+        ('FOAF', Namespace('http://xmlns.com/foaf/0.1/'), 'name')
+
+    """
+
+    if not type(uri) in [str, unicode]:
+        uri = unicode(uri)
+
+    node = __snapshot.trie
+    match = None
+    length = position = 0
+    for segment in __segment.findall(uri):
+        node = node.get(segment)
+        if node is None:
+            break
+        position += len(segment)
+        if None in node:
+            match, length = node[None], position
+
+    if match is not None:
+        return match[0], match[1], uri[length:]
+
+    sp = uri.rfind('#') != -1 and '#' or '/'
+    base, local = uri.rsplit(sp, 1)
+    prefix, namespace = get_namespace('%s%s' % (base, sp))
+    return prefix, namespace, local
+
+def set_anonymous_limit(limit):
+    """ Set how many anonymous `namespaces` (*NS1*, *NS2*, ...) are kept
+    registered, the oldest ones are dropped first.
+
+    Once the limit is exceeded a tenth of it is dropped at a time, as every
+    drop changes the `generation` and so empties the caches based on it.
+
+    Anonymous prefixes are never reused, so a dropped one stops resolving
+    while the next URI under its base gets a new prefix.
+
+    """
+
+    global __anonymous_limit
+    __lock.acquire()
+    try:
+        __anonymous_limit = limit
+        __evict_anonymous()
+    finally:
+        __lock.release()
+
+def get_anonymous_limit():
+    """ Return how many anonymous `namespaces` are kept registered. """
+
+    return __anonymous_limit
+
+def __evict_anonymous():
+    # Called with __lock held.
+    global __snapshot
+    limit = max(__anonymous_limit, 0)
+    if len(__anonymous_prefixes) <= limit:
+        return
+
+    ns_dict = sys.modules[__name__].__dict__
+    current = __snapshot
+    direct = dict(current.direct)
+    inverted = dict(current.inverted)
+    trie = current.trie
+    keep = limit - max(limit / 10, 1)
+    while len(__anonymous_prefixes) > max(keep, 0):
+        prefix, uri = __anonymous_prefixes.popleft()
+        # Skip prefixes that were registered again since.
+        if prefix not in direct or __unicode(direct[prefix]) != uri:
+            continue
+        del direct[prefix]
+        if inverted.get(uri) == prefix:
+            del inverted[uri]
+        trie = __trie_remove(trie, uri, prefix)
+        ns_dict.pop(prefix, None)
+
+    __snapshot = _Snapshot(direct, inverted, trie, current.generation + 1)
 
 def get_namespace_url(prefix):
     """ Return the `namespace` URI registered under the specified `prefix`
@@ -251,9 +452,8 @@ def get_namespace_url(prefix):
 
     """
 
-    ns_dict = sys.modules[__name__].__dict__
     try:
-        return ns_dict[prefix.__str__().upper()]
+        return __snapshot.direct.get(prefix.__str__().upper())
     except:
         return None
 
@@ -272,7 +472,7 @@ def get_prefix(uri):
     """
 
     try:
-        return __inverted_dict__[uri.__str__()]
+        return __snapshot.inverted.get(uri.__str__())
     except:
         return None
 
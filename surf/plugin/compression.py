@@ -0,0 +1,263 @@
+# Copyright (c) 2009, Digital Enterprise Research Institute (DERI),
+# NUI Galway
+# All rights reserved.
+
+# author: Cosmin Basca
+# email: cosmin.basca@gmail.com
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer
+#      in the documentation and/or other materials provided with
+#      the distribution.
+#    * Neither the name of DERI nor the
+#      names of its contributors may be used to endorse or promote
+#      products derived from this software without specific prior
+#      written permission.
+
+# THIS SOFTWARE IS PROVIDED BY DERI ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL DERI BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+__author__ = 'Cosmin Basca'
+
+""" HTTP compression support shared by the HTTP based plugins.
+
+An :class:`HTTPCompression` object holds the compression settings of one
+`store` and counts the bytes that went over the wire, compressed, and the
+bytes they stand for, uncompressed.
+
+"""
+
+import threading
+import zlib
+from cStringIO import StringIO
+from gzip import GzipFile
+
+# Request bodies smaller than this aren't worth compressing.
+COMPRESS_MIN_SIZE = 1024
+
+ACCEPT_ENCODING = "gzip, deflate"
+
+_READ_SIZE = 16 * 1024
+
+def _to_bool(value):
+    if isinstance(value, basestring):
+        return value.lower().strip() in ("true", "yes", "1")
+    return bool(value)
+
+class DecodedStream(object):
+    """ File-like object that decodes a gzip or deflate encoded ``stream``
+    as it is read.
+
+    Other attributes, like `info()` or `getheader()`, are those of the
+    wrapped ``stream``.
+
+    """
+
+    def __init__(self, stream, encoding = None, compression = None):
+        self.__stream = stream
+        self.__compression = compression
+        # Decoded data, read up to __position.
+        self.__buffer = ""
+        self.__position = 0
+        self.__eof = False
+        self.__raw = False
+        if encoding in ("gzip", "x-gzip"):
+            self.__decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            self.__decompressor = zlib.decompressobj()
+        else:
+            self.__decompressor = None
+
+    def __getattr__(self, name):
+        return getattr(self.__stream, name)
+
+    def __decode(self, data):
+        if self.__decompressor is None:
+            return data
+
+        try:
+            return self.__decompressor.decompress(data)
+        except zlib.error:
+            # Some servers send raw deflate data without the zlib header.
+            if self.__raw:
+                raise
+            self.__raw = True
+            self.__decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self.__decompressor.decompress(data)
+
+    def __fill(self, size = -1, until = None):
+        while not self.__eof:
+            if size >= 0 and len(self.__buffer) - self.__position >= size:
+                break
+            if until is not None and \
+                    self.__buffer.find(until, self.__position) >= 0:
+                break
+
+            data = self.__stream.read(_READ_SIZE)
+            if data:
+                decoded = self.__decode(data)
+            else:
+                self.__eof = True
+                decoded = self.__decompressor and self.__decompressor.flush() or ""
+
+            if self.__compression:
+                self.__compression.count_received(len(data), len(decoded))
+            # Drop the data read so far, once per refill.
+            self.__buffer = self.__buffer[self.__position:] + decoded
+            self.__position = 0
+
+    def read(self, size = -1):
+        self.__fill(size)
+        start = self.__position
+        if size < 0:
+            end = len(self.__buffer)
+        else:
+            end = min(start + size, len(self.__buffer))
+        self.__position = end
+        return self.__buffer[start:end]
+
+    def readline(self, size = -1):
+        self.__fill(size, until = "\n")
+        start = self.__position
+        end = self.__buffer.find("\n", start) + 1 or len(self.__buffer)
+        if size >= 0:
+            end = min(end, start + size)
+        self.__position = end
+        return self.__buffer[start:end]
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+class HTTPCompression(object):
+    """ HTTP compression settings and traffic counters.
+
+    With ``accept`` set, responses are requested with
+    ``Accept-Encoding: gzip, deflate`` and decoded as they are read. With
+    ``compress_requests`` set, request bodies of at least ``min_size``
+    bytes are sent gzip encoded, for endpoints that support it.
+
+    """
+
+    def __init__(self, accept = True, compress_requests = False,
+                 min_size = COMPRESS_MIN_SIZE):
+        self.accept = accept
+        self.compress_requests = compress_requests
+        self.min_size = min_size
+        self.__lock = threading.Lock()
+        self.reset_stats()
+
+    @classmethod
+    def from_kwargs(cls, kwargs):
+        """ Create from the `http_compression`, `compress_requests` and
+        `compress_min_size` plugin arguments. """
+
+        return cls(_to_bool(kwargs.get("http_compression", True)),
+                   _to_bool(kwargs.get("compress_requests", False)),
+                   int(kwargs.get("compress_min_size", COMPRESS_MIN_SIZE)))
+
+    def reset_stats(self):
+        """ Reset the traffic counters. """
+
+        self.__lock.acquire()
+        try:
+            self.__sent = self.__sent_raw = 0
+            self.__received = self.__received_raw = 0
+        finally:
+            self.__lock.release()
+
+    def count_sent(self, wire_bytes, raw_bytes):
+        self.__lock.acquire()
+        try:
+            self.__sent += wire_bytes
+            self.__sent_raw += raw_bytes
+        finally:
+            self.__lock.release()
+
+    def count_received(self, wire_bytes, raw_bytes):
+        self.__lock.acquire()
+        try:
+            self.__received += wire_bytes
+            self.__received_raw += raw_bytes
+        finally:
+            self.__lock.release()
+
+    def stats(self):
+        """ Return the traffic counters as a dictionary.
+
+        `bytes_sent` and `bytes_received` count bytes on the wire,
+        `bytes_sent_uncompressed` and `bytes_received_uncompressed` the
+        bytes they decode to. `bytes_saved` is the difference.
+
+        """
+
+        self.__lock.acquire()
+        try:
+            return {"bytes_sent" : self.__sent,
+                    "bytes_sent_uncompressed" : self.__sent_raw,
+                    "bytes_received" : self.__received,
+                    "bytes_received_uncompressed" : self.__received_raw,
+                    "bytes_saved" : self.__sent_raw - self.__sent +
+                                    self.__received_raw - self.__received}
+        finally:
+            self.__lock.release()
+
+    def request_headers(self):
+        """ Return headers to add to every request. """
+
+        if self.accept:
+            return {"Accept-Encoding" : ACCEPT_ENCODING}
+        return {}
+
+    def encode_body(self, body):
+        """ Return ``(body, content_encoding)`` for a request body.
+
+        ``content_encoding`` is None when the body is sent as is.
+
+        """
+
+        if not body:
+            return body, None
+
+        if isinstance(body, unicode):
+            body = body.encode("utf-8")
+
+        if not self.compress_requests or len(body) < self.min_size:
+            self.count_sent(len(body), len(body))
+            return body, None
+
+        buffer = StringIO()
+        gzip_file = GzipFile(fileobj = buffer, mode = "wb")
+        gzip_file.write(body)
+        gzip_file.close()
+        encoded = buffer.getvalue()
+        self.count_sent(len(encoded), len(body))
+        return encoded, "gzip"
+
+    def decode_response(self, response, content_encoding = None):
+        """ Return a file-like object reading the decoded ``response``. """
+
+        if content_encoding:
+            content_encoding = content_encoding.lower().strip()
+        return DecodedStream(response, content_encoding, self)
@@ -35,6 +35,8 @@
 # -*- coding: utf-8 -*-
 __author__ = 'Cosmin Basca'
 
+from itertools import izip
+
 from surf.plugin.reader import RDFReader
 from surf.query import Query, Union, Group
 from surf.query import a, ask, select, optional_group, named_group
@@ -109,6 +111,79 @@ def query_Concept(subject):
 
     return select('?c').distinct().where((subject, a, '?c'))
 
+# Converters from result columns to the multilevel dictionaries returned by
+# RDFQueryReader.convert. The 1, 3 and 4 column variants serve the fixed key
+# shapes of _concept, _get, _instances_by_attribute and _load. Values of the
+# last column are collected in lists, unbound or empty values are skipped.
+
+def _convert_list(column):
+    return list(column)
+
+def _convert_flat(keys, values):
+    results = {}
+    for k, value in izip(keys, values):
+        values_list = results.get(k)
+        if values_list is None:
+            values_list = results[k] = []
+        if value:
+            values_list.append(value)
+
+    return results
+
+def _convert_two_levels(keys0, keys1, values):
+    results = {}
+    for k0, k1, value in izip(keys0, keys1, values):
+        level = results.get(k0)
+        if level is None:
+            level = results[k0] = {}
+        values_list = level.get(k1)
+        if values_list is None:
+            values_list = level[k1] = []
+        if value:
+            values_list.append(value)
+
+    return results
+
+def _convert_three_levels(keys0, keys1, keys2, values):
+    results = {}
+    for k0, k1, k2, value in izip(keys0, keys1, keys2, values):
+        level = results.get(k0)
+        if level is None:
+            level = results[k0] = {}
+        next_level = level.get(k1)
+        if next_level is None:
+            next_level = level[k1] = {}
+        values_list = next_level.get(k2)
+        if values_list is None:
+            values_list = next_level[k2] = []
+        if value:
+            values_list.append(value)
+
+    return results
+
+def _convert_nested(*columns):
+    results = {}
+    key_columns, values = columns[:-1], columns[-1]
+    for row, value in izip(izip(*key_columns), values):
+        data = results
+        for k in row[:-1]:
+            next_level = data.get(k)
+            if next_level is None:
+                next_level = data[k] = {}
+            data = next_level
+        values_list = data.get(row[-1])
+        if values_list is None:
+            values_list = data[row[-1]] = []
+        if value:
+            values_list.append(value)
+
+    return results
+
+_converters = {1 : _convert_list,
+               2 : _convert_flat,
+               3 : _convert_two_levels,
+               4 : _convert_three_levels}
+
 class RDFQueryReader(RDFReader):
     """ Super class for SuRF Reader plugins that wrap queryable `stores`. """
 
@@ -443,32 +518,41 @@ class RDFQueryReader(RDFReader):
     def _to_table(self, result):
         return []
 
+    def _to_columns(self, result):
+        """ Return the result of a **SELECT** query in columnar form.
+
+        The return value is a ``(variables, columns)`` tuple, ``columns``
+        holds one list of values per variable, `None` standing for unbound
+        values. Plugins that can build the columns straight from the
+        store's response should override this method, the default
+        implementation transposes the rows returned by :meth:`_to_table`.
+
+        """
+
+        table = self._to_table(result)
+        variables = []
+        for row in table:
+            for variable in row:
+                if variable not in variables:
+                    variables.append(variable)
+
+        columns = [[row.get(variable) for row in table]
+                   for variable in variables]
+        return variables, columns
+
     def __convert(self, query_result, *keys):
-        results_table = self._to_table(query_result)
-
-        if len(keys) == 1:
-            return [row[keys[0]] for row in results_table]
-
-        last = len(keys) - 2
-        results = {}
-        for row in results_table:
-            data = results
-            for i in range(len(keys) - 1):
-                k = keys[i]
-                v = row.get(k)
-                if i < last:
-                    if v not in data:
-                        data[v] = {}
-                    data = data[v]
-                elif i == last:
-                    if v not in data:
-                        data[v] = []
-
-                    value = row.get(keys[i + 1])
-                    if value:
-                        data[v].append(value)
+        variables, columns = self._to_columns(query_result)
+        rows = columns and len(columns[0]) or 0
 
-        return results
+        key_columns = []
+        for key in keys:
+            if key in variables:
+                key_columns.append(columns[variables.index(key)])
+            else:
+                key_columns.append([None] * rows)
+
+        converter = _converters.get(len(keys), _convert_nested)
+        return converter(*key_columns)
 
     # public interface
     def execute(self, query):
@@ -0,0 +1,351 @@
+# Copyright (c) 2009, Digital Enterprise Research Institute (DERI),
+# NUI Galway
+# All rights reserved.
+
+# author: Cosmin Basca
+# email: cosmin.basca@gmail.com
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer
+#      in the documentation and/or other materials provided with
+#      the distribution.
+#    * Neither the name of DERI nor the
+#      names of its contributors may be used to endorse or promote
+#      products derived from this software without specific prior
+#      written permission.
+
+# THIS SOFTWARE IS PROVIDED BY DERI ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL DERI BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+__author__ = 'Cosmin Basca'
+
+""" Spreading reads over mirrored `stores`.
+
+A :class:`ReplicaReader` holds one `reader` plugin per replica and sends each
+read to one of them, the one answering fastest lately or the one with the
+fewest requests in flight. A read not answered within a percentile of the
+recent latencies is sent to a second replica too and the first answer wins.
+Replicas failing repeatedly are ejected until a health check passes again.
+
+:class:`surf.store.Store` creates it when given the ``replicas`` argument:
+
+.. code-block:: python
+
+    >>> store = surf.Store(reader = 'sparql_protocol',
+    ...                    writer = 'sparql_protocol',
+    ...                    endpoint = 'http://mirror1/sparql',
+    ...                    replicas = [{'endpoint': 'http://mirror2/sparql'},
+    ...                                {'endpoint': 'http://mirror3/sparql'}])
+
+"""
+
+from collections import deque
+import Queue
+import threading
+import time
+
+from surf.executor import Executor
+from surf.plugin.reader import RDFReader
+
+ROUTE_LATENCY = "latency"
+ROUTE_INFLIGHT = "inflight"
+
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_MAX_FAILURES = 3
+DEFAULT_EJECT_SECONDS = 30
+DEFAULT_REPLICA_WORKERS = 16
+
+# Weight of the newest sample in the latency moving average.
+EWMA_ALPHA = 0.3
+# Latencies kept to compute the hedging percentile from, and how many are
+# needed before reads are hedged at all.
+LATENCY_WINDOW = 200
+MIN_HEDGE_SAMPLES = 20
+
+class Replica(object):
+    """ A `reader` plugin and the statistics used to route reads to it. """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.latency = None
+        self.inflight = 0
+        self.failures = 0
+        self.ejected_until = None
+        self.checking = False
+
+    def __repr__(self):
+        return "<Replica %r latency=%s inflight=%d failures=%d>" % \
+            (self.reader, self.latency, self.inflight, self.failures)
+
+class ReplicaReader(RDFReader):
+    """ Route the reads of a `store` to one of several replica `readers`.
+
+    ``replicas`` are configured `reader` plugins over mirrored data. The
+    parameters are:
+
+    - ``routing``: `latency` (the default) sends a read to the replica with
+      the lowest moving average of its latency, `inflight` to the replica
+      with the fewest reads in flight.
+    - ``hedge_percentile``: a read not answered within this percentile of
+      the recent latencies is also sent to the next best replica, 95 by
+      default, 0 disables hedging.
+    - ``max_failures``: consecutive failures after which a replica is
+      ejected, 3 by default.
+    - ``eject_seconds``: how long an ejected replica is left alone before it
+      is health checked, 30 by default.
+    - ``health_check``: called with the `reader` of an ejected replica, the
+      replica is taken back if it doesn't raise. By default an `ASK` query
+      is run through `execute_sparql` if the `reader` supports it.
+    - ``workers``: number of threads running the reads, 16 by default.
+
+    """
+
+    def __init__(self, replicas, *args, **kwargs):
+        RDFReader.__init__(self, *args, **kwargs)
+        if not replicas:
+            raise ValueError("A ReplicaReader needs at least one replica")
+
+        self.__replicas = [Replica(reader) for reader in replicas]
+        self.__routing = kwargs.get("routing", ROUTE_LATENCY)
+        if self.__routing not in (ROUTE_LATENCY, ROUTE_INFLIGHT):
+            raise ValueError("Unknown routing: %s" % self.__routing)
+
+        hedge_percentile = kwargs.get("hedge_percentile")
+        if hedge_percentile is None:
+            hedge_percentile = DEFAULT_HEDGE_PERCENTILE
+        self.__hedge_percentile = float(hedge_percentile)
+        self.__max_failures = int(kwargs.get("max_failures",
+                                             DEFAULT_MAX_FAILURES))
+        self.__eject_seconds = float(kwargs.get("eject_seconds",
+                                                DEFAULT_EJECT_SECONDS))
+        self.__health_check = kwargs.get("health_check",
+                                         self.__default_health_check)
+
+        self.__lock = threading.Lock()
+        self.__latencies = deque(maxlen=LATENCY_WINDOW)
+        self.__executor = Executor(int(kwargs.get("workers",
+                                                  DEFAULT_REPLICA_WORKERS)))
+
+    replicas = property(lambda self: list(self.__replicas))
+    """ The :class:`Replica` objects reads are routed to. """
+
+    use_subqueries = property(lambda self: getattr(self.__replicas[0].reader,
+                                                   'use_subqueries', False))
+
+    def hedge_delay(self):
+        """ Return the seconds to wait before a read is hedged, or `None`
+        when reads are not hedged (yet). """
+
+        if self.__hedge_percentile <= 0 or len(self.__replicas) < 2:
+            return None
+
+        self.__lock.acquire()
+        try:
+            latencies = sorted(self.__latencies)
+        finally:
+            self.__lock.release()
+        if len(latencies) < MIN_HEDGE_SAMPLES:
+            return None
+
+        index = int(round(min(self.__hedge_percentile, 100) / 100.0 *
+                          (len(latencies) - 1)))
+        return latencies[index]
+
+    def ranked(self):
+        """ Return the healthy replicas, best first.
+
+        Replicas whose ejection has run out are health checked in the
+        background. If every replica is ejected, all of them are returned.
+
+        """
+
+        now = time.time()
+        self.__lock.acquire()
+        try:
+            healthy, to_check = [], []
+            for replica in self.__replicas:
+                if replica.ejected_until is None:
+                    healthy.append(replica)
+                elif replica.ejected_until <= now and not replica.checking:
+                    replica.checking = True
+                    to_check.append(replica)
+
+            if self.__routing == ROUTE_INFLIGHT:
+                key = lambda r: (r.inflight, r.latency or 0)
+            else:
+                key = lambda r: (r.latency or 0, r.inflight)
+            ranked = sorted(healthy or self.__replicas, key=key)
+        finally:
+            self.__lock.release()
+
+        for replica in to_check:
+            self.__executor.submit(self.__check, replica)
+        return ranked
+
+    def __default_health_check(self, reader):
+        if hasattr(reader, 'execute_sparql'):
+            reader.execute_sparql("ASK { ?s ?p ?o }")
+
+    def __check(self, replica):
+        try:
+            self.__health_check(replica.reader)
+        except Exception:
+            self.log.warning("%r failed its health check" % replica)
+            healthy = False
+        else:
+            healthy = True
+
+        self.__lock.acquire()
+        try:
+            replica.checking = False
+            if healthy:
+                replica.failures = 0
+                replica.ejected_until = None
+            else:
+                replica.ejected_until = time.time() + self.__eject_seconds
+        finally:
+            self.__lock.release()
+
+    def __timed(self, replica, call):
+        """ Run ``call(reader)`` on ``replica`` and update its statistics. """
+
+        self.__lock.acquire()
+        replica.inflight += 1
+        self.__lock.release()
+
+        started = time.time()
+        try:
+            result = call(replica.reader)
+        except Exception:
+            self.__lock.acquire()
+            try:
+                replica.inflight -= 1
+                replica.failures += 1
+                if replica.failures >= self.__max_failures and \
+                        replica.ejected_until is None:
+                    self.log.warning("ejecting %r" % replica)
+                    replica.ejected_until = time.time() + self.__eject_seconds
+            finally:
+                self.__lock.release()
+            raise
+
+        latency = time.time() - started
+        self.__lock.acquire()
+        try:
+            replica.inflight -= 1
+            replica.failures = 0
+            if replica.latency is None:
+                replica.latency = latency
+            else:
+                replica.latency += EWMA_ALPHA * (latency - replica.latency)
+            self.__latencies.append(latency)
+        finally:
+            self.__lock.release()
+        return result
+
+    def route(self, call):
+        """ Return ``call(reader)`` run on the best replica.
+
+        The read is hedged on the next replica when it takes longer than
+        :meth:`hedge_delay`, and retried on the next one when it fails. The
+        first successful answer is returned, if all tried replicas fail the
+        last error is raised.
+
+        """
+
+        candidates = self.ranked()
+        answers = Queue.Queue()
+
+        def launch():
+            replica = candidates.pop(0)
+            future = self.__executor.submit(self.__timed, replica, call)
+            future.add_done_callback(answers.put)
+
+        launch()
+        pending = 1
+        delay = candidates and self.hedge_delay() or None
+        while True:
+            try:
+                future = answers.get(True, delay)
+            except Queue.Empty:
+                # Too slow, hedge it. Only one hedged duplicate is sent.
+                delay = None
+                if candidates:
+                    launch()
+                    pending += 1
+                continue
+
+            pending -= 1
+            if future.exception() is None:
+                return future.result()
+
+            if candidates:
+                launch()
+                pending += 1
+                if not candidates:
+                    # Nothing left to hedge on.
+                    delay = None
+            elif not pending:
+                return future.result()
+
+    #public interface
+    def get(self, resource, attribute, direct):
+        return self.route(lambda reader: reader.get(resource, attribute,
+                                                    direct))
+
+    def load(self, resource, direct):
+        return self.route(lambda reader: reader.load(resource, direct))
+
+    def is_present(self, resource):
+        return self.route(lambda reader: reader.is_present(resource))
+
+    def concept(self, resource):
+        return self.route(lambda reader: reader.concept(resource))
+
+    def instances_by_attribute(self, resource, attributes, direct, context):
+        return self.route(lambda reader:
+                          reader.instances_by_attribute(resource, attributes,
+                                                        direct, context))
+
+    def get_by(self, params):
+        # Hedged reads run concurrently, each gets its own copy.
+        return self.route(lambda reader: reader.get_by(dict(params)))
+
+    def execute(self, query):
+        return self.route(lambda reader: reader.execute(query))
+
+    def execute_sparql(self, sparql_query, format='JSON'):
+        return self.route(lambda reader:
+                          reader.execute_sparql(sparql_query, format=format))
+
+    def enable_logging(self, enable=True):
+        RDFReader.enable_logging(self, enable)
+        for replica in self.__replicas:
+            replica.reader.enable_logging(enable)
+
+    def close(self):
+        """ Close all replica `readers`, once the reads running on them
+        (including the losers of hedged reads) are done. """
+
+        self.__executor.shutdown()
+        for replica in self.__replicas:
+            try:
+                replica.reader.close()
+            except Exception:
+                self.log.exception("Error on closing %r" % replica)
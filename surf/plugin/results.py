@@ -0,0 +1,287 @@
+# Copyright (c) 2009, Digital Enterprise Research Institute (DERI),
+# NUI Galway
+# All rights reserved.
+
+# author: Cosmin Basca
+# email: cosmin.basca@gmail.com
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright
+#      notice, this list of conditions and the following disclaimer
+#      in the documentation and/or other materials provided with
+#      the distribution.
+#    * Neither the name of DERI nor the
+#      names of its contributors may be used to endorse or promote
+#      products derived from this software without specific prior
+#      written permission.
+
+# THIS SOFTWARE IS PROVIDED BY DERI ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL DERI BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# -*- coding: utf-8 -*-
+__author__ = 'Cosmin Basca'
+
+""" Streaming parsers for SPARQL query result formats.
+
+The parsers read the result document from a file-like object as it arrives
+and build one column of values per query variable. Values are converted to
+the same `rdflib` terms as :func:`surf.util.json_to_rdflib` would produce
+for the corresponding JSON result, through :data:`surf.util.term_cache`.
+
+"""
+
+import csv
+import re
+
+try:
+    from xml.etree.cElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+
+from surf.namespace import XSD
+from surf.util import is_uri, term_cache
+
+class SelectResult(object):
+    """ Columnar result of a **SELECT** query.
+
+    ``variables`` holds the variable names (without the leading `?`) and
+    ``columns`` one list of values per variable, `None` standing for
+    unbound values.
+
+    """
+
+    def __init__(self, variables, columns):
+        self.variables = variables
+        self.columns = columns
+
+    def __len__(self):
+        return self.columns and len(self.columns[0]) or 0
+
+    def to_table(self):
+        """ Return the result as a list of `{variable: value}` dicts, unbound
+        variables are left out. """
+
+        table = []
+        for row in zip(*self.columns):
+            table.append(dict([(variable, value) for variable, value
+                               in zip(self.variables, row)
+                               if value is not None]))
+        return table
+
+_tsv_escapes = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+_tsv_escaped_chars = {'t': u'\t', 'n': u'\n', 'r': u'\r', 'b': u'\b',
+                      'f': u'\f', '"': u'"', "'": u"'", '\\': u'\\'}
+_tsv_integer = re.compile(r'^[+-]?[0-9]+$')
+_tsv_decimal = re.compile(r'^[+-]?[0-9]*\.[0-9]+$')
+_tsv_double = re.compile(r'^[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)[eE][+-]?[0-9]+$')
+
+def _tsv_unescape(match):
+    short, long, char = match.groups()
+    if short or long:
+        return unichr(int(short or long, 16))
+    return _tsv_escaped_chars.get(char, char)
+
+def tsv_to_rdflib(value):
+    """ Convert a term from a SPARQL TSV result to an `rdflib` term.
+
+    Terms are encoded in Turtle syntax, the empty string stands for
+    an unbound value and is converted to `None`.
+
+    """
+
+    if not value:
+        return None
+
+    first = value[0]
+    if first == '<':
+        return term_cache.uri(value[1:-1])
+    elif first == '"':
+        end = value.rindex('"')
+        label = _tsv_escapes.sub(_tsv_unescape, value[1:end])
+        rest = value[end + 1:]
+        if rest.startswith('@'):
+            return term_cache.literal(label, lang=rest[1:])
+        elif rest.startswith('^^'):
+            return term_cache.literal(label, datatype=rest[2:].strip('<>'))
+        return term_cache.literal(label)
+    elif value.startswith('_:'):
+        return term_cache.bnode(value[2:])
+    elif value in ('true', 'false'):
+        return term_cache.literal(value, datatype=XSD['boolean'])
+    elif _tsv_integer.match(value):
+        return term_cache.literal(value, datatype=XSD['integer'])
+    elif _tsv_decimal.match(value):
+        return term_cache.literal(value, datatype=XSD['decimal'])
+    elif _tsv_double.match(value):
+        return term_cache.literal(value, datatype=XSD['double'])
+
+    raise ValueError("Not a TSV encoded RDF term: %s" % value)
+
+def csv_to_rdflib(value):
+    """ Convert a value from a SPARQL CSV result to an `rdflib` term.
+
+    The CSV format doesn't say which values are URIs, blank nodes or
+    literals and drops datatypes and languages. Values that look like URIs
+    become `URIRef`, values starting with `_:` become `BNode`, everything
+    else is a plain `Literal`. The empty string is converted to `None`.
+
+    """
+
+    if not value:
+        return None
+    elif value.startswith('_:'):
+        return term_cache.bnode(value[2:])
+    elif is_uri(value):
+        return term_cache.uri(value)
+    return term_cache.literal(value)
+
+def parse_tsv(stream, encoding='utf-8'):
+    """ Parse a SPARQL TSV result read line by line from ``stream``,
+    return :class:`SelectResult`. """
+
+    lines = iter(stream)
+    try:
+        header = lines.next().decode(encoding).rstrip('\r\n')
+    except StopIteration:
+        return SelectResult([], [])
+
+    variables = [variable.lstrip('?') for variable in header.split('\t')]
+    columns = [[] for variable in variables]
+    for line in lines:
+        line = line.decode(encoding).rstrip('\r\n')
+        if not line and len(columns) > 1:
+            continue
+        values = line.split('\t')
+        # Some endpoints leave out trailing unbound values.
+        values += [''] * (len(columns) - len(values))
+        for column, value in zip(columns, values):
+            column.append(tsv_to_rdflib(value))
+
+    return SelectResult(variables, columns)
+
+def parse_csv(stream, encoding='utf-8'):
+    """ Parse a SPARQL CSV result read line by line from ``stream``,
+    return :class:`SelectResult`. See :func:`csv_to_rdflib` for the
+    limitations of the format. """
+
+    rows = csv.reader(stream)
+    try:
+        header = rows.next()
+    except StopIteration:
+        return SelectResult([], [])
+
+    variables = [variable.decode(encoding) for variable in header]
+    columns = [[] for variable in variables]
+    for row in rows:
+        row += [''] * (len(columns) - len(row))
+        for column, value in zip(columns, row):
+            column.append(csv_to_rdflib(value.decode(encoding)))
+
+    return SelectResult(variables, columns)
+
+_SPARQL_NS = '{http://www.w3.org/2005/sparql-results#}'
+_XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+class XMLResultReader(object):
+    """ Incremental reader of a SPARQL XML result read from ``stream``.
+
+    The head of the document is read on construction: ``variables`` holds
+    the variable names and, for **ASK** results, ``boolean`` the answer.
+    Iterating over the reader yields one `{variable: term}` dict per result,
+    unbound variables are left out. Each result element is discarded as soon
+    as it is converted, so the whole document is never held in memory.
+
+    """
+
+    def __init__(self, stream):
+        self.variables = []
+        self.boolean = None
+        self.__events = iterparse(stream, events=('start', 'end'))
+
+        for event, element in self.__events:
+            tag = element.tag
+            if event == 'start':
+                if tag == _SPARQL_NS + 'results':
+                    break
+            elif tag == _SPARQL_NS + 'variable':
+                self.variables.append(element.get('name'))
+            elif tag == _SPARQL_NS + 'boolean':
+                self.boolean = element.text.strip() == 'true'
+                break
+
+    def __iter__(self):
+        for event, element in self.__events:
+            if event == 'end' and element.tag == _SPARQL_NS + 'result':
+                row = {}
+                for binding in element:
+                    # Elements without children are false, check length.
+                    if len(binding):
+                        row[binding.get('name')] = _xml_to_rdflib(binding[0])
+                element.clear()
+                yield row
+
+def parse_xml(stream):
+    """ Parse a SPARQL XML result read incrementally from ``stream``.
+
+    Return :class:`SelectResult` for **SELECT** results and a `bool` for
+    **ASK** results.
+
+    """
+
+    reader = XMLResultReader(stream)
+    if reader.boolean is not None:
+        return reader.boolean
+    return collect_columns(reader, reader.variables)
+
+def collect_columns(rows, variables = ()):
+    """ Return :class:`SelectResult` holding the `{variable: term}` dict
+    ``rows``, read in a single pass.
+
+    Columns are created in the order of ``variables`` followed by the
+    variables first seen in ``rows``.
+
+    """
+
+    variables = list(variables)
+    columns = [[] for variable in variables]
+    count = 0
+    for row in rows:
+        for name in row:
+            if name not in variables:
+                # Variable missing from the head, pad its column.
+                variables.append(name)
+                columns.append([None] * count)
+        for variable, column in zip(variables, columns):
+            column.append(row.get(variable))
+        count += 1
+
+    return SelectResult(variables, columns)
+
+def _xml_to_rdflib(term):
+    if term is None:
+        return None
+
+    tag = term.tag
+    text = term.text or u''
+    if tag == _SPARQL_NS + 'uri':
+        return term_cache.uri(text)
+    elif tag == _SPARQL_NS + 'literal':
+        return term_cache.literal(text, lang=term.get(_XML_LANG),
+                                  datatype=term.get('datatype'))
+    elif tag == _SPARQL_NS + 'bnode':
+        return term_cache.bnode(text)
+    return None
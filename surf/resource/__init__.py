@@ -48,7 +48,7 @@ from surf.rest import Rest
 from surf.serializer import to_json
 from surf.store import NO_CONTEXT, Store
 from surf.util import attr2rdf, namespace_split, rdf2attr
-from surf.util import uri_to_class, uuid_subject, value_to_rdf
+from surf.util import uri_to_class, uuid_subject, value_to_rdf, values_to_rdf
 
 a = RDF.type
 class ResourceMeta(type):
@@ -398,6 +398,15 @@ class Resource(object):
             return value.subject
         return value_to_rdf(value)
 
+    @classmethod
+    def to_rdf_values(cls, values):
+        """ Convert a sequence of values, the bulk version of `to_rdf`. """
+
+        if cls.to_rdf.im_func is not Resource.to_rdf.im_func:
+            return [cls.to_rdf(value) for value in values]
+        return [getattr(value, 'subject', value)
+                for value in values_to_rdf(values)]
+
     #TODO: add the auto_persist feature...
     def __setattr__(self, name, value):
         """
@@ -425,17 +434,15 @@ class Resource(object):
             rdf_dict = direct and self.__rdf_direct or self.__rdf_inverse
             if not isinstance(value, list):
                 value = [value]
-            rdf_dict[predicate] = []
-            rdf_dict[predicate].extend([self.to_rdf(val) for val in value])
             self.dirty = True
 
             if type(value) is ResourceValue:
-                pass
+                rdf_dict[predicate] = self.to_rdf_values(value)
             else:
-                if type(value) not in [list, tuple]:
-                    value = [value]
-
-                value = map(value_to_rdf, value)
+                # Convert literals once, to_rdf_values() then only has to
+                # replace resources with their subjects.
+                value = values_to_rdf(value)
+                rdf_dict[predicate] = self.to_rdf_values(value)
                 values_source = make_values_source(value, rdf_dict[predicate])
                 value = ResourceValue(values_source, self, name)
 
@@ -525,7 +532,7 @@ class Resource(object):
                         surf_values[i].query_contexts = self.query_contexts
 
                 # Initial synchronization
-                rdf_dict[predicate] = [resource.to_rdf(value) for value in surf_values]
+                rdf_dict[predicate] = resource.to_rdf_values(surf_values)
 
                 return surf_values, rdf_dict[predicate]
 
@@ -570,6 +577,16 @@ class Resource(object):
         self.dirty = False
         self.__full = True
 
+    def load_async(self):
+        """ Like :meth:`load`, but run in the background.
+
+        Return a :class:`surf.executor.Future`, see
+        :meth:`surf.store.Store.submit`.
+
+        """
+
+        return self.session[self.store_key].submit(self.load)
+
     def __set_predicate_values(self, results, direct):
         """ set the prediate - value(s) to the resource using lazy loading,
         `results` is a dict under the form:
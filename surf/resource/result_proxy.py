@@ -377,3 +377,23 @@ class ResultProxy(object):
             return item
 
         raise MultipleResultsFound("List has more than one item")
+
+    def all_async(self):
+        """ Fetch all resources in the background.
+
+        Return a :class:`surf.executor.Future` whose result is the list of
+        resources, see :meth:`surf.store.Store.submit`.
+
+        """
+
+        return self.__params["store"].submit(list, self)
+
+    def first_async(self):
+        """ Like :meth:`first`, but return a :class:`surf.executor.Future`. """
+
+        return self.__params["store"].submit(self.first)
+
+    def one_async(self):
+        """ Like :meth:`one`, but return a :class:`surf.executor.Future`. """
+
+        return self.__params["store"].submit(self.one)
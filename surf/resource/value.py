@@ -107,6 +107,14 @@ class ResourceValue(list):
 
         raise Exception("to_rdf has no reference to resource")
 
+    def to_rdf_values(self, values):
+        ''' return the **RDF** representations of all `values`
+        '''
+        if hasattr(self.resource, 'to_rdf_values'):
+            return self.resource.to_rdf_values(values)
+
+        return [self.to_rdf(value) for value in values]
+
     def __len__(self):
         self.__prepare_values()
         return list.__len__(self)
@@ -146,7 +154,8 @@ class ResourceValue(list):
         self.__prepare_values()
 
         self.set_dirty(True)
-        self.__rdf_values.extend([self.to_rdf(value) for value in L])
+        L = list(L)
+        self.__rdf_values.extend(self.to_rdf_values(L))
         return list.extend(self, L)
 
     def insert(self, i, value):
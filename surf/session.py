@@ -92,7 +92,7 @@ class Session(object):
         self.__stores = {}
 
         if default_store:
-            if type(default_store) is not Store:
+            if not isinstance(default_store, Store):
                 raise Exception('the arguments is not a valid Store instance')
             self.default_store = default_store
 
@@ -110,7 +110,7 @@ class Session(object):
         """ Set the `store` for the specified key, if value not a `Store`
         instance ignored. """
 
-        if type(value) is Store :
+        if isinstance(value, Store):
             self.__stores[key] = value
 
     def __delitem__(self, key):
@@ -392,3 +392,14 @@ class Session(object):
         # Copy set into list because it will shrink as we go through it
         for resource in list(Resource.get_dirty_instances()):
             resource.update()
+
+    def commit_async(self):
+        """ Like :meth:`commit`, but run in the background on the default
+        `store`.
+
+        Return a :class:`surf.executor.Future`, see
+        :meth:`surf.store.Store.submit`.
+
+        """
+
+        return self[self.default_store_key].submit(self.commit)
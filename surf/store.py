@@ -36,10 +36,13 @@
 __author__ = 'Cosmin Basca'
 
 import logging
+import threading
 from plugin import manager
 from plugin.manager import load_plugins, PluginNotFoundException, add_plugin_path, registered_readers, registered_writers
 from plugin.reader import RDFReader
+from plugin.replica import ReplicaReader
 from plugin.writer import RDFWriter
+from surf.executor import Executor, DEFAULT_WORKERS
 from surf.query import Query
 from surf.rdf import URIRef
 from surf.query import Query
@@ -52,6 +55,14 @@ __writers__ = manager.__writers__
 # this explicitly says that no context should be used.
 NO_CONTEXT = "no-context"
 
+# Store arguments configuring the ReplicaReader, and its parameter names.
+_REPLICA_OPTIONS = {"replica_routing": "routing",
+                    "hedge_percentile": "hedge_percentile",
+                    "replica_max_failures": "max_failures",
+                    "replica_eject_seconds": "eject_seconds",
+                    "replica_health_check": "health_check",
+                    "replica_workers": "workers"}
+
 class Store(object):
     """ The `Store` class is comprised of a reader and a writer, getting
     access to an underlying triple store. Also store specific parameters must
@@ -98,12 +109,50 @@ class Store(object):
         else:
             self.writer = RDFWriter(self.reader, *args, **kwargs)
 
+        replicas = kwargs.get("replicas")
+        if replicas:
+            self.reader = self.__replica_reader(reader, replicas, args, kwargs)
+
         if hasattr(self.reader, 'use_subqueries'):
             self.use_subqueries = property(fget=lambda self: self.reader.use_subqueries)
 
+        self.__async_workers = int(kwargs.get("async_workers", DEFAULT_WORKERS))
+        self.__executor = None
+        self.__executor_lock = threading.Lock()
+
         self.log.info('store initialized')
 
 
+    def __replica_reader(self, reader, replicas, args, kwargs):
+        """ Return a :class:`surf.plugin.replica.ReplicaReader` reading
+        from the configured `reader` and from one `reader` per replica.
+
+        A replica is either a configured `reader` or a dict of arguments
+        that replace the `store` arguments for its `reader`. The `writer`
+        keeps using the configured `reader`.
+
+        """
+
+        readers = [self.reader]
+        for replica in replicas:
+            if isinstance(replica, RDFReader):
+                readers.append(replica)
+                continue
+
+            replica_kwargs = dict(kwargs)
+            del replica_kwargs["replicas"]
+            replica_kwargs.update(replica)
+            if reader in __readers__:
+                readers.append(__readers__[reader](*args, **replica_kwargs))
+            else:
+                readers.append(RDFReader(*args, **replica_kwargs))
+
+        options = {}
+        for name in _REPLICA_OPTIONS:
+            if name in kwargs:
+                options[_REPLICA_OPTIONS[name]] = kwargs[name]
+        return ReplicaReader(readers, **options)
+
     def __add_default_context(self, context):
         """ Return default context if context is None. """
 
@@ -126,15 +175,43 @@ class Store(object):
         """ True if `logging` is enabled, False otherwise. """
         return (self.log.level == logging.DEBUG)
 
+    def submit(self, function, *args, **kwargs):
+        """ Run ``function(*args, **kwargs)`` in the background.
+
+        The call is queued on the `store`'s :class:`surf.executor.Executor`,
+        which runs at most `async_workers` calls (8 by default) at the same
+        time. Return a :class:`surf.executor.Future` for its result.
+
+        """
+
+        self.__executor_lock.acquire()
+        try:
+            if self.__executor is None:
+                self.__executor = Executor(self.__async_workers)
+            executor = self.__executor
+        finally:
+            self.__executor_lock.release()
+
+        return executor.submit(function, *args, **kwargs)
+
     def close(self):
         """ Close the `store`.
 
-        Both the `reader` and the `writer` plugins are closed.
+        Calls still running in the background are waited for, then both
+        the `reader` and the `writer` plugins are closed.
         See :func:`surf.plugin.writer.RDFWriter.close`
         and :func:`surf.plugin.reader.RDFReader.close` methods.
 
         """
 
+        self.__executor_lock.acquire()
+        try:
+            executor, self.__executor = self.__executor, None
+        finally:
+            self.__executor_lock.release()
+        if executor:
+            executor.shutdown()
+
         try:
             self.reader.close()
             self.log.debug('reader closed successfully')
@@ -9,6 +9,7 @@ from surf.store import NO_CONTEXT
 from surf.query import select, a
 from surf.rdf import Literal, URIRef
 from surf.exc import CardinalityException
+from surf.executor import wait
 from surf.util import value_to_rdf, json_to_rdflib
 from surf import ns
 
@@ -278,6 +279,30 @@ class PluginTestMixin(object):
         person = Person.all().first()
         self.assertEquals(person.subject, URIRef("http://John"))
 
+    def test_async(self):
+        """ Test background access with ResultProxy and Resource. """
+
+        _, session = self._get_store_session()
+        self._create_persons(session)
+        Person = session.get_class(surf.ns.FOAF + "Person")
+
+        persons = Person.all().all_async().result(10)
+        self.assertEquals(len(persons), 3)
+
+        futures = [person.load_async() for person in persons]
+        wait(futures, 10)
+        names = sorted([person.foaf_name.first for person in persons])
+        self.assertEquals(names, [Literal("Jane"), Literal("John"),
+                                  Literal("Mary")])
+
+        john = Person.get_by(foaf_name="John").first_async().result(10)
+        self.assertEquals(john.subject, URIRef("http://John"))
+
+        john.foaf_name = "Johnny"
+        session.commit_async().result(10)
+        john = Person.get_by(foaf_name="Johnny").one_async().result(10)
+        self.assertEquals(john.subject, URIRef("http://John"))
+
     def test_one(self):
         """ Test ResourceProxy.one(). """
 
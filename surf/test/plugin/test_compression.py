@@ -0,0 +1,72 @@
+# coding=UTF-8
+""" Module for surf.plugin.compression tests. """
+
+import zlib
+from cStringIO import StringIO
+from gzip import GzipFile
+from unittest import TestCase
+
+from surf.plugin.compression import HTTPCompression
+
+def _gzip(data):
+    buffer = StringIO()
+    gzip_file = GzipFile(fileobj = buffer, mode = "wb")
+    gzip_file.write(data)
+    gzip_file.close()
+    return buffer.getvalue()
+
+class TestCompression(TestCase):
+    """ Tests for HTTPCompression and DecodedStream. """
+
+    data = "".join(["line %d\n" % i for i in range(5000)])
+
+    def test_decode(self):
+        """ Test decoding of gzip, deflate and identity responses. """
+
+        compression = HTTPCompression()
+        raw_deflate = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        raw_deflate = raw_deflate.compress(self.data) + raw_deflate.flush()
+        for encoding, encoded in [("gzip", _gzip(self.data)),
+                                  ("deflate", zlib.compress(self.data)),
+                                  ("deflate", raw_deflate),
+                                  (None, self.data)]:
+            stream = compression.decode_response(StringIO(encoded), encoding)
+            self.assertEquals(stream.read(5), "line ")
+            self.assertEquals(stream.readline(), "0\n")
+            self.assertEquals(list(stream)[-1], "line 4999\n")
+            self.assertEquals(stream.read(), "")
+
+        stats = compression.stats()
+        self.assertEquals(stats["bytes_received_uncompressed"],
+                          4 * len(self.data))
+        self.assertTrue(stats["bytes_saved"] > 0)
+
+    def test_read_lines(self):
+        """ Test mixed read() and readline() calls on a decoded stream. """
+
+        stream = HTTPCompression().decode_response(StringIO(self.data), None)
+        lines = []
+        while True:
+            line = stream.readline(4)
+            if not line:
+                break
+            lines.append(line + stream.readline())
+        self.assertEquals("".join(lines), self.data)
+        self.assertEquals(lines[4321], "line 4321\n")
+        self.assertEquals(stream.read(10), "")
+
+    def test_encode_body(self):
+        """ Test that only large enough request bodies are compressed. """
+
+        compression = HTTPCompression(compress_requests = True,
+                                      min_size = 100)
+        self.assertEquals(compression.encode_body("x" * 10), ("x" * 10, None))
+
+        body, encoding = compression.encode_body(self.data)
+        self.assertEquals(encoding, "gzip")
+        self.assertEquals(GzipFile(fileobj = StringIO(body)).read(), self.data)
+        self.assertEquals(compression.stats()["bytes_sent"], 10 + len(body))
+
+        compression = HTTPCompression.from_kwargs({"http_compression" : "false"})
+        self.assertEquals(compression.request_headers(), {})
+        self.assertEquals(compression.encode_body(self.data), (self.data, None))
@@ -21,3 +21,30 @@ class TestQueryReader(TestCase):
             
             
         MyQueryReader().convert(None)
+
+    def test_convert(self):
+        """ Test RDFQueryReader.convert() with rows and columns. """
+
+        table = [{"p" : "p1", "v" : "v1", "c" : "c1"},
+                 {"p" : "p1", "v" : "v1", "c" : "c2"},
+                 {"p" : "p2", "v" : "v2"}]
+
+        class TableQueryReader(RDFQueryReader):
+            def _to_table(self, _):
+                return table
+
+        class ColumnQueryReader(RDFQueryReader):
+            def _to_columns(self, _):
+                return (["p", "v", "c"], [["p1", "p1", "p2"],
+                                          ["v1", "v1", "v2"],
+                                          ["c1", "c2", None]])
+
+        expected = {"p1" : {"v1" : {None : ["c1", "c2"]}},
+                    "p2" : {"v2" : {None : []}}}
+        for reader in [TableQueryReader(), ColumnQueryReader()]:
+            self.assertEquals(reader.convert(None, "p", "v", "g", "c"),
+                              expected)
+            self.assertEquals(reader.convert(None, "v", "g", "c"),
+                              {"v1" : {None : ["c1", "c2"]},
+                               "v2" : {None : []}})
+            self.assertEquals(reader.convert(None, "p"), ["p1", "p1", "p2"])
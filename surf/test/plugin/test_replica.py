@@ -0,0 +1,125 @@
+""" Module for surf.plugin.replica tests. """
+
+import threading
+import time
+from unittest import TestCase
+
+import surf
+from surf.plugin.reader import RDFReader
+from surf.plugin.replica import ReplicaReader, MIN_HEDGE_SAMPLES
+
+class MockReader(RDFReader):
+    """ Reader answering with its name, optionally blocking or failing. """
+
+    def __init__(self, name, block=None, fail=False, sleep=0):
+        RDFReader.__init__(self)
+        self.name = name
+        self.block = block
+        self.fail = fail
+        self.sleep = sleep
+        self.calls = 0
+
+    def is_present(self, resource):
+        self.calls += 1
+        time.sleep(self.sleep)
+        if self.block:
+            self.block.wait()
+        if self.fail:
+            raise ValueError("%s failed" % self.name)
+        return self.name
+
+class TestReplicaReader(TestCase):
+    """ Tests for ReplicaReader. """
+
+    def test_routing(self):
+        """ Test that reads go to the fastest or least busy replica. """
+
+        first, second = MockReader("first"), MockReader("second")
+        reader = ReplicaReader([first, second], hedge_percentile=0)
+        replicas = reader.replicas
+        replicas[0].latency, replicas[1].latency = 0.5, 0.1
+        self.assertEquals(reader.is_present("s"), "second")
+
+        reader = ReplicaReader([first, second], routing="inflight",
+                               hedge_percentile=0)
+        reader.replicas[0].inflight = 0
+        reader.replicas[1].inflight = 2
+        self.assertEquals(reader.is_present("s"), "first")
+        self.assertRaises(ValueError, ReplicaReader, [first], routing="x")
+        reader.close()
+
+    def test_failover_and_ejection(self):
+        """ Test that failing replicas are skipped, ejected and checked. """
+
+        failing, working = MockReader("failing", fail=True), MockReader("ok")
+        checked = []
+        reader = ReplicaReader([failing, working], hedge_percentile=0,
+                               max_failures=2, eject_seconds=0,
+                               health_check=checked.append)
+        reader.replicas[1].latency = 1
+
+        self.assertEquals(reader.is_present("s"), "ok")
+        self.assertEquals(reader.is_present("s"), "ok")
+        self.assertEquals(failing.calls, 2)
+        self.assertTrue(reader.replicas[0].ejected_until is not None)
+
+        # The ejection ran out, the next read triggers a health check.
+        reader.ranked()
+        for _ in range(100):
+            if reader.replicas[0].ejected_until is None:
+                break
+            time.sleep(0.01)
+        self.assertEquals(checked, [failing])
+        self.assertEquals(reader.replicas[0].failures, 0)
+
+        reader = ReplicaReader([MockReader("a", fail=True)])
+        self.assertRaises(ValueError, reader.is_present, "s")
+
+    def test_hedging(self):
+        """ Test that slow reads are hedged on a second replica. """
+
+        block = threading.Event()
+        slow, fast = MockReader("slow"), MockReader("fast")
+        reader = ReplicaReader([slow, fast])
+        self.assertEquals(reader.hedge_delay(), None)
+
+        for _ in range(MIN_HEDGE_SAMPLES):
+            reader.is_present("s")
+        self.assertTrue(reader.hedge_delay() is not None)
+
+        # The slow replica looks best but doesn't answer.
+        slow.block = block
+        reader.replicas[0].latency = 0
+        reader.replicas[1].latency = 1
+        self.assertEquals(reader.is_present("s"), "fast")
+        block.set()
+        reader.close()
+
+    def test_failover_without_hedge(self):
+        """ Test that a failover to the last replica is not hedged. """
+
+        failing = MockReader("failing", sleep=0.02)
+        slow = MockReader("slow", sleep=0.02)
+        reader = ReplicaReader([failing, slow])
+        for _ in range(MIN_HEDGE_SAMPLES):
+            reader.is_present("s")
+        self.assertTrue(reader.hedge_delay() >= 0.02)
+
+        # The best replica fails before the hedge delay, the other one
+        # answers well after it.
+        failing.sleep, failing.fail = 0, True
+        slow.sleep = 0.1
+        reader.replicas[0].latency = 0
+        reader.replicas[1].latency = 1
+        self.assertEquals(reader.is_present("s"), "slow")
+        reader.close()
+
+    def test_store_replicas(self):
+        """ Test that Store reads from the replicas, writes through one. """
+
+        replica = MockReader("replica")
+        store = surf.Store(replicas=[replica], hedge_percentile=0)
+        self.assertTrue(isinstance(store.reader, ReplicaReader))
+        self.assertEquals(len(store.reader.replicas), 2)
+        self.assertFalse(isinstance(store.writer.reader, ReplicaReader))
+        store.close()
@@ -0,0 +1,84 @@
+# coding=UTF-8
+""" Module for SPARQL result parser tests. """
+
+from StringIO import StringIO
+from unittest import TestCase
+
+from surf.namespace import XSD
+from surf.plugin.results import parse_csv, parse_tsv, parse_xml
+from surf.rdf import BNode, Literal, URIRef
+
+class TestResults(TestCase):
+    """ Tests for surf.plugin.results module. """
+
+    expected = [[URIRef("http://s1"), URIRef("http://s2")],
+                [Literal(u"Jān\tis", lang="lv"), None],
+                [Literal("42", datatype=XSD["integer"]), BNode("b1")]]
+
+    def test_parse_tsv(self):
+        """ Test parsing of SPARQL TSV results. """
+
+        data = ('?s\t?name\t?v\n'
+                '<http://s1>\t"J\xc4\x81n\\tis"@lv\t42\n'
+                '<http://s2>\t\t_:b1\n')
+        result = parse_tsv(StringIO(data))
+
+        self.assertEquals(result.variables, ["s", "name", "v"])
+        self.assertEquals(result.columns, self.expected)
+        self.assertEquals(type(result.columns[1][0]), Literal)
+        self.assertEquals(result.columns[2][0].datatype, XSD["integer"])
+
+    def test_parse_short_rows(self):
+        """ Test that trimmed trailing unbound values are padded. """
+
+        x, y = URIRef("http://x"), URIRef("http://y")
+        result = parse_tsv(StringIO('?a\t?b\n<http://x>\n\t<http://y>\n'))
+        self.assertEquals(result.columns, [[x, None], [None, y]])
+        self.assertEquals(result.to_table(), [{"a" : x}, {"b" : y}])
+
+        x, y = URIRef("http://ex.com/x"), URIRef("http://ex.com/y")
+        result = parse_csv(StringIO('a,b\r\nhttp://ex.com/x\r\n'
+                                    ',http://ex.com/y\r\n'))
+        self.assertEquals(result.columns, [[x, None], [None, y]])
+
+    def test_parse_csv(self):
+        """ Test parsing of SPARQL CSV results. """
+
+        data = 's,name\r\nhttp://ex.com/s1,"Jānis, 42"\r\n_:b1,\r\n'
+        result = parse_csv(StringIO(data))
+
+        self.assertEquals(result.variables, ["s", "name"])
+        self.assertEquals(result.columns, [[URIRef("http://ex.com/s1"),
+                                            BNode("b1")],
+                                           [Literal(u"Jānis, 42"), None]])
+
+    def test_parse_xml(self):
+        """ Test parsing of SPARQL XML results. """
+
+        data = """<?xml version="1.0"?>
+<sparql xmlns="http://www.w3.org/2005/sparql-results#">
+  <head><variable name="s"/><variable name="name"/><variable name="v"/></head>
+  <results>
+    <result>
+      <binding name="s"><uri>http://s1</uri></binding>
+      <binding name="name"><literal xml:lang="lv">Jān\tis</literal></binding>
+      <binding name="v"><literal datatype="http://www.w3.org/2001/XMLSchema#integer">42</literal></binding>
+    </result>
+    <result>
+      <binding name="v"><bnode>b1</bnode></binding>
+      <binding name="s"><uri>http://s2</uri></binding>
+    </result>
+  </results>
+</sparql>"""
+        result = parse_xml(StringIO(data))
+
+        self.assertEquals(result.variables, ["s", "name", "v"])
+        self.assertEquals(result.columns, self.expected)
+        self.assertEquals(result.to_table()[1], {"s" : URIRef("http://s2"),
+                                                 "v" : BNode("b1")})
+
+        data = """<?xml version="1.0"?>
+<sparql xmlns="http://www.w3.org/2005/sparql-results#">
+  <head></head><boolean>true</boolean>
+</sparql>"""
+        self.assertEquals(parse_xml(StringIO(data)), True)
@@ -0,0 +1,50 @@
+# coding=UTF-8
+""" Module for surf.executor tests. """
+
+import threading
+from unittest import TestCase
+
+from surf.executor import Executor, Future, TimeoutError, wait
+
+class TestExecutor(TestCase):
+    """ Tests for Executor and Future classes. """
+
+    def test_submit(self):
+        """ Test that submitted calls return their results. """
+
+        executor = Executor(2)
+        futures = executor.map(lambda x: x * 2, range(10))
+        self.assertEquals(wait(futures), range(0, 20, 2))
+        self.assertTrue(futures[0].done())
+        executor.shutdown()
+        self.assertRaises(RuntimeError, executor.submit, len, [])
+
+    def test_exception(self):
+        """ Test that exceptions are raised by Future.result(). """
+
+        executor = Executor(1)
+        future = executor.submit(int, "x")
+        self.assertRaises(ValueError, future.result)
+        self.assertTrue(isinstance(future.exception(), ValueError))
+        self.assertEquals(executor.submit(int, "1").exception(), None)
+        executor.shutdown()
+
+    def test_timeout_and_callbacks(self):
+        """ Test Future.result() timeout and done callbacks. """
+
+        event = threading.Event()
+        executor = Executor(1)
+        future = executor.submit(event.wait)
+        self.assertRaises(TimeoutError, future.result, 0.01)
+
+        done = []
+        future.add_done_callback(done.append)
+        self.assertEquals(done, [])
+        event.set()
+        future.result(10)
+        executor.shutdown()
+        self.assertEquals(done, [future])
+
+        # Callbacks added to finished futures are called immediately.
+        future.add_done_callback(done.append)
+        self.assertEquals(done, [future, future])
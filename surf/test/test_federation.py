@@ -0,0 +1,116 @@
+""" Module for surf.federation tests. """
+
+import threading
+from unittest import TestCase
+
+from surf.federation import FederatedStore, FederationError
+from surf.rdf import URIRef
+
+class MockStore(object):
+    """ Member store answering from fixed data. """
+
+    default_context = None
+
+    def __init__(self, data=None, block=None, fail=False):
+        self.data = data or {}
+        self.block = block
+        self.fail = fail
+        self.saved = []
+        self.closed = False
+
+    def __answer(self, key):
+        if self.block:
+            self.block.wait()
+        if self.fail:
+            raise ValueError("member failed")
+        return self.data.get(key)
+
+    def load(self, resource, direct):
+        return self.__answer("load")
+
+    def get_by(self, params):
+        self.params = params
+        return self.__answer("get_by")
+
+    def is_present(self, resource):
+        return self.__answer("is_present")
+
+    def execute_sparql(self, query, format="JSON"):
+        return self.__answer("sparql")
+
+    def save(self, *resources):
+        self.saved.extend(resources)
+
+    def enable_logging(self, enable):
+        pass
+
+    def close(self):
+        self.closed = True
+
+S1, S2, S3 = URIRef("http://s1"), URIRef("http://s2"), URIRef("http://s3")
+P, V1, V2 = URIRef("http://p"), URIRef("http://v1"), URIRef("http://v2")
+
+class TestFederatedStore(TestCase):
+    """ Tests for FederatedStore. """
+
+    def test_merge(self):
+        """ Test that member results are merged per subject. """
+
+        first = MockStore({"load": {P: {V1: {None: []}}},
+                           "get_by": [(S1, {"direct": {P: {V1: {}}}}),
+                                      (S2, {})],
+                           "is_present": False})
+        second = MockStore({"load": {P: {V2: {None: []}}},
+                            "get_by": [(S3, {}),
+                                       (S1, {"direct": {P: {V2: {}}}})],
+                            "is_present": True})
+        store = FederatedStore([first, second])
+
+        self.assertEquals(store.load(S1, True),
+                          {P: {V1: {None: []}, V2: {None: []}}})
+        self.assertTrue(store.is_present(S1))
+
+        results = store.get_by({"limit": 2, "offset": 1})
+        self.assertEquals([subject for subject, _ in results], [S2, S3])
+        self.assertEquals(first.params, {"limit": 3})
+
+        results = store.get_by({"order": True, "limit": 2})
+        self.assertEquals([subject for subject, _ in results], [S1, S2])
+        results = store.get_by({"order": True, "desc": True, "limit": 2})
+        self.assertEquals([subject for subject, _ in results], [S3, S2])
+        self.assertRaises(ValueError, store.get_by, {"order": P, "limit": 2})
+
+        results = dict(store.get_by({}))
+        self.assertEquals(results[S1], {"direct": {P: {V1: {}, V2: {}}}})
+        store.close()
+        self.assertTrue(first.closed and second.closed)
+
+    def test_partial_results(self):
+        """ Test that failing and slow members are left out. """
+
+        block = threading.Event()
+        answering = MockStore({"sparql": {"head": {"vars": ["s"]},
+                                          "results": {"bindings": [1]}}})
+        slow = MockStore({"sparql": {}}, block=block)
+        failing = MockStore(fail=True)
+        store = FederatedStore([answering, slow, failing],
+                               timeouts={slow: 0.05})
+
+        result = store.execute_sparql("SELECT ?s WHERE { ?s ?p ?o }")
+        self.assertEquals(result, {"head": {"vars": ["s"]},
+                                   "results": {"bindings": [1]}})
+
+        store = FederatedStore([slow, failing], timeout=0.05)
+        self.assertRaises(FederationError, store.load, S1, True)
+        block.set()
+
+    def test_writes(self):
+        """ Test that writes go to the primary store only. """
+
+        first, primary = MockStore(), MockStore()
+        store = FederatedStore([first, primary], primary=primary)
+        store.save("resource")
+        self.assertEquals(primary.saved, ["resource"])
+        self.assertEquals(first.saved, [])
+        self.assertTrue(store.primary is primary)
+        self.assertRaises(ValueError, FederatedStore, [])
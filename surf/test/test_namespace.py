@@ -1,3 +1,4 @@
+import threading
 from unittest import TestCase
 
 from surf import ns
@@ -40,4 +41,79 @@ class TestNamespace(TestCase):
 
         prefix, _ = util_get_namespace(ns.GEO)
         self.assertEquals(prefix, "GEO")
-        
\ No newline at end of file
+        
+    def test_split_longest_prefix(self):
+        """ Test that split() uses the longest registered namespace. """
+
+        ns.register(trie='http://trie.ns/')
+        ns.register(trie_deep='http://trie.ns/deep/')
+
+        prefix, namespace, local = ns.split('http://trie.ns/deep/a/b')
+        self.assertEquals(prefix, 'TRIE_DEEP')
+        self.assertEquals(namespace, Namespace('http://trie.ns/deep/'))
+        self.assertEquals(local, 'a/b')
+
+        prefix, _, local = ns.split('http://trie.ns/other/c')
+        self.assertEquals((prefix, local), ('TRIE', 'other/c'))
+
+        prefix, _, local = ns.split(ns.RDFS['label'])
+        self.assertEquals((prefix, local), ('RDFS', 'label'))
+
+    def test_anonymous_limit(self):
+        """ Test that anonymous namespaces are capped. """
+
+        limit = ns.get_anonymous_limit()
+        ns.set_anonymous_limit(2)
+        try:
+            first, _, _ = ns.split('http://anon.ns/1/x')
+            ns.split('http://anon.ns/2/x')
+            ns.split('http://anon.ns/3/x')
+            self.assertEquals(ns.get_namespace_url(first), None)
+            self.assertEquals(ns.get_prefix('http://anon.ns/1/'), None)
+
+            # The evicted base gets a new anonymous prefix.
+            again, _, _ = ns.split('http://anon.ns/1/x')
+            self.assertNotEquals(again, first)
+
+            # Over the limit a tenth of it is dropped at once.
+            ns.set_anonymous_limit(0)
+            ns.set_anonymous_limit(20)
+            for i in range(20):
+                ns.split('http://anon.ns/batch/%d/x' % i)
+            current = ns.generation()
+            ns.split('http://anon.ns/batch/20/x')
+            self.assertEquals(ns.generation(), current + 1)
+            self.assertEquals(ns.get_prefix('http://anon.ns/batch/2/'), None)
+            self.assertNotEquals(ns.get_prefix('http://anon.ns/batch/3/'), None)
+            ns.split('http://anon.ns/batch/21/x')
+            self.assertEquals(ns.generation(), current + 1)
+        finally:
+            ns.set_anonymous_limit(limit)
+
+    def test_concurrent_get_namespace(self):
+        """ Test that concurrent get_namespace() calls mint one prefix. """
+
+        prefixes = []
+        start = threading.Event()
+
+        def worker():
+            start.wait()
+            for i in range(50):
+                prefix, _ = ns.get_namespace('http://threads.ns/%d#' % i)
+                prefixes.append((i, prefix))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        by_base = {}
+        for i, prefix in prefixes:
+            by_base.setdefault(i, set()).add(prefix)
+        self.assertEquals(len(by_base), 50)
+        for i in by_base:
+            self.assertEquals(len(by_base[i]), 1)
+            self.assertEquals(ns.get_prefix('http://threads.ns/%d#' % i),
+                              by_base[i].pop())
@@ -7,6 +7,7 @@ import surf
 import surf.store
 from surf import ns
 from surf.plugin import query_reader
+from surf.rdf import Literal, URIRef
 
 class TestResourceStandalone(TestCase):
     """ Resource tests that don't require running triple store. """
@@ -32,4 +33,20 @@ class TestResourceStandalone(TestCase):
         # FIXME: should also test returned data.         
         
   
-        
\ No newline at end of file
+        
+    def test_setattr_values(self):
+        """ Test that assigned values are converted for the resource. """
+
+        Person = self.session.get_class(ns.FOAF['Person'])
+        friend = Person("http://friend")
+        person = Person("http://person")
+
+        person.foaf_nick = ["a", ("b", "en"), friend]
+        self.assertEquals(list(person.foaf_nick),
+                          [Literal("a"), Literal("b", lang="en"), friend])
+        self.assertEquals(person.rdf_direct[ns.FOAF['nick']],
+                          [Literal("a"), Literal("b", lang="en"),
+                           URIRef("http://friend")])
+
+        person.foaf_nick.extend(value for value in ["c"])
+        self.assertEquals(person.rdf_direct[ns.FOAF['nick']][-1], Literal("c"))
@@ -3,7 +3,10 @@
 from unittest import TestCase
 
 import surf
-from surf.util import attr2rdf, rdf2attr, single
+from surf.rdf import Literal, URIRef
+from surf.util import attr2rdf, attr2rdf_cache, json_to_rdflib, NameCache
+from surf.util import rdf2attr, single
+from surf.util import TermCache, value_to_rdf, values_to_rdf
 
 class TestUtil(TestCase):
     """ Tests for surf.util module. """
@@ -44,3 +47,108 @@ class TestUtil(TestCase):
             # Test deleting "name"
             del instance.name
             self.assertEquals(instance.foaf_name, [])
+
+    def test_term_cache(self):
+        """ Test that TermCache interns terms and counts hits. """
+
+        cache = TermCache(size=2)
+        uri = cache.uri("http://p1")
+        self.assertEquals(uri, URIRef("http://p1"))
+        self.assertTrue(cache.uri("http://p1") is uri)
+
+        # Same value but different kind, language or datatype.
+        literal = cache.literal("http://p1")
+        self.assertEquals(type(literal), Literal)
+        self.assertFalse(cache.literal("http://p1", lang="en") is literal)
+        self.assertEquals(cache.stats()["hits"], 1)
+        self.assertEquals(cache.stats()["misses"], 3)
+        self.assertEquals(len(cache), 2)
+
+        # "http://p1" URIRef was the least recently used, so it was dropped.
+        self.assertFalse(cache.uri("http://p1") is uri)
+
+        cache.reset_stats()
+        self.assertEquals(cache.hit_rate(), 0.0)
+
+    def test_json_to_rdflib(self):
+        """ Test that json_to_rdflib returns interned terms. """
+
+        obj = {"type" : "typed-literal", "value" : "1",
+               "datatype" : "http://www.w3.org/2001/XMLSchema#integer"}
+        value = json_to_rdflib(obj)
+        self.assertEquals(value.toPython(), 1)
+        self.assertTrue(json_to_rdflib(obj) is value)
+
+    def test_name_cache(self):
+        """ Test that NameCache is bounded and follows namespace changes. """
+
+        cache = NameCache(size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEquals(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertEquals(len(cache), 1)
+        self.assertEquals(cache.get("a"), None)
+
+        surf.ns.register(namecache="http://namecache/ns#")
+        self.assertEquals(cache.get("c"), None)
+
+        disabled = NameCache(size=0)
+        disabled.put("a", 1)
+        self.assertEquals(len(disabled), 0)
+
+    def test_attr2rdf_register(self):
+        """ Test that attr2rdf and rdf2attr see re-registered prefixes. """
+
+        surf.ns.register(cached="http://cached/one#")
+        self.assertEquals(attr2rdf("cached_name"),
+                          (URIRef("http://cached/one#name"), True))
+        self.assertEquals(rdf2attr(URIRef("http://cached/one#name"), True),
+                          "cached_name")
+
+        surf.ns.register(cached="http://cached/two#")
+        self.assertEquals(attr2rdf("cached_name"),
+                          (URIRef("http://cached/two#name"), True))
+        self.assertEquals(attr2rdf("is_cached_name_of"),
+                          (URIRef("http://cached/two#name"), False))
+        self.assertEquals(rdf2attr(URIRef("http://cached/two#name"), False),
+                          "is_cached_name_of")
+
+    def test_name_cache_generation(self):
+        """ Test that NameCache drops values computed under an old generation. """
+
+        cache = NameCache()
+        current = surf.ns.generation()
+        cache.put("a", 1, current)
+        cache.put("b", 2, current - 1)
+        self.assertEquals(cache.get("a", current), 1)
+        self.assertEquals(cache.get("b", current), None)
+        self.assertEquals(cache.get("a", current + 1), None)
+
+    def test_attr2rdf_anonymous(self):
+        """ Test that anonymous prefixes keep cached names and resolve. """
+
+        name = rdf2attr(URIRef("http://anonymous/one#name"), True)
+        self.assertEquals(attr2rdf(name),
+                          (URIRef("http://anonymous/one#name"), True))
+        size, current = len(attr2rdf_cache), surf.ns.generation()
+
+        following = "ns%d_name" % (int(name[2:-5]) + 1)
+        self.assertEquals(attr2rdf(following), (None, True))
+        self.assertEquals(rdf2attr(URIRef("http://anonymous/two#name"), True),
+                          following)
+        self.assertEquals(surf.ns.generation(), current)
+        self.assertEquals(len(attr2rdf_cache), size)
+        self.assertEquals(attr2rdf(following),
+                          (URIRef("http://anonymous/two#name"), True))
+
+    def test_values_to_rdf(self):
+        """ Test that values_to_rdf converts like value_to_rdf. """
+
+        values = ["a", u"b", 1, 1.5, True, ("c", "en"), {"value": "d"},
+                  {}, URIRef("http://p1"), None]
+        self.assertEquals(values_to_rdf(values), map(value_to_rdf, values))
+        self.assertEquals(values_to_rdf(iter(values[:2])),
+                          [Literal("a"), Literal(u"b")])
+        self.assertEquals(value_to_rdf(("c", "en", None)),
+                          Literal("c", lang="en"))
@@ -38,10 +38,11 @@ __author__ = 'Cosmin Basca'
 from datetime import datetime, date, time
 import new
 import re
+import threading
 from urlparse import urlparse
 from uuid import uuid4
 
-from surf.namespace import get_namespace, get_namespace_url
+from surf.namespace import generation, get_namespace, get_namespace_url, split
 from surf.namespace import get_fallback_namespace, SURF
 from surf.rdf import BNode, Literal, Namespace, URIRef
 
@@ -59,13 +60,13 @@ def namespace_split(uri):
 
     """
 
-    sp = uri.rfind('#') != -1 and '#' or '/'
-    base, predicate = uri.rsplit(sp, 1)
-    return get_namespace('%s%s' % (base, sp))[1], predicate
+    _, namespace, predicate = split(uri)
+    return namespace, predicate
 
 def uri_split(uri):
-    """ Split the `uri` into base path and remainder,
-    the base is everything that comes before the last *#*' or */* including it
+    """ Split the `uri` into the prefix of its `namespace` and remainder,
+    the `namespace` is the longest registered one the `uri` starts with, or
+    everything that comes before the last *#*' or */* including it
 
     .. code-block:: python
 
@@ -74,9 +75,8 @@ def uri_split(uri):
 
     """
 
-    sp = uri.rfind('#') != -1 and '#' or '/'
-    base, predicate = uri.rsplit(sp, 1)
-    return get_namespace('%s%s' % (base, sp))[0], predicate
+    prefix, _, predicate = split(uri)
+    return prefix, predicate
 
 def uri_to_classname(uri):
     '''handy function to convert a `uri` to a Python valid `class name`
@@ -116,6 +116,11 @@ def attr2rdf(attrname):
     
     """
     
+    current = generation()
+    result = attr2rdf_cache.get(attrname, current)
+    if result is not None:
+        return result
+
     def tordf(attrname):
         prefix, predicate = attrname.split('_', 1)
         ns = get_namespace_url(prefix)
@@ -125,10 +130,16 @@ def attr2rdf(attrname):
             return None
 
     if pattern_inverse.match(attrname):
-        return  tordf(attrname.replace('is_', '').replace('_of', '')), False
+        result = tordf(attrname.replace('is_', '').replace('_of', '')), False
     elif pattern_direct.match(attrname):
-        return  tordf(attrname), True
-    return None, None
+        result = tordf(attrname), True
+    else:
+        result = None, None
+    # Unknown prefixes are not kept, they may be registered anonymously
+    # without a change of generation.
+    if result[0] is not None or result[1] is None:
+        attr2rdf_cache.put(attrname, result, current)
+    return result
 
 def rdf2attr(uri, direct):
     """ Inverse of `attr2rdf`, return the attribute name,
@@ -143,9 +154,17 @@ def rdf2attr(uri, direct):
 
     """
 
+    key = (uri, direct)
+    current = generation()
+    attribute = rdf2attr_cache.get(key, current)
+    if attribute is not None:
+        return attribute
+
     ns, predicate = uri_split(uri)
     attribute = '%s_%s' % (ns.lower(), predicate)
-    return direct and attribute or 'is_%s_of' % attribute
+    attribute = direct and attribute or 'is_%s_of' % attribute
+    rdf2attr_cache.put(key, attribute, current)
+    return attribute
 
 
 def is_attr_direct(attrname):
@@ -231,23 +250,276 @@ def pretty_rdf(uri):
         return pretty
     return ''
 
+def _sequence_to_rdf(value):
+    language = len(value) > 1 and value[1] or None
+    datatype = len(value) > 2 and value[2] or None
+    return Literal(value[0], lang=language, datatype=datatype)
+
+def _dict_to_rdf(value):
+    val = value.get("value")
+    language = value.get("language")
+    datatype = value.get("datatype")
+    if val:
+        return Literal(val, lang=language, datatype=datatype)
+    return value
+
+# Converter for each exactly matching type, values of any other type
+# (resources, rdflib terms, ...) are returned unchanged.
+_VALUE_CONVERTERS = {
+    list: _sequence_to_rdf,
+    tuple: _sequence_to_rdf,
+    dict: _dict_to_rdf,
+}
+for _type in [str, unicode, float, int, long, bool, datetime, date, time]:
+    _VALUE_CONVERTERS[_type] = Literal
+del _type
+
 def value_to_rdf(value):
     """ Convert the value to an `rdflib` compatible type if appropriate. """
 
-    if type(value) in [str, unicode, basestring, float, int, long, bool, datetime, date, time]:
-        return Literal(value)
-    elif type(value) in [list, tuple]:
-        language = len(value) > 1 and value[1] or None
-        datatype = len(value) > 2 and value[2] or None
-        return Literal(value[0], lang=language, datatype=datatype)
-    elif type(value) is dict:
-        val = value.get("value")
-        language = value.get("language")
-        datatype = value.get("datatype")
-        if val:
-            return Literal(val, lang=language, datatype=datatype)
+    converter = _VALUE_CONVERTERS.get(type(value))
+    if converter is None:
         return value
-    return value
+    return converter(value)
+
+def values_to_rdf(values):
+    """ Return a list with each of `values` converted as by `value_to_rdf`.
+
+    .. code-block:: python
+
+        >>> util.values_to_rdf(['a', ('b', 'en'), ns.FOAF['name']])
+        [rdflib.term.Literal(u'a'), rdflib.term.Literal(u'b', lang='en'), rdflib.term.URIRef('http://xmlns.com/foaf/0.1/name')]
+
+    """
+
+    get = _VALUE_CONVERTERS.get
+    result = []
+    append = result.append
+    for value in values:
+        converter = get(type(value))
+        if converter is None:
+            append(value)
+        else:
+            append(converter(value))
+    return result
+
+DEFAULT_TERM_CACHE_SIZE = 10000
+
+class TermCache(object):
+    """ Bounded LRU table of interned `rdflib` terms.
+
+    Reader plugins convert every cell of a query result into a `URIRef`,
+    `Literal` or `BNode`. Predicates, `rdf:type` values and graph URIs repeat
+    a lot in such results, so the converters ask the cache for the term
+    instead of constructing it, and equal terms become the same object.
+
+    Terms are keyed by their kind (`uri`, `literal` or `bnode`), value,
+    datatype and language. When more than ``size`` terms are held, the least
+    recently used one is dropped. A ``size`` of 0 disables interning.
+
+    .. code-block:: python
+
+        >>> name = util.term_cache.uri('http://xmlns.com/foaf/0.1/name')
+        >>> name is util.term_cache.uri('http://xmlns.com/foaf/0.1/name')
+        True
+        >>> util.term_cache.stats()
+        {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'size': 1, 'max_size': 10000}
+
+    """
+
+    def __init__(self, size=DEFAULT_TERM_CACHE_SIZE):
+        self.__lock = threading.Lock()
+        self.__max_size = size
+        self.clear()
+        self.reset_stats()
+
+    max_size = property(lambda self: self.__max_size)
+    """ Maximum number of terms held by the cache. """
+
+    hits = property(lambda self: self.__hits)
+    """ Number of lookups answered from the cache. """
+
+    misses = property(lambda self: self.__misses)
+    """ Number of lookups that had to construct a new term. """
+
+    def __len__(self):
+        return len(self.__map)
+
+    def clear(self):
+        """ Drop all interned terms, counters are left untouched. """
+
+        self.__lock.acquire()
+        try:
+            # Circular doubly linked list of [prev, next, key, term] links,
+            # root[1] is the least and root[0] the most recently used link.
+            root = []
+            root[:] = [root, root, None, None]
+            self.__root = root
+            self.__map = {}
+        finally:
+            self.__lock.release()
+
+    def reset_stats(self):
+        """ Reset the `hits` and `misses` counters. """
+
+        self.__hits = 0
+        self.__misses = 0
+
+    def hit_rate(self):
+        """ Return the fraction of lookups answered from the cache. """
+
+        total = self.__hits + self.__misses
+        if not total:
+            return 0.0
+        return float(self.__hits) / total
+
+    def stats(self):
+        """ Return the cache counters as a `dict`. """
+
+        return {'hits': self.__hits,
+                'misses': self.__misses,
+                'hit_rate': self.hit_rate(),
+                'size': len(self.__map),
+                'max_size': self.__max_size}
+
+    def get(self, kind, value, datatype=None, lang=None):
+        """ Return the interned term of ``kind`` (`uri`, `literal` or
+        `bnode`), constructing it on the first lookup. """
+
+        key = (kind, value, datatype, lang)
+        self.__lock.acquire()
+        try:
+            link = self.__map.get(key)
+            root = self.__root
+            if link is not None:
+                self.__hits += 1
+                # Move the link to the most recently used end.
+                link_prev, link_next, _, term = link
+                link_prev[1] = link_next
+                link_next[0] = link_prev
+                last = root[0]
+                last[1] = root[0] = link
+                link[0] = last
+                link[1] = root
+                return term
+
+            self.__misses += 1
+            term = self.__make_term(kind, value, datatype, lang)
+            if self.__max_size <= 0:
+                return term
+
+            if len(self.__map) >= self.__max_size:
+                oldest = root[1]
+                root[1] = oldest[1]
+                oldest[1][0] = root
+                del self.__map[oldest[2]]
+
+            last = root[0]
+            last[1] = root[0] = self.__map[key] = [last, root, key, term]
+            return term
+        finally:
+            self.__lock.release()
+
+    def uri(self, value):
+        """ Return the interned `URIRef` for ``value``. """
+
+        return self.get('uri', value)
+
+    def literal(self, value, lang=None, datatype=None):
+        """ Return the interned `Literal` for ``value``. """
+
+        return self.get('literal', value, datatype, lang)
+
+    def bnode(self, value):
+        """ Return the interned `BNode` for ``value``. """
+
+        return self.get('bnode', value)
+
+    @staticmethod
+    def __make_term(kind, value, datatype, lang):
+        if kind == 'uri':
+            return URIRef(value)
+        elif kind == 'literal':
+            if datatype is not None and not isinstance(datatype, URIRef):
+                datatype = URIRef(datatype)
+            return Literal(value, lang=lang, datatype=datatype)
+        elif kind == 'bnode':
+            return BNode(value)
+        raise ValueError("Unknown term kind: %s" % kind)
+
+# Shared by the conversion paths of all reader plugins.
+term_cache = TermCache()
+
+DEFAULT_NAME_CACHE_SIZE = 4096
+
+class NameCache(object):
+    """ Bounded table of translated attribute names and predicate URIs.
+
+    `attr2rdf` and `rdf2attr` are called for every attribute access on a
+    `Resource` and for every predicate of every loaded statement, but their
+    result only depends on the key and on the registered namespace prefixes.
+    The cache remembers the results and is emptied whenever the prefix
+    tables change (see `surf.namespace.generation`), or when it grows beyond
+    ``size`` entries. A ``size`` of 0 disables caching.
+
+    Callers read the `generation` once, before computing a value, and pass
+    it to both :meth:`get` and :meth:`put`: a value computed while a
+    `namespace` is registered is then filed under the older generation and
+    never returned afterwards.
+
+    """
+
+    def __init__(self, size=DEFAULT_NAME_CACHE_SIZE):
+        self.__max_size = size
+        # (generation, map) pair, replaced as a whole so that readers
+        # never see a map with the wrong generation.
+        self.__table = (generation(), {})
+
+    max_size = property(lambda self: self.__max_size)
+    """ Maximum number of entries held by the cache. """
+
+    def __len__(self):
+        return len(self.__table[1])
+
+    def clear(self):
+        """ Drop all cached entries. """
+
+        self.__table = (self.__table[0], {})
+
+    def get(self, key, current=None):
+        """ Return the value cached for ``key`` under the `generation`
+        ``current`` (the current one by default) or `None`. """
+
+        if current is None:
+            current = generation()
+        table_generation, table = self.__table
+        if table_generation != current:
+            return None
+        return table.get(key)
+
+    def put(self, key, value, current=None):
+        """ Remember ``value`` for ``key``, computed under the `generation`
+        ``current`` (the current one by default). """
+
+        if self.__max_size <= 0:
+            return
+
+        if current is None:
+            current = generation()
+        table_generation, table = self.__table
+        if current < table_generation:
+            # Computed before the latest change of the prefix tables.
+            return
+        if current > table_generation or len(table) >= self.__max_size:
+            # Replace rather than clear, concurrent readers keep a
+            # consistent view of the old table.
+            table = {}
+            self.__table = (current, table)
+        table[key] = value
+
+# Used by attr2rdf() and rdf2attr().
+attr2rdf_cache = NameCache()
+rdf2attr_cache = NameCache()
 
 def json_to_rdflib(obj):
     """Convert a json result entry to an rdfLib type."""
@@ -257,16 +529,13 @@ def json_to_rdflib(obj):
         raise ValueError("No type specified")
 
     if type == 'uri':
-        return URIRef(obj["value"])
+        return term_cache.uri(obj["value"])
     elif type == 'literal':
-        if "xml:lang" in obj:
-            return Literal(obj["value"], lang=obj['xml:lang'])
-        else:
-            return Literal(obj["value"])
+        return term_cache.literal(obj["value"], lang=obj.get('xml:lang'))
     elif type == 'typed-literal':
-        return Literal(obj["value"], datatype=URIRef(obj['datatype']))
+        return term_cache.literal(obj["value"], datatype=obj['datatype'])
     elif type == 'bnode':
-        return BNode(obj["value"])
+        return term_cache.bnode(obj["value"])
     else:
         return None
 